@@ -0,0 +1,330 @@
+"""
+Selective-repeat ARQ: an optional reliable channel over the packet protocol.
+
+Telemetry and motor commands stay fire-and-forget, while chosen message
+types (text and configuration by default) are delivered exactly once and in
+order, without stop-and-wait round trips:
+
+- Reliable messages travel as Type 8 packets with their own 16-bit sequence
+  space in the header's sequence field. Payload: [inner type][inner payload].
+- The sender keeps up to `window` messages in flight, each with its own
+  retransmit timer (adaptive RTO from measured round trips).
+- The receiver buffers out-of-order messages, delivers them in order, and
+  answers every reliable packet with a Type 9 ACK:
+      '>HI'  next expected sequence number (everything before it received),
+             bitmap of received sequence numbers next+1 .. next+32
+- As soon as the receiver sees a gap it sends a Type 10 NACK listing the
+  missing sequence numbers ('>H' each), so the sender retransmits them
+  without waiting for a timeout.
+- After max_retries the sender gives up on a message, but not on its
+  sequence number: it retransmits a 1-byte placeholder (inner type
+  SKIPPED_TYPE, no payload) until that is acknowledged, so the receiver
+  moves past the number instead of holding everything after it forever.
+
+Usage:
+    channel = ReliableChannel(send_frame)     # send_frame(type, seq, payload)
+    channel.send(protocol.TYPE_TEXT, b'config blob')   # reliable
+    channel.send(protocol.TYPE_SENSOR, payload)         # passed straight through
+
+    for packet in channel.handle(received_packet):      # on every packet
+        process_packet(packet)
+
+    channel.poll()                                       # regularly, for retransmits
+"""
+
+import collections
+import struct
+import threading
+import time
+
+import protocol
+
+ACK_STRUCT = struct.Struct('>HI')
+NACK_ENTRY_STRUCT = struct.Struct('>H')
+SACK_BITS = 32
+SEQUENCE_MODULO = 65536
+
+# Inner type of the placeholder sent for an abandoned message
+SKIPPED_TYPE = 0xFF
+SKIPPED_PAYLOAD = bytes([SKIPPED_TYPE])
+
+# The backoff exponent stops growing here; placeholders are retried without
+# limit, and 2 ** retries would overflow a float after ~1000 retries.
+MAX_BACKOFF_EXPONENT = 16
+
+DEFAULT_RELIABLE_TYPES = frozenset({protocol.TYPE_TEXT})
+
+
+def _distance(sequence: int, base: int) -> int:
+    """How far sequence is ahead of base, modulo 65536."""
+    return (sequence - base) % SEQUENCE_MODULO
+
+
+class ReliableSender:
+    def __init__(self, send_frame, window: int = 32, initial_rto: float = 1.0,
+                 min_rto: float = 0.1, max_rto: float = 5.0, max_retries: int = 10):
+        """
+        Args:
+            send_frame: Called as send_frame(packet_type, sequence_number, payload).
+            window: Maximum number of unacknowledged messages in flight
+                (at most SACK_BITS so every in-flight message fits in an ACK).
+            initial_rto: Retransmit timeout before any round trip is measured.
+            max_retries: Give up on a message after this many retransmissions;
+                from then on only the placeholder telling the receiver to
+                skip it is retransmitted.
+        """
+        self.send_frame = send_frame
+        self.window = min(window, SACK_BITS)
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.max_retries = max_retries
+        self.rto = initial_rto
+        self.srtt = None
+        self.rttvar = None
+
+        self.next_sequence = 0
+        self.base = 0                          # Oldest unacknowledged sequence number
+        self.in_flight = {}                    # seq -> [payload, sent_at, retries]
+        self.backlog = collections.deque()     # Waiting for room in the window
+        self.lock = threading.Lock()
+
+        # Statistics
+        self.sent = 0
+        self.retransmissions = 0
+        self.acknowledged = 0
+        self.failed = 0
+
+    def send(self, packet_type: int, payload) -> None:
+        """Queues a message for reliable delivery."""
+        with self.lock:
+            self.backlog.append(bytes([packet_type]) + bytes(payload))
+            self._fill_window(time.monotonic())
+
+    def pending(self) -> int:
+        """Messages not yet acknowledged (in flight or waiting for the window)."""
+        with self.lock:
+            return len(self.in_flight) + len(self.backlog)
+
+    def _fill_window(self, now: float) -> None:
+        while self.backlog and _distance(self.next_sequence, self.base) < self.window:
+            payload = self.backlog.popleft()
+            sequence = self.next_sequence
+            self.next_sequence = (sequence + 1) % SEQUENCE_MODULO
+            self.in_flight[sequence] = [payload, now, 0]
+            self.send_frame(protocol.TYPE_RELIABLE, sequence, payload)
+            self.sent += 1
+
+    def _acknowledge(self, sequence: int, now: float) -> None:
+        entry = self.in_flight.pop(sequence, None)
+        if entry is None:
+            return
+        self.acknowledged += 1
+        if entry[2] == 0:
+            # Karn's rule: only time messages that were never retransmitted.
+            self._update_rto(now - entry[1])
+
+    def _update_rto(self, sample: float) -> None:
+        if self.srtt is None:
+            self.srtt = sample
+            self.rttvar = sample / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - sample)
+            self.srtt = 0.875 * self.srtt + 0.125 * sample
+        self.rto = min(self.max_rto, max(self.min_rto, self.srtt + 4 * self.rttvar))
+
+    def _advance_base(self) -> None:
+        while self.base != self.next_sequence and self.base not in self.in_flight:
+            self.base = (self.base + 1) % SEQUENCE_MODULO
+
+    def on_ack(self, payload) -> None:
+        """Handles a Type 9 ACK payload."""
+        if len(payload) != ACK_STRUCT.size:
+            return
+        next_expected, bitmap = ACK_STRUCT.unpack(payload)
+        now = time.monotonic()
+        with self.lock:
+            # Cumulative part: everything in flight before next_expected.
+            for sequence in list(self.in_flight):
+                if 0 < _distance(next_expected, sequence) <= self.window:
+                    self._acknowledge(sequence, now)
+            # Selective part.
+            for bit in range(SACK_BITS):
+                if bitmap & (1 << bit):
+                    self._acknowledge((next_expected + 1 + bit) % SEQUENCE_MODULO, now)
+            self._advance_base()
+            self._fill_window(now)
+
+    def on_nack(self, payload) -> None:
+        """Handles a Type 10 NACK payload: retransmit the listed messages now."""
+        now = time.monotonic()
+        with self.lock:
+            for offset in range(0, len(payload) - 1, NACK_ENTRY_STRUCT.size):
+                sequence, = NACK_ENTRY_STRUCT.unpack_from(payload, offset)
+                if sequence in self.in_flight:
+                    self._retransmit(sequence, now)
+
+    def _retransmit(self, sequence: int, now: float) -> None:
+        entry = self.in_flight[sequence]
+        if entry[2] >= self.max_retries and entry[0] != SKIPPED_PAYLOAD:
+            # The receiver delivers in order, so dropping the entry would
+            # stall it; the placeholder stays in flight until it is ACKed.
+            entry[0] = SKIPPED_PAYLOAD
+            self.failed += 1
+        entry[1] = now
+        entry[2] += 1
+        self.retransmissions += 1
+        self.send_frame(protocol.TYPE_RELIABLE, sequence, entry[0])
+
+    def poll(self) -> None:
+        """Retransmits every message whose timer has expired."""
+        now = time.monotonic()
+        with self.lock:
+            for sequence, entry in list(self.in_flight.items()):
+                # Back off exponentially with each retry of the same message,
+                # but never wait longer than max_rto.
+                backoff = 2 ** min(entry[2], MAX_BACKOFF_EXPONENT)
+                if now - entry[1] >= min(self.max_rto, self.rto * backoff):
+                    self._retransmit(sequence, now)
+            self._advance_base()
+            self._fill_window(now)
+
+
+class ReliableReceiver:
+    def __init__(self, send_frame, window: int = 32):
+        """
+        Args:
+            send_frame: Called as send_frame(packet_type, sequence_number,
+                payload) to send ACKs and NACKs back.
+            window: How far ahead of the next expected message to buffer.
+        """
+        self.send_frame = send_frame
+        self.window = min(window, SACK_BITS + 1)
+        self.next_expected = 0
+        self.buffered = {}                  # seq -> (type, payload), out of order
+        self.nacked = set()                 # Missing seqs already NACKed
+
+        # Statistics
+        self.delivered = 0
+        self.duplicates = 0
+        self.out_of_order = 0
+        self.skipped = 0                    # Messages the sender gave up on
+
+    def on_packet(self, packet: dict) -> list:
+        """
+        Handles a Type 8 packet.
+
+        Returns:
+            The list of messages that are now deliverable in order, as packet
+            dictionaries ('type', 'seq', 'payload') with the inner type.
+        """
+        sequence = packet['seq']
+        payload = packet['payload']
+        if len(payload) < 1:
+            return []
+
+        distance = _distance(sequence, self.next_expected)
+        if distance >= self.window:
+            # Old (already delivered) or too far ahead: just re-ACK.
+            self.duplicates += 1
+            self._send_ack()
+            return []
+
+        if sequence in self.buffered:
+            self.duplicates += 1
+        else:
+            # Copy: the payload may be a view into the decoder's buffer.
+            self.buffered[sequence] = (payload[0], bytes(payload[1:]))
+            if distance:
+                self.out_of_order += 1
+
+        deliverable = []
+        while self.next_expected in self.buffered:
+            inner_type, inner_payload = self.buffered.pop(self.next_expected)
+            if inner_type == SKIPPED_TYPE:
+                self.skipped += 1
+            else:
+                deliverable.append({
+                    'type': inner_type,
+                    'seq': self.next_expected,
+                    'payload': inner_payload
+                })
+            self.nacked.discard(self.next_expected)
+            self.next_expected = (self.next_expected + 1) % SEQUENCE_MODULO
+        self.delivered += len(deliverable)
+
+        self._send_ack()
+        if self.buffered:
+            self._send_nack()
+        return deliverable
+
+    def _send_ack(self) -> None:
+        bitmap = 0
+        for sequence in self.buffered:
+            bit = _distance(sequence, self.next_expected) - 1
+            if 0 <= bit < SACK_BITS:
+                bitmap |= 1 << bit
+        self.send_frame(protocol.TYPE_ACK, self.next_expected,
+                        ACK_STRUCT.pack(self.next_expected, bitmap))
+
+    def _send_nack(self) -> None:
+        """NACKs each missing message once, as soon as a later one shows up."""
+        highest = max(_distance(sequence, self.next_expected) for sequence in self.buffered)
+        missing = []
+        for offset in range(highest):
+            sequence = (self.next_expected + offset) % SEQUENCE_MODULO
+            if sequence not in self.buffered and sequence not in self.nacked:
+                missing.append(sequence)
+                self.nacked.add(sequence)
+        if missing:
+            payload = b''.join(NACK_ENTRY_STRUCT.pack(sequence) for sequence in missing)
+            self.send_frame(protocol.TYPE_NACK, missing[0], payload)
+
+
+class ReliableChannel:
+    """
+    Routes outgoing messages by type (reliable or fire-and-forget) and
+    incoming packets to the ARQ sender/receiver.
+    """
+
+    def __init__(self, send_frame, reliable_types=DEFAULT_RELIABLE_TYPES, window: int = 32):
+        """
+        Args:
+            send_frame: Called as send_frame(packet_type, sequence_number,
+                payload) to transmit one frame.
+            reliable_types: Packet types that get guaranteed delivery.
+        """
+        self.send_frame = send_frame
+        self.reliable_types = set(reliable_types)
+        self.sender = ReliableSender(send_frame, window=window)
+        self.receiver = ReliableReceiver(send_frame, window=window)
+        self.sequence_number = 0            # For fire-and-forget messages
+
+    def send(self, packet_type: int, payload) -> None:
+        if packet_type in self.reliable_types:
+            self.sender.send(packet_type, payload)
+        else:
+            self.send_frame(packet_type, self.sequence_number, payload)
+            self.sequence_number = (self.sequence_number + 1) % SEQUENCE_MODULO
+
+    def handle(self, packet: dict) -> list:
+        """
+        Processes a received packet.
+
+        Returns:
+            The packets to hand to the application: in-order reliable
+            messages, or the packet itself if it is not part of the ARQ.
+        """
+        packet_type = packet['type']
+        if packet_type == protocol.TYPE_RELIABLE:
+            return self.receiver.on_packet(packet)
+        if packet_type == protocol.TYPE_ACK:
+            self.sender.on_ack(packet['payload'])
+            return []
+        if packet_type == protocol.TYPE_NACK:
+            self.sender.on_nack(packet['payload'])
+            return []
+        return [packet]
+
+    def poll(self) -> None:
+        """Runs the retransmit timers; call every few tens of milliseconds."""
+        self.sender.poll()
@@ -0,0 +1,226 @@
+"""
+asyncio transport for the packet protocol.
+
+Lets a single event loop serve the radio link, the Arduino link and timers
+without daemon threads and queue hand-offs:
+
+    PacketReader      - async packet stream on top of an asyncio.StreamReader
+    PacketWriter      - async sender with backpressure (awaits drain())
+    PacketProtocol    - asyncio.Protocol that decodes packets as bytes arrive
+    AsyncDispatcher   - routes packets to plain or async handlers by type
+
+Usage:
+    reader, writer = await open_serial_connection('/dev/ttyUSB0', 57600)
+
+    dispatcher = AsyncDispatcher()
+
+    @dispatcher.handler(protocol.TYPE_MOTOR)
+    async def on_motor(packet):
+        left, right = protocol.MOTOR_STRUCT.unpack(packet['payload'])
+
+    await writer.send(protocol.TYPE_PING, b'')
+    await dispatcher.run(reader)
+
+For local testing any stream pair works, e.g. a socketpair:
+    a, b = socket.socketpair()
+    reader, writer = await open_socket_connection(a)
+"""
+
+import asyncio
+import inspect
+import os
+
+import protocol
+
+
+class PacketReader:
+    """Reads decoded packets from an asyncio.StreamReader."""
+
+    def __init__(self, stream_reader: asyncio.StreamReader, read_size: int = 4096):
+        self.stream_reader = stream_reader
+        self.read_size = read_size
+        self.decoder = protocol.StreamDecoder()
+
+    async def read_packet(self):
+        """
+        Waits for the next valid packet.
+
+        Returns:
+            A packet dictionary ('type', 'seq', 'payload'), or None once the
+            stream is closed. The payload view is valid until the next call.
+        """
+        while True:
+            packet = self.decoder.next_packet()
+            if packet is not None:
+                return packet
+            data = await self.stream_reader.read(self.read_size)
+            if not data:
+                return None
+            self.decoder.feed(data)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        packet = await self.read_packet()
+        if packet is None:
+            raise StopAsyncIteration
+        return packet
+
+
+class PacketWriter:
+    """
+    Packs and sends packets on an asyncio.StreamWriter.
+
+    send() waits for the transport's buffer to drain below its high-water
+    mark, so a producer that outpaces the radio is slowed down instead of
+    piling up seconds of queued data.
+    """
+
+    def __init__(self, stream_writer: asyncio.StreamWriter, high_water: int = 1024):
+        self.stream_writer = stream_writer
+        self.sequence_number = 0
+        self._closers = []
+        stream_writer.transport.set_write_buffer_limits(high=high_water)
+
+    def write(self, packet_type: int, payload) -> int:
+        """
+        Queues a packet without waiting for backpressure.
+
+        Returns:
+            The sequence number used, or None if the payload is too large.
+        """
+        packet = protocol.pack(packet_type, self.sequence_number, payload)
+        if packet is None:
+            return None
+        self.stream_writer.write(packet)
+        sequence = self.sequence_number
+        self.sequence_number = (self.sequence_number + 1) % 65536
+        return sequence
+
+    async def send(self, packet_type: int, payload) -> int:
+        """Queues a packet and waits until the transport can take more."""
+        sequence = self.write(packet_type, payload)
+        await self.stream_writer.drain()
+        return sequence
+
+    async def close(self) -> None:
+        self.stream_writer.close()
+        try:
+            await self.stream_writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+        for closer in self._closers:
+            closer()
+        self._closers.clear()
+
+
+class PacketProtocol(asyncio.Protocol):
+    """
+    asyncio.Protocol that decodes packets directly in data_received() and
+    calls on_packet(packet) for each one. Payload views are only valid during
+    the callback.
+
+    Usage:
+        transport, proto = await loop.create_connection(
+            lambda: PacketProtocol(on_packet), sock=sock)
+    """
+
+    def __init__(self, on_packet, on_connection_lost=None):
+        self.on_packet = on_packet
+        self.on_connection_lost = on_connection_lost
+        self.decoder = protocol.StreamDecoder()
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.decoder.feed(data)
+        for packet in self.decoder:
+            self.on_packet(packet)
+
+    def connection_lost(self, exc):
+        if self.on_connection_lost is not None:
+            self.on_connection_lost(exc)
+
+
+class AsyncDispatcher:
+    """Routes packets to handlers by packet type. Handlers may be plain functions or coroutines."""
+
+    def __init__(self):
+        self.handlers = {}
+        self.default_handler = None
+
+    def register(self, packet_type: int, handler) -> None:
+        self.handlers[packet_type] = handler
+
+    def handler(self, packet_type: int):
+        """Decorator form of register()."""
+        def decorator(func):
+            self.register(packet_type, func)
+            return func
+        return decorator
+
+    async def dispatch(self, packet) -> None:
+        handler = self.handlers.get(packet['type'], self.default_handler)
+        if handler is None:
+            return
+        result = handler(packet)
+        if inspect.isawaitable(result):
+            await result
+
+    async def run(self, reader: PacketReader) -> None:
+        """Dispatches every packet from reader until the stream closes."""
+        async for packet in reader:
+            await self.dispatch(packet)
+
+
+async def open_socket_connection(sock, high_water: int = 1024):
+    """Wraps a connected socket (e.g. one end of socket.socketpair()) as (PacketReader, PacketWriter)."""
+    stream_reader, stream_writer = await asyncio.open_connection(sock=sock)
+    return PacketReader(stream_reader), PacketWriter(stream_writer, high_water)
+
+
+async def open_serial_connection(port: str, baud_rate: int = 57600, high_water: int = 1024):
+    """
+    Opens a serial port (or pty) for use with asyncio.
+
+    On POSIX the port is configured with pyserial and its file descriptor is
+    handed to the event loop directly. Elsewhere pyserial-asyncio is used if
+    it is installed.
+
+    Returns:
+        A (PacketReader, PacketWriter) pair.
+    """
+    import serial
+
+    loop = asyncio.get_running_loop()
+
+    if os.name != 'posix':
+        try:
+            import serial_asyncio
+        except ImportError:
+            raise RuntimeError("open_serial_connection needs pyserial-asyncio on this platform")
+        stream_reader, stream_writer = await serial_asyncio.open_serial_connection(
+            url=port, baudrate=baud_rate)
+        return PacketReader(stream_reader), PacketWriter(stream_writer, high_water)
+
+    # pyserial sets up baud rate and raw mode; the loop then owns the fd.
+    ser = serial.Serial(port, baud_rate, timeout=0)
+    read_pipe = os.fdopen(os.dup(ser.fileno()), 'rb', buffering=0)
+    write_pipe = os.fdopen(os.dup(ser.fileno()), 'wb', buffering=0)
+
+    stream_reader = asyncio.StreamReader()
+    read_transport, _ = await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(stream_reader), read_pipe)
+    # The write side needs its own protocol for flow control; it is given a
+    # reader of its own that is never read from.
+    write_transport, write_protocol = await loop.connect_write_pipe(
+        lambda: asyncio.StreamReaderProtocol(asyncio.StreamReader()), write_pipe)
+    stream_writer = asyncio.StreamWriter(write_transport, write_protocol, stream_reader, loop)
+
+    writer = PacketWriter(stream_writer, high_water)
+    writer._closers.append(read_transport.close)
+    writer._closers.append(ser.close)
+    return PacketReader(stream_reader), writer
@@ -0,0 +1,124 @@
+"""
+CRC-16/Kermit Benchmark
+Compares the old crcmod path (mkCrcFun on a fresh header + payload
+concatenation) with the crc16 module: table lookup over memoryview slices,
+incremental updates and batch verification.
+
+Usage:
+    python benchmarks/crc_benchmark.py [--packets N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+# Add the repository root to the path to import protocol and crc16
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import crc16
+import protocol
+
+try:
+    import crcmod.predefined
+except ImportError:
+    crcmod = None
+
+
+def make_packets(count, max_payload=255, seed=1):
+    """Builds a list of random packets with payloads of 0 to max_payload bytes."""
+    rng = random.Random(seed)
+    packets = []
+    for seq in range(count):
+        payload = bytes(rng.randrange(256) for _ in range(rng.randrange(max_payload + 1)))
+        packets.append(protocol.pack(rng.randrange(4), seq % 65536, payload))
+    return packets
+
+
+def report(name, seconds, count, baseline=None):
+    """Prints one result line: per-packet time and speedup over the baseline."""
+    per_packet_us = seconds / count * 1e6
+    line = f"  {name:<42} {per_packet_us:9.2f} us/packet"
+    if baseline is not None:
+        line += f"   x{baseline / seconds:.2f}"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--packets', type=int, default=2000, help="packets per run")
+    parser.add_argument('--repeat', type=int, default=5, help="runs per measurement (best is kept)")
+    args = parser.parse_args()
+
+    packets = make_packets(args.packets)
+    count = len(packets)
+    header_end = protocol.SOF_SIZE + protocol.HEADER_SIZE
+    sof = protocol.SOF_SIZE
+
+    def best(func):
+        return min(timeit.repeat(func, number=1, repeat=args.repeat))
+
+    print("=" * 70)
+    print(f"CRC-16/Kermit benchmark: {count} packets, 0-255 byte payloads")
+    print(f"crcmod installed: {crcmod is not None}, "
+          f"numpy installed: {crc16.np is not None}")
+    print("=" * 70)
+
+    baseline = None
+    if crcmod is not None:
+        crcmod_func = crcmod.predefined.mkCrcFun('kermit')
+
+        def old_path():
+            # What protocol.unpack used to do: slice header and payload out
+            # and concatenate them before checksumming.
+            for packet in packets:
+                header = packet[sof:header_end]
+                payload = packet[header_end:-2]
+                crcmod_func(header + payload)
+
+        baseline = best(old_path)
+        report("crcmod on header + payload (old path)", baseline, count)
+
+        def crcmod_view():
+            for packet in packets:
+                with memoryview(packet) as view:
+                    crcmod_func(view[sof:-2])
+
+        report("crcmod on memoryview slice", best(crcmod_view), count, baseline)
+
+    def table_view():
+        for packet in packets:
+            with memoryview(packet) as view:
+                crc16.crc16_table(view[sof:-2])
+
+    report("crc16_table on memoryview slice", best(table_view), count, baseline)
+
+    def incremental():
+        for packet in packets:
+            with memoryview(packet) as view:
+                crc = crc16.Crc16(view[sof:header_end])
+                crc.update(view[header_end:-2])
+
+    report("Crc16 incremental (header, then payload)", best(incremental), count, baseline)
+
+    report("verify_many (loop)",
+           best(lambda: crc16.verify_many(packets, start=sof, use_numpy=False)), count, baseline)
+
+    if crc16.np is not None:
+        report("verify_many (numpy)",
+               best(lambda: crc16.verify_many(packets, start=sof, use_numpy=True)), count, baseline)
+
+    # Sanity check: every implementation agrees.
+    for packet in packets[:100]:
+        data = packet[sof:-2]
+        expected = crc16.crc16_table(data)
+        assert crc16.crc16(data) == expected
+        assert crc16.Crc16(data[:3]).update(data[3:]).value == expected
+    assert all(crc16.verify_many(packets, start=sof))
+    if crc16.np is not None:
+        assert all(crc16.verify_many(packets, start=sof, use_numpy=True))
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
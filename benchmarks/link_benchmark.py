@@ -0,0 +1,115 @@
+"""
+End-to-End Link Benchmark
+Throughput and latency of the protocol over the emulated RFD-900x link
+(link_emulator.py), for a clean link and several error conditions. No
+radios needed, so it can run in CI.
+
+Every packet is written as soon as the serial port accepts it (the
+emulated port blocks like a real one), so the figures show the link's
+capacity and the queueing latency at that load.
+
+Usage:
+    python benchmarks/link_benchmark.py [--packets N] [--payload BYTES] [--seed N]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+# Add the repository root to the path to import protocol and link_emulator
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import protocol
+from link_emulator import LinkEmulator
+from serial_reader import SerialReader
+
+CONDITIONS = [
+    ("clean", {}),
+    ("BER 1e-5", {'bit_error_rate': 1e-5}),
+    ("BER 1e-4", {'bit_error_rate': 1e-4}),
+    ("1% air packets dropped", {'drop_rate': 0.01}),
+    ("bursts (1e-3/byte, 8 bytes)", {'burst_rate': 1e-3, 'burst_length': 8}),
+]
+
+
+def run(packets, payload_size, seed, options):
+    """Sends packets over a fresh emulated link; returns the result dict."""
+    emulator = LinkEmulator(seed=seed, **options)
+    emulator.start()
+    received = {}
+    done = threading.Event()
+
+    def receive():
+        reader = SerialReader(emulator.rover, poll_interval=0.05)
+        decoder = protocol.StreamDecoder()
+        while not done.is_set():
+            data = reader.read()
+            if not data:
+                continue
+            now = time.perf_counter()
+            decoder.feed(data)
+            for packet in decoder:
+                received[packet['seq']] = now
+
+    thread = threading.Thread(target=receive, daemon=True)
+    thread.start()
+
+    payload = bytes(payload_size)
+    sent = {}
+    start = time.perf_counter()
+    for seq in range(packets):
+        sent[seq] = time.perf_counter()
+        emulator.laptop.write(protocol.pack(protocol.TYPE_TEXT, seq, payload))
+
+    # Wait for the link to drain: no new packet for a while
+    last_count = -1
+    while len(received) != last_count and len(received) < packets:
+        last_count = len(received)
+        time.sleep(0.5)
+    done.set()
+    thread.join()
+    emulator.stop()
+
+    if not received:
+        return {'delivered': 0.0, 'goodput': 0.0, 'latencies': [0.0]}
+    elapsed = max(received.values()) - start
+    latencies = sorted(received[seq] - sent[seq] for seq in received)
+    return {
+        'delivered': len(received) / packets,
+        'goodput': len(received) * payload_size / elapsed,
+        'latencies': latencies,
+        'stats': emulator.uplink.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--packets', type=int, default=200, help="packets per condition")
+    parser.add_argument('--payload', type=int, default=64, help="payload bytes per packet")
+    parser.add_argument('--seed', type=int, default=1, help="random seed for errors and drops")
+    args = parser.parse_args()
+
+    frame = args.payload + protocol.MIN_PACKET_SIZE
+    print("=" * 90)
+    print(f"End-to-end over the emulated link: {args.packets} packets of {args.payload} bytes "
+          f"({frame}-byte frames)")
+    print(f"Serial limit: {57600 / 10 * args.payload / frame:.0f} B/s of payload")
+    print("=" * 90)
+    print(f"{'condition':<30}{'delivered':>10}{'goodput':>12}{'latency p50':>14}"
+          f"{'p95':>10}{'max':>10}")
+    print(f"{'':<30}{'':>10}{'B/s':>12}{'ms':>14}{'ms':>10}{'ms':>10}")
+    print("-" * 90)
+    for name, options in CONDITIONS:
+        result = run(args.packets, args.payload, args.seed, options)
+        latencies = result['latencies']
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"{name:<30}{result['delivered'] * 100:9.1f}%{result['goodput']:12.0f}"
+              f"{statistics.median(latencies) * 1000:14.1f}{p95 * 1000:10.1f}"
+              f"{latencies[-1] * 1000:10.1f}")
+    print("=" * 90)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+Protocol Benchmark Suite
+Repeatable timings for protocol.py, to compare every change against the
+current code:
+- pack / pack_into / unpack / stream decoding across payload sizes 0-255
+- stream parsing with garbage interleaved between frames
+- delivery and parse time under 0.1% to 5% random byte corruption
+- allocations per packet (blocks kept alive per call, peak bytes per call)
+
+Results can be saved as a baseline (JSON) and later runs are compared
+against it: a timing that got slower by more than --threshold, an
+allocation count that went up or a delivery rate that went down is
+flagged as a regression, and the exit status is 1.
+
+Usage:
+    python benchmarks/protocol_benchmark.py --save          # record the baseline
+    python benchmarks/protocol_benchmark.py                 # compare against it
+    python benchmarks/protocol_benchmark.py --quick --baseline other.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import timeit
+import tracemalloc
+
+# Add the repository root to the path to import protocol
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import protocol
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'protocol_baseline.json')
+
+PAYLOAD_SIZES = [0, 1, 16, 64, 128, 192, 255]
+GARBAGE_RATIOS = [0.0, 0.1, 0.5, 1.0]           # Garbage bytes per frame byte
+CORRUPTION_RATES = [0.001, 0.005, 0.01, 0.02, 0.05]
+ALLOCATION_PAYLOAD = 64
+STREAM_PACKETS = 1000       # Packets per garbage/corruption stream (fixed, so rates compare)
+
+# How each kind of result is compared with the baseline
+TIME = 'time'           # Lower is better, relative threshold
+COUNT = 'count'         # Lower is better, small absolute tolerance
+RATE = 'rate'           # Higher is better, small absolute tolerance
+COUNT_TOLERANCE = 0.05
+RATE_TOLERANCE = 0.001
+
+
+def random_payload(rng, size):
+    return bytes(rng.randrange(256) for _ in range(size))
+
+
+def make_frames(rng, count):
+    """Returns (frames, payloads) with random payloads of 0-255 bytes."""
+    payloads = [random_payload(rng, rng.randrange(256)) for _ in range(count)]
+    frames = [protocol.pack(rng.randrange(4), seq % 65536, payload)
+              for seq, payload in enumerate(payloads)]
+    return frames, payloads
+
+
+def chunked(stream, rng, max_chunk=64):
+    """Splits a stream into reads of 1 to max_chunk bytes, like SerialReader."""
+    chunks = []
+    pos = 0
+    while pos < len(stream):
+        size = rng.randrange(1, max_chunk + 1)
+        chunks.append(stream[pos:pos + size])
+        pos += size
+    return chunks
+
+
+def decode_chunks(chunks):
+    """Feeds chunks through a StreamDecoder; returns (decoder, packets received)."""
+    decoder = protocol.StreamDecoder()
+    received = 0
+    for chunk in chunks:
+        decoder.feed(chunk)
+        for _ in decoder:
+            received += 1
+    return decoder, received
+
+
+class Suite:
+    def __init__(self, repeat, scale):
+        self.repeat = repeat
+        self.scale = scale
+        self.results = {}          # name -> {'section', 'value', 'unit', 'kind'}
+        self.section = None
+
+    def best(self, func):
+        return min(timeit.repeat(func, number=1, repeat=self.repeat))
+
+    def record(self, name, value, unit, kind):
+        self.results[name] = {'section': self.section, 'value': value, 'unit': unit, 'kind': kind}
+
+    def run_sizes(self):
+        self.section = 'sizes'
+        calls = max(1, 2000 // self.scale)
+        rng = random.Random(1)
+        buffer = bytearray(protocol.MAX_PACKET_SIZE)
+        for size in PAYLOAD_SIZES:
+            payload = random_payload(rng, size)
+            frame = protocol.pack(protocol.TYPE_TEXT, 1, payload)
+            stream = frame * calls
+            chunks = chunked(stream, rng)
+
+            def pack():
+                for _ in range(calls):
+                    protocol.pack(protocol.TYPE_TEXT, 1, payload)
+
+            def pack_into():
+                for _ in range(calls):
+                    protocol.pack_into(buffer, 0, protocol.TYPE_TEXT, 1, payload)
+
+            def unpack():
+                for _ in range(calls):
+                    protocol.unpack(frame)
+
+            self.record(f"pack/{size}", self.best(pack) / calls * 1e6, 'us', TIME)
+            self.record(f"pack_into/{size}", self.best(pack_into) / calls * 1e6, 'us', TIME)
+            self.record(f"unpack/{size}", self.best(unpack) / calls * 1e6, 'us', TIME)
+            self.record(f"stream_decode/{size}",
+                        self.best(lambda: decode_chunks(chunks)) / calls * 1e6, 'us', TIME)
+
+    def run_garbage(self):
+        self.section = 'garbage'
+        count = STREAM_PACKETS
+        for ratio in GARBAGE_RATIOS:
+            rng = random.Random(2)
+            frames, _ = make_frames(rng, count)
+            stream = bytearray()
+            for frame in frames:
+                stream += frame
+                garbage = bytearray(random_payload(rng, int(len(frame) * ratio * rng.uniform(0.5, 1.5))))
+                if garbage and rng.random() < 0.2:
+                    # A false start of frame in the noise makes the decoder resync
+                    garbage[:2] = protocol.START_OF_FRAME
+                stream += garbage
+            chunks = chunked(bytes(stream), rng)
+
+            _, received = decode_chunks(chunks)
+            self.record(f"garbage/{ratio:g}/us_per_packet",
+                        self.best(lambda: decode_chunks(chunks)) / count * 1e6, 'us', TIME)
+            self.record(f"garbage/{ratio:g}/delivered", received / count, 'fraction', RATE)
+
+    def run_corruption(self):
+        self.section = 'corruption'
+        count = STREAM_PACKETS
+        for rate in CORRUPTION_RATES:
+            rng = random.Random(3)
+            frames, payloads = make_frames(rng, count)
+            stream = bytearray(b''.join(frames))
+            for index in range(len(stream)):
+                if rng.random() < rate:
+                    stream[index] = rng.randrange(256)
+            chunks = chunked(bytes(stream), rng)
+
+            delivered = false_accepts = 0
+            decoder = protocol.StreamDecoder()
+            for chunk in chunks:
+                decoder.feed(chunk)
+                for packet in decoder:
+                    if bytes(packet['payload']) == payloads[packet['seq'] % count]:
+                        delivered += 1
+                    else:
+                        false_accepts += 1      # Corrupted frame that passed the CRC
+
+            self.record(f"corruption/{rate:g}/us_per_packet",
+                        self.best(lambda: decode_chunks(chunks)) / count * 1e6, 'us', TIME)
+            self.record(f"corruption/{rate:g}/delivered", delivered / count, 'fraction', RATE)
+            self.record(f"corruption/{rate:g}/false_accepts", false_accepts, 'packets', COUNT)
+
+    def run_allocations(self):
+        self.section = 'alloc'
+        calls = max(10, 1000 // self.scale)
+        rng = random.Random(4)
+        payload = random_payload(rng, ALLOCATION_PAYLOAD)
+        frame = protocol.pack(protocol.TYPE_TEXT, 1, payload)
+        buffer = bytearray(protocol.MAX_PACKET_SIZE)
+        decoder = protocol.StreamDecoder()
+
+        def stream_decode():
+            decoder.feed(frame)
+            return decoder.next_packet()
+
+        cases = {
+            'pack': lambda: protocol.pack(protocol.TYPE_TEXT, 1, payload),
+            'pack_into': lambda: protocol.pack_into(buffer, 0, protocol.TYPE_TEXT, 1, payload),
+            'unpack': lambda: protocol.unpack(frame),
+            'iter_packets': lambda: list(protocol.iter_packets(frame)),
+            'stream_decode': stream_decode,
+        }
+        for name, func in cases.items():
+            blocks, peak = measure_allocations(func, calls)
+            self.record(f"alloc/{name}/blocks", blocks, 'blocks/call', COUNT)
+            self.record(f"alloc/{name}/peak_bytes", peak, 'bytes/call', COUNT)
+
+
+def measure_allocations(func, calls):
+    """
+    Returns (memory blocks still allocated per call with every result kept
+    alive, peak traced bytes during one call).
+    """
+    results = [None] * calls
+    func()
+    gc.collect()
+    gc.disable()
+    try:
+        before = sys.getallocatedblocks()
+        for index in range(calls):
+            results[index] = func()
+        blocks = (sys.getallocatedblocks() - before) / calls
+    finally:
+        gc.enable()
+    del results
+
+    tracemalloc.start()
+    try:
+        func()
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return blocks, max(0, peak - current)
+
+
+def compare(result, base, threshold):
+    """Returns (change text, regressed) for one result against its baseline."""
+    value, old = result['value'], base['value']
+    kind = result['kind']
+    if kind == TIME:
+        change = (value - old) / old if old else 0.0
+        return f"{change * 100:+7.1f}%", change > threshold
+    if kind == COUNT:
+        return f"{value - old:+8.2f}", value > old + COUNT_TOLERANCE
+    return f"{value - old:+8.3f}", value < old - RATE_TOLERANCE
+
+
+def print_results(results, baseline, threshold):
+    """Prints every result, compared with the baseline; returns the regressions."""
+    regressions = []
+    section = None
+    print(f"{'benchmark':<36}{'value':>12}  {'unit':<12}{'vs baseline':>12}")
+    for name, result in results.items():
+        if result['section'] != section:
+            section = result['section']
+            print("-" * 80)
+        line = f"{name:<36}{result['value']:12.3f}  {result['unit']:<12}"
+        base = baseline.get(name)
+        if base is not None:
+            change, regressed = compare(result, base, threshold)
+            line += f"{change:>12}"
+            if regressed:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="baseline JSON file")
+    parser.add_argument('--save', action='store_true', help="save this run as the baseline")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="relative slowdown flagged as a regression (default 0.10)")
+    parser.add_argument('--repeat', type=int, default=5, help="runs per measurement (best is kept)")
+    parser.add_argument('--quick', action='store_true',
+                        help="fewer timing iterations, for a smoke test (timings are noisier)")
+    parser.add_argument('--only', choices=['sizes', 'garbage', 'corruption', 'alloc'],
+                        help="run one section only")
+    args = parser.parse_args()
+
+    suite = Suite(1 if args.quick else args.repeat, 10 if args.quick else 1)
+    sections = {
+        'sizes': suite.run_sizes,
+        'garbage': suite.run_garbage,
+        'corruption': suite.run_corruption,
+        'alloc': suite.run_allocations,
+    }
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+    print("=" * 80)
+    print(f"protocol.py benchmark suite, Python {platform.python_version()} on {platform.machine()}")
+    print(f"Baseline: {args.baseline if baseline else 'none'}")
+    print("=" * 80)
+
+    for name, run in sections.items():
+        if args.only in (None, name):
+            run()
+
+    regressions = print_results(suite.results, baseline, args.threshold)
+    print("=" * 80)
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                       'results': suite.results}, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    elif baseline:
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+        print("No regressions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Raw serial stream capture and replay.
+
+CaptureWriter records every chunk of bytes read from the modem together
+with a monotonic timestamp, so a field problem can be reproduced exactly:
+garbage, split frames and timing included. CaptureReader memory-maps a
+capture and hands the chunks out as views into the file, and replay()
+feeds them to a callback (a decoder or a whole receiver) in real time,
+accelerated, or as fast as possible to benchmark the parser and handlers
+on real traffic.
+
+File format (little-endian):
+    FILE_HEADER     magic, version, reserved, wall-clock time of the first chunk
+    CHUNK_HEADER    nanoseconds since the first chunk, length
+    <length bytes>  ... repeated for every chunk
+
+Usage:
+    capture = CaptureWriter('rover.cap')
+    capture.write(reader.read())                # in the receive loop
+    capture.close()
+
+    replay('rover.cap', decoder.feed, speed=None)   # as fast as possible
+
+    python capture.py rover.cap                          # summary
+    python capture.py rover.cap --replay receiver --speed 10
+"""
+
+import argparse
+import mmap
+import struct
+import time
+
+FILE_MAGIC = b'RCAP'
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct('<4sHHd')
+CHUNK_HEADER = struct.Struct('<QH')
+MAX_CHUNK_SIZE = 0xFFFF     # Longer reads are stored as several chunks
+
+
+class CaptureError(Exception):
+    """Raised for a file that is not a capture."""
+
+
+class CaptureWriter:
+    def __init__(self, path: str, flush_interval: float = 1.0):
+        """
+        Args:
+            path: Capture file, overwritten.
+            flush_interval: Longest time (seconds) recorded bytes stay in
+                the file buffer, so little is lost if the process dies.
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self._file = open(path, 'wb')
+        self._start = None
+        self._last_flush = time.monotonic()
+
+        # Statistics
+        self.chunks = 0
+        self.bytes = 0
+
+    def write(self, data) -> None:
+        """Records a chunk of received bytes, timestamped now."""
+        if not data:
+            return
+        now = time.monotonic_ns()
+        if self._start is None:
+            self._start = now
+            self._file.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, 0, time.time()))
+        offset = now - self._start
+
+        view = memoryview(data)
+        for start in range(0, len(view), MAX_CHUNK_SIZE):
+            chunk = view[start:start + MAX_CHUNK_SIZE]
+            self._file.write(CHUNK_HEADER.pack(offset, len(chunk)))
+            self._file.write(chunk)
+            self.chunks += 1
+        self.bytes += len(view)
+
+        if now / 1e9 - self._last_flush >= self.flush_interval:
+            self._file.flush()
+            self._last_flush = now / 1e9
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+
+
+class CaptureReader:
+    def __init__(self, path: str):
+        """Memory-maps a capture file. Raises CaptureError if it is not one."""
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = None
+        self.start_time = None       # Wall-clock time of the first chunk
+
+        size = self._file.seek(0, 2)
+        if size == 0:
+            return                   # Nothing was ever received
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if size < FILE_HEADER.size:
+            raise CaptureError(f"{path}: truncated header")
+        magic, version, _, self.start_time = FILE_HEADER.unpack_from(self._map, 0)
+        if magic != FILE_MAGIC or version != FILE_VERSION:
+            raise CaptureError(f"{path} is not a version {FILE_VERSION} capture")
+
+    def chunks(self):
+        """
+        Yields (seconds since the first chunk, chunk) in order.
+
+        Each chunk is a memoryview into the mapped file and is released
+        once the next one is requested, or when the generator is closed;
+        copy it to keep it. Close the generator before the reader if the
+        loop over it may stop early.
+        """
+        if self._map is None:
+            return
+        view = memoryview(self._map)
+        try:
+            offset = FILE_HEADER.size
+            end = len(view)
+            while offset + CHUNK_HEADER.size <= end:
+                timestamp, length = CHUNK_HEADER.unpack_from(view, offset)
+                offset += CHUNK_HEADER.size
+                if offset + length > end:
+                    break            # Cut short when the capture was killed
+                chunk = view[offset:offset + length]
+                try:
+                    yield timestamp / 1e9, chunk
+                finally:
+                    chunk.release()
+                offset += length
+        finally:
+            view.release()
+
+    def summary(self) -> dict:
+        """Chunk count, byte count and duration of the capture."""
+        chunks = size = 0
+        duration = 0.0
+        for duration, chunk in self.chunks():
+            chunks += 1
+            size += len(chunk)
+        return {'chunks': chunks, 'bytes': size, 'duration': duration}
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+
+def replay(path: str, on_data, speed: float = 1.0) -> dict:
+    """
+    Feeds a capture to on_data(chunk), chunk by chunk.
+
+    Args:
+        speed: 1.0 reproduces the original timing, 10.0 plays ten times
+            faster, None (or 0) feeds everything as fast as possible.
+
+    Returns:
+        {'chunks', 'bytes', 'elapsed'} for the replay, elapsed in seconds.
+    """
+    reader = CaptureReader(path)
+    chunks = size = 0
+    started = time.perf_counter()
+    chunk_iterator = reader.chunks()
+    try:
+        for timestamp, chunk in chunk_iterator:
+            if speed:
+                delay = started + timestamp / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            on_data(chunk)
+            chunks += 1
+            size += len(chunk)
+    finally:
+        # Release the current chunk first: the map cannot close while it is exported
+        chunk_iterator.close()
+        reader.close()
+    return {'chunks': chunks, 'bytes': size, 'elapsed': time.perf_counter() - started}
+
+
+def _replay_target(name: str):
+    """Returns (on_data, report) for the --replay choices."""
+    import protocol
+
+    if name == 'decoder':
+        decoder = protocol.StreamDecoder()
+
+        def on_data(chunk):
+            decoder.feed(chunk)
+            for _ in decoder:
+                pass
+        return on_data, lambda: (f"{decoder.packet_count} packets, {decoder.error_count} CRC errors, "
+                                 f"{decoder.bytes_skipped} bytes skipped")
+
+    if name == 'controller':
+        from controller_codec import ControllerDeltaDecoder
+        decoder = protocol.StreamDecoder()
+        controller = ControllerDeltaDecoder()
+
+        def on_data(chunk):
+            decoder.feed(chunk)
+            for packet in decoder:
+                controller.decode(packet)
+        return on_data, lambda: (f"{controller.keyframes_received} keyframes, "
+                                 f"{controller.deltas_received} deltas, {controller.gaps} gaps")
+
+    # 'receiver': the full Jetson receiver with its handlers, no serial port
+    import packet_log
+    from jetson_protocol_receiver import ProtocolReceiver, LATEST_TYPES
+    receiver = ProtocolReceiver(None, log_level=packet_log.WARNING, latest_types=LATEST_TYPES)
+    return receiver.process_data, receiver.print_statistics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize or replay a raw serial capture.")
+    parser.add_argument('path', help="capture file written by CaptureWriter")
+    parser.add_argument('--replay', choices=['decoder', 'controller', 'receiver'],
+                        help="feed the capture through this pipeline")
+    parser.add_argument('--speed', type=float, default=0,
+                        help="1 = real time, 10 = ten times faster, 0 = as fast as possible")
+    args = parser.parse_args()
+
+    reader = CaptureReader(args.path)
+    summary = reader.summary()
+    reader.close()
+    print(f"{args.path}: {summary['chunks']} chunks, {summary['bytes']} bytes, "
+          f"{summary['duration']:.1f} s")
+    if not args.replay:
+        return
+
+    on_data, report = _replay_target(args.replay)
+    result = replay(args.path, on_data, speed=args.speed)
+    elapsed = max(result['elapsed'], 1e-9)
+    print(f"Replayed through {args.replay} in {result['elapsed']:.3f} s: "
+          f"{result['bytes'] / elapsed / 1e6:.2f} MB/s, {result['chunks'] / elapsed:.0f} chunks/s")
+    text = report()
+    if text:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Small-message coalescing: several logical messages in one radio frame.
+
+Every frame costs 8 bytes of SOF, header and CRC, which is half the airtime
+of an 8-byte motor command. The Coalescer collects messages for a short
+window (5 ms by default) or until the frame would exceed 255 bytes, then
+sends them as a single container packet (Type 7).
+
+Container payload (Type 7): a list of sub-records
+    [type (1 byte)][length (1 byte)][payload (length bytes)] ...
+
+The container's sequence number is the sequence number of its first record;
+the following records implicitly use the next consecutive numbers. The
+receiver therefore sees exactly the same (type, seq, payload) packets, and
+sequence gap detection keeps working. A window holding a single message is
+sent as a normal packet with no container overhead.
+
+Usage (sender):
+    coalescer = Coalescer(write_frame)      # write_frame(type, seq, payload)
+    coalescer.start()                       # background flush timer
+    coalescer.add(protocol.TYPE_MOTOR, seq, payload)
+
+Usage (receiver):
+    for packet in split_container(container_packet):
+        process_packet(packet)
+"""
+
+import threading
+import time
+
+import protocol
+
+RECORD_HEADER_SIZE = 2
+MAX_RECORD_PAYLOAD = protocol.MAX_PAYLOAD_SIZE - RECORD_HEADER_SIZE
+
+
+def split_container(packet: dict) -> list:
+    """
+    Splits a Type 7 container packet back into individual packets.
+
+    Returns:
+        A list of packet dictionaries ('type', 'seq', 'payload'). A truncated
+        trailing record is dropped.
+    """
+    payload = packet['payload']
+    sequence = packet['seq']
+    packets = []
+    position = 0
+    end = len(payload)
+    while position + RECORD_HEADER_SIZE <= end:
+        record_type = payload[position]
+        record_length = payload[position + 1]
+        record_start = position + RECORD_HEADER_SIZE
+        record_end = record_start + record_length
+        if record_end > end:
+            break
+        packets.append({
+            'type': record_type,
+            'seq': sequence,
+            'payload': payload[record_start:record_end]
+        })
+        sequence = (sequence + 1) % 65536
+        position = record_end
+    return packets
+
+
+class Coalescer:
+    def __init__(self, write_frame, window: float = 0.005, max_payload: int = protocol.MAX_PAYLOAD_SIZE):
+        """
+        Args:
+            write_frame: Called as write_frame(packet_type, sequence_number,
+                payload) to pack and transmit one frame.
+            window: Longest time (seconds) a message waits for company.
+            max_payload: Container payload limit (at most 255 bytes).
+        """
+        self.write_frame = write_frame
+        self.window = window
+        self.max_payload = min(max_payload, protocol.MAX_PAYLOAD_SIZE)
+
+        self.records = bytearray()
+        self.record_count = 0
+        self.first_type = None
+        self.first_sequence = None
+        self.next_sequence = None
+        self.deadline = None
+
+        self._condition = threading.Condition()
+        self._thread = None
+        self.running = False
+
+        # Statistics
+        self.messages_sent = 0
+        self.frames_sent = 0
+
+    def add(self, packet_type: int, sequence_number: int, payload) -> None:
+        """Queues one message; it is sent within window seconds."""
+        record_size = RECORD_HEADER_SIZE + len(payload)
+        with self._condition:
+            if self.record_count and (len(self.records) + record_size > self.max_payload
+                                      or sequence_number != self.next_sequence):
+                # Does not fit, or would break the consecutive sequence numbers.
+                self._flush_locked()
+
+            if len(payload) > MAX_RECORD_PAYLOAD:
+                # Too big to be a record; it goes out on its own.
+                self._flush_locked()
+                self.write_frame(packet_type, sequence_number, payload)
+                self.messages_sent += 1
+                self.frames_sent += 1
+                return
+
+            self.records.append(packet_type)
+            self.records.append(len(payload))
+            self.records += payload
+            self.record_count += 1
+            self.next_sequence = (sequence_number + 1) % 65536
+            if self.record_count == 1:
+                self.first_type = packet_type
+                self.first_sequence = sequence_number
+                self.deadline = time.monotonic() + self.window
+                self._condition.notify()
+
+            if self.window <= 0:
+                self._flush_locked()
+
+    def flush(self) -> None:
+        """Sends whatever is queued right now."""
+        with self._condition:
+            self._flush_locked()
+
+    def poll(self) -> None:
+        """Flushes if the window has expired. For callers that don't use start()."""
+        with self._condition:
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if not self.record_count:
+            return
+        if self.record_count == 1:
+            # No company arrived; send it as a plain packet.
+            self.write_frame(self.first_type, self.first_sequence, bytes(self.records[RECORD_HEADER_SIZE:]))
+        else:
+            self.write_frame(protocol.TYPE_CONTAINER, self.first_sequence, self.records)
+        self.messages_sent += self.record_count
+        self.frames_sent += 1
+
+        self.records.clear()
+        self.record_count = 0
+        self.deadline = None
+
+    def start(self) -> None:
+        """Starts a background thread that flushes each window when it expires."""
+        self.running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Flushes pending messages and stops the background thread."""
+        with self._condition:
+            self.running = False
+            self._flush_locked()
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        with self._condition:
+            while self.running:
+                if self.deadline is None:
+                    self._condition.wait()
+                    continue
+                remaining = self.deadline - time.monotonic()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                else:
+                    self._flush_locked()
@@ -0,0 +1,162 @@
+"""
+Optional payload compression with a pre-shared dictionary.
+
+Most of our payloads are far too short for plain zlib to win anything: the
+compressor needs to have seen a string before it can refer back to it. Both
+ends therefore share a preset dictionary (DICTIONARY) made from our own
+message corpus, so even a 20-byte text message can point into it.
+
+Raw deflate is used (no zlib header or Adler-32, the frame already has a
+CRC). A compressed payload is marked by protocol.COMPRESSED_FLAG in the type
+byte, and protocol.pack_compressed() only sets it when the result is
+actually smaller.
+
+The dictionary is part of the wire format: changing it requires updating
+both the laptop and the rover. To rebuild it from a new corpus:
+
+    python compression.py messages.txt     # one message per line
+"""
+
+import collections
+import sys
+import zlib
+
+LEVEL = 9
+WBITS = -15             # Raw deflate stream
+MAX_OUTPUT_SIZE = 255   # A decompressed payload still has to fit in one frame
+
+
+class CompressionError(Exception):
+    """Raised when a compressed payload cannot be decompressed."""
+
+
+# Typical messages, used to train DICTIONARY (see train_dictionary()).
+CORPUS = [
+    "Hello from Laptop!",
+    "Testing RFD-900x modem",
+    "Hello from Jetson!",
+    "Rover status: OK",
+    "Rover status: battery low",
+    "Battery voltage: 11.8 V",
+    "Motor controller connected",
+    "Motor controller disconnected",
+    "Arduino connected on /dev/ttyACM0",
+    "Controller connected",
+    "Controller disconnected",
+    "Emergency stop",
+    "Emergency stop released",
+    "Camera started",
+    "Camera stopped",
+    "GPS fix acquired",
+    "GPS fix lost",
+    "Temperature warning",
+    "Waypoint reached",
+    "Starting autonomous mode",
+    "Switching to manual control",
+    "Error: sensor timeout",
+    "Error: motor stall detected",
+    "Warning: signal strength low",
+    "config: max_speed=0.75",
+    "config: keyframe_interval=20",
+    '{"mode": "manual", "max_speed": 0.75, "battery": 12.1}',
+    '{"lat": 29.7174, "lon": -95.4018, "heading": 90.0}',
+]
+
+
+def train_dictionary(samples, size: int = 2048, min_length: int = 3, max_length: int = 24) -> bytes:
+    """
+    Builds a preset dictionary from sample payloads.
+
+    Substrings that occur in more than one sample are scored by the bytes
+    they would save (occurrences x length) and picked greedily, skipping
+    ones already covered by a better pick. zlib reaches the end of the
+    dictionary with the shortest distances, so the best strings go last.
+    """
+    counts = collections.Counter()
+    for sample in samples:
+        seen = set()
+        for length in range(min_length, max_length + 1):
+            for start in range(len(sample) - length + 1):
+                seen.add(sample[start:start + length])
+        counts.update(seen)       # Count each substring once per sample
+
+    candidates = sorted(
+        (substring for substring, count in counts.items() if count > 1),
+        key=lambda substring: (counts[substring] * len(substring), substring),
+        reverse=True)
+
+    chosen = []
+    total = 0
+    for substring in candidates:
+        if total + len(substring) > size:
+            continue
+        if any(substring in picked for picked in chosen):
+            continue
+        chosen.append(substring)
+        total += len(substring)
+    return b''.join(reversed(chosen))
+
+
+def corpus_samples() -> list:
+    """The built-in corpus as payload bytes."""
+    return [message.encode('utf-8') for message in CORPUS]
+
+
+# Generated with train_dictionary(corpus_samples()); do not edit by hand.
+DICTIONARY = (
+    b' ma re": , ": 1: m: sal int low0.75tart lo modet'
+    b'ing arninging manualmodeError: attery batteryGPS'
+    b' fix config: Camera statteryingmax_speedControll'
+    b'er Hello from Emergency stopRover status: Motor '
+    b'controller ontroller connectedontroller disconne'
+    b'ctedconnected'
+)
+
+
+def compress(payload, dictionary: bytes = DICTIONARY):
+    """
+    Compresses a payload.
+
+    Returns:
+        The compressed bytes, or None if compression would not make the
+        payload smaller.
+    """
+    compressor = zlib.compressobj(LEVEL, zlib.DEFLATED, WBITS, zdict=dictionary)
+    compressed = compressor.compress(payload) + compressor.flush()
+    if len(compressed) >= len(payload):
+        return None
+    return compressed
+
+
+def decompress(payload, dictionary: bytes = DICTIONARY, max_size: int = MAX_OUTPUT_SIZE) -> bytes:
+    """
+    Decompresses a payload produced by compress().
+
+    Raises:
+        CompressionError if the data is invalid or expands beyond max_size.
+    """
+    decompressor = zlib.decompressobj(WBITS, zdict=dictionary)
+    try:
+        data = decompressor.decompress(payload, max_size)
+    except zlib.error as e:
+        raise CompressionError(str(e)) from e
+    if decompressor.unconsumed_tail or not decompressor.eof:
+        raise CompressionError("Truncated or oversized compressed payload")
+    return data
+
+
+def main():
+    samples = corpus_samples()
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'rb') as f:
+            samples = [line.rstrip(b'\r\n') for line in f if line.strip()]
+    dictionary = train_dictionary(samples)
+    print(f"# {len(dictionary)} bytes from {len(samples)} samples")
+    print("DICTIONARY = (")
+    for start in range(0, len(dictionary), 48):
+        print(f"    {dictionary[start:start + 48]!r}")
+    print(")")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Delta-encoded controller state streaming with periodic keyframes.
+
+Most teleop samples are nearly identical, so instead of sending the full
+7-byte controller state (Type 4) every time, the sender sends:
+
+- a keyframe (Type 4, full state) every keyframe_interval samples, or as soon
+  as the receiver asks for one (Type 6, sent when it sees a sequence gap);
+- otherwise a delta (Type 5) holding only the fields that changed since the
+  previous sample, or nothing at all if no field changed.
+
+Delta payload (Type 5):
+    Byte 0      change mask: bits 0-5 = axes in protocol.CONTROLLER_AXES order,
+                bit 6 = button bitfield
+    Bytes 1..   one int8 per changed axis (in bit order), then the button
+                byte if bit 6 is set
+
+Changes are detected on the quantized int8 values, so stick noise below the
+quantization step does not produce deltas.
+
+Usage (sender):
+    encoder = ControllerDeltaEncoder()
+    encoded = encoder.encode(state)
+    if encoded is not None:
+        packet_type, payload = encoded
+        ser.write(protocol.pack(packet_type, seq, payload))
+
+Usage (receiver):
+    decoder = ControllerDeltaDecoder()
+    state = decoder.decode(packet)          # full state dict, or None
+    if decoder.keyframe_needed:
+        ser.write(protocol.pack(protocol.TYPE_KEYFRAME_REQUEST, seq, b''))
+        decoder.keyframe_needed = False
+"""
+
+import protocol
+
+CONTROLLER = protocol.MESSAGES['controller']
+AXIS_COUNT = len(protocol.CONTROLLER_AXES)
+BUTTONS_BIT = 1 << AXIS_COUNT
+
+
+def _quantize(state: dict) -> list:
+    """Returns the quantized state as [axis0..axis5, buttons]."""
+    return CONTROLLER.to_wire(state)
+
+
+def _to_state(values: list) -> dict:
+    """Turns a quantized [axes..., buttons] list back into a state dict."""
+    return CONTROLLER.from_wire(values)
+
+
+class ControllerDeltaEncoder:
+    def __init__(self, keyframe_interval: int = 20):
+        """
+        Args:
+            keyframe_interval: Send a full keyframe at least every this many
+                samples, so a receiver that missed a delta resyncs even
+                without asking.
+        """
+        self.keyframe_interval = keyframe_interval
+        self.previous = None           # Quantized values last sent
+        self.samples_since_keyframe = 0
+
+        # Statistics
+        self.keyframes_sent = 0
+        self.deltas_sent = 0
+        self.samples_skipped = 0       # Samples with no change, nothing sent
+
+    def request_keyframe(self) -> None:
+        """Forces the next encode() to send a keyframe (e.g. on a Type 6 request)."""
+        self.previous = None
+
+    def encode(self, state: dict):
+        """
+        Encodes a controller sample.
+
+        Returns:
+            A (packet_type, payload) tuple to send, or None if nothing
+            changed since the previous sample.
+        """
+        values = _quantize(state)
+        self.samples_since_keyframe += 1
+
+        if self.previous is None or self.samples_since_keyframe >= self.keyframe_interval:
+            self.previous = values
+            self.samples_since_keyframe = 0
+            self.keyframes_sent += 1
+            return protocol.TYPE_CONTROLLER, protocol.CONTROLLER_STRUCT.pack(*values)
+
+        mask = 0
+        changed = bytearray(1)
+        for index in range(AXIS_COUNT):
+            if values[index] != self.previous[index]:
+                mask |= 1 << index
+                changed.append(values[index] & 0xFF)  # int8 as a raw byte
+        if values[AXIS_COUNT] != self.previous[AXIS_COUNT]:
+            mask |= BUTTONS_BIT
+            changed.append(values[AXIS_COUNT])
+
+        if mask == 0:
+            self.samples_skipped += 1
+            return None
+
+        changed[0] = mask
+        self.previous = values
+        self.deltas_sent += 1
+        return protocol.TYPE_CONTROLLER_DELTA, bytes(changed)
+
+
+class ControllerDeltaDecoder:
+    def __init__(self):
+        self.values = None             # Quantized state rebuilt so far
+        self.last_sequence = None
+        self.keyframe_needed = True    # Nothing to apply deltas to yet
+
+        # Statistics
+        self.keyframes_received = 0
+        self.deltas_received = 0
+        self.gaps = 0                  # Sequence gaps seen on controller packets
+        self.deltas_dropped = 0        # Deltas received before any keyframe
+
+    def decode(self, packet: dict):
+        """
+        Applies a Type 4 (keyframe) or Type 5 (delta) packet.
+
+        Returns:
+            The full rebuilt controller state as a dict, or None if the packet
+            is malformed or no keyframe has been received yet. When a sequence
+            gap is detected, keyframe_needed is set so the caller can send a
+            Type 6 request; deltas keep being applied in the meantime.
+        """
+        sequence = packet['seq']
+        if self.last_sequence is not None and sequence != (self.last_sequence + 1) % 65536:
+            self.gaps += 1
+            self.keyframe_needed = True
+        self.last_sequence = sequence
+
+        payload = packet['payload']
+        if packet['type'] == protocol.TYPE_CONTROLLER:
+            if len(payload) != protocol.CONTROLLER_STRUCT.size:
+                return None
+            self.values = list(protocol.CONTROLLER_STRUCT.unpack(payload))
+            self.keyframe_needed = False
+            self.keyframes_received += 1
+            return _to_state(self.values)
+
+        if packet['type'] != protocol.TYPE_CONTROLLER_DELTA or len(payload) < 1:
+            return None
+        if self.values is None:
+            self.deltas_dropped += 1
+            return None
+
+        mask = payload[0]
+        expected_length = 1 + bin(mask & (BUTTONS_BIT - 1)).count('1') + (1 if mask & BUTTONS_BIT else 0)
+        if len(payload) != expected_length:
+            return None
+
+        position = 1
+        for index in range(AXIS_COUNT):
+            if mask & (1 << index):
+                raw = payload[position]
+                self.values[index] = raw - 256 if raw > 127 else raw
+                position += 1
+        if mask & BUTTONS_BIT:
+            self.values[AXIS_COUNT] = payload[position]
+
+        self.deltas_received += 1
+        return _to_state(self.values)
@@ -0,0 +1,122 @@
+"""
+Event-driven controller sampling: decides when a controller sample is worth
+sending.
+
+Polling the controller on a fixed 100 ms sleep delays every button press by
+up to 100 ms and keeps using airtime while the controller sits idle. The
+sender instead wakes on controller events (see controller_sender_v1.py) and
+asks the ControllerSampler whether to send:
+
+- a sample is sent as soon as it differs meaningfully from the last one
+  sent: any button changed, or an axis moved by more than `deadband`;
+- changes are sent no faster than `max_rate` per second; a change inside
+  that limit is held and sent when the limit allows (the newest state
+  wins);
+- with no change for `heartbeat_interval` seconds a heartbeat is sent, so
+  the rover knows the link is alive and converges on the exact state even
+  after movements smaller than the deadband.
+
+Usage:
+    sampler = ControllerSampler(max_rate=sampler_rate_for_link(0.25))
+    while True:
+        wait_for_controller_event(timeout=sampler.timeout())
+        reason = sampler.poll(read_state())
+        if reason is not None:              # SEND_CHANGE or SEND_HEARTBEAT
+            send(state)
+"""
+
+import time
+
+import protocol
+from pacing import frame_cost
+
+# Reasons returned by ControllerSampler.poll()
+SEND_CHANGE = 'change'
+SEND_HEARTBEAT = 'heartbeat'
+
+
+def sampler_rate_for_link(link_share: float, baud_rate: int = 57600) -> float:
+    """
+    Samples per second that keep controller keyframes to link_share of the
+    link's capacity (e.g. 0.25 leaves three quarters for everything else).
+    """
+    size = protocol.MIN_PACKET_SIZE + protocol.CONTROLLER_STRUCT.size
+    return link_share / frame_cost(size, baud_rate=baud_rate)
+
+
+class ControllerSampler:
+    def __init__(self, deadband: float = 0.02, heartbeat_interval: float = 0.5,
+                 max_rate: float = 50.0):
+        """
+        Args:
+            deadband: Axis movement (in the -1..1 axis range) that counts as
+                a change. Stick noise below it is not sent.
+            heartbeat_interval: Seconds without a change before the current
+                state is sent anyway.
+            max_rate: Most samples sent per second.
+        """
+        self.deadband = deadband
+        self.heartbeat_interval = heartbeat_interval
+        self.min_interval = 1.0 / max_rate
+        self.last_sent = None          # State last sent
+        self.last_sent_at = None
+        self.pending = False           # A change is waiting for the rate limit
+
+        # Statistics
+        self.changes_sent = 0
+        self.heartbeats_sent = 0
+        self.rate_limited = 0          # Changes held back by max_rate
+
+    def request_send(self) -> None:
+        """Makes the next poll() send the state (e.g. when the rover asked for a keyframe)."""
+        self.last_sent = None
+
+    def _changed(self, state: dict) -> bool:
+        if self.last_sent is None:
+            return True
+        for name in protocol.CONTROLLER_AXES:
+            if abs(state[name] - self.last_sent[name]) > self.deadband:
+                return True
+        return any(bool(state[name]) != bool(self.last_sent[name])
+                   for name in protocol.CONTROLLER_BUTTONS)
+
+    def poll(self, state: dict, now: float = None):
+        """
+        Checks the current controller state.
+
+        Returns:
+            SEND_CHANGE or SEND_HEARTBEAT if the state should be sent now
+            (it is then recorded as sent), otherwise None.
+        """
+        if now is None:
+            now = time.monotonic()
+
+        if self._changed(state):
+            if self.last_sent_at is not None and now - self.last_sent_at < self.min_interval:
+                if not self.pending:
+                    self.rate_limited += 1
+                self.pending = True
+                return None
+            reason = SEND_CHANGE
+            self.changes_sent += 1
+        elif self.last_sent_at is not None and now - self.last_sent_at >= self.heartbeat_interval:
+            reason = SEND_HEARTBEAT
+            self.heartbeats_sent += 1
+        else:
+            # Moved back inside the deadband before the held change went out
+            self.pending = False
+            return None
+
+        self.last_sent = dict(state)
+        self.last_sent_at = now
+        self.pending = False
+        return reason
+
+    def timeout(self, now: float = None) -> float:
+        """Seconds until poll() should be called again even without a controller event."""
+        if self.last_sent_at is None:
+            return 0.0
+        if now is None:
+            now = time.monotonic()
+        interval = self.min_interval if self.pending else self.heartbeat_interval
+        return max(0.0, self.last_sent_at + interval - now)
@@ -2,10 +2,24 @@ import pygame
 import serial
 import threading
 import time
+import sys
+import os
+
+# Add the repository root to the path to import protocol
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import protocol
+from controller_codec import ControllerDeltaEncoder
+from pacing import Pacer
+from serial_reader import SerialReader
+import controller_sampler
+from controller_sampler import ControllerSampler
 
 # --- SERIAL SETUP ---
-PORT = 'COM4'  # Replace with your RFD900 COM port (e.g. COM4 or /dev/ttyUSB0)
+PORT = os.environ.get('RFD_PORT', 'COM4')  # Replace with your RFD900 COM port (e.g. COM4 or /dev/ttyUSB0)
 BAUD = 57600
+DEADBAND = 0.02             # Axis movement that counts as a change
+HEARTBEAT_INTERVAL = 0.5    # Seconds; the state is resent this often while nothing changes
+LINK_SHARE = 0.25           # Most of the link the controller may use at full rate
 ser = serial.Serial(PORT, BAUD, timeout=1)
 time.sleep(2)
 print(f"Connected to RFD900 on {PORT} at {BAUD} baud.")
@@ -22,9 +36,49 @@ joystick = pygame.joystick.Joystick(0)
 joystick.init()
 print(f"Connected to controller: {joystick.get_name()}")
 
+# Packets are built in place in this buffer
+tx_buffer = bytearray(protocol.MAX_PACKET_SIZE)
+tx_view = memoryview(tx_buffer)
+sequence_number = 0
+
+# Only changed fields are sent, with a full keyframe every 20 samples or
+# whenever the rover reports a gap
+encoder = ControllerDeltaEncoder(keyframe_interval=20)
+rx_decoder = protocol.StreamDecoder()
+
+# Samples are sent when the controller changes, with a heartbeat while idle
+sampler = ControllerSampler(deadband=DEADBAND, heartbeat_interval=HEARTBEAT_INTERVAL,
+                            max_rate=controller_sampler.sampler_rate_for_link(LINK_SHARE, BAUD))
+
+# Frames are written no faster than the radio can carry them, so the modem's
+# buffer never backs up behind old samples
+pacer = Pacer(BAUD)
+
+# Keyframe requests from the rover (it saw a sequence gap) are read in the
+# background and wake the main loop as a pygame event
+KEYFRAME_REQUEST_EVENT = pygame.USEREVENT + 1
+
+
+def read_keyframe_requests():
+    reader = SerialReader(ser)
+    while True:
+        rx_decoder.feed(reader.read())
+        for packet in rx_decoder:
+            if packet['type'] == protocol.TYPE_KEYFRAME_REQUEST:
+                pygame.event.post(pygame.event.Event(KEYFRAME_REQUEST_EVENT))
+
+
+threading.Thread(target=read_keyframe_requests, daemon=True).start()
+
 # --- MAIN LOOP ---
 while True:
-    pygame.event.pump()
+    # Sleep until the controller (or the rover) has something, or until a
+    # held-back change or the heartbeat is due
+    events = [pygame.event.wait(max(1, int(sampler.timeout() * 1000)))]
+    for event in events + pygame.event.get():
+        if event.type == KEYFRAME_REQUEST_EVENT:
+            encoder.request_keyframe()
+            sampler.request_send()
 
     # Read analog sticks
     left_x = joystick.get_axis(0)
@@ -46,21 +100,36 @@ while True:
     square = joystick.get_button(2)
     triangle = joystick.get_button(3)
 
-    # Pack controller state into a string
-    inputs = f"{left_x:.2f},{left_y:.2f},{right_x:.2f},{right_y:.2f},{l1:.2f},{r1:.2f},{l2:.2f},{r2:.2f},{cross},{circle},{square},{triangle}"
+    state = {
+        'left_x': left_x, 'left_y': left_y, 'right_x': right_x, 'right_y': right_y,
+        'l2': l2, 'r2': r2,
+        'l1': l1, 'r1': r1, 'cross': cross, 'circle': circle, 'square': square, 'triangle': triangle,
+    }
+    reason = sampler.poll(state)
+    if reason is None:  # No meaningful change, or held back by the rate limit
+        continue
+    if reason == controller_sampler.SEND_HEARTBEAT:
+        # Heartbeats carry the full state, so the rover resyncs even after
+        # movements inside the deadband
+        encoder.request_keyframe()
+
+    # Encode controller state as a binary keyframe (Type 4) or a delta of the
+    # fields that changed (Type 5)
+    encoded = encoder.encode(state)
+    if encoded is not None:
+        packet_type, payload = encoded
+        length = protocol.pack_into(tx_buffer, 0, packet_type, sequence_number, payload)
+        sequence_number = (sequence_number + 1) % 65536
 
-    # Send it through serial
-    ser.write((inputs + "\n").encode('utf-8'))
+        # Send it through serial
+        pacer.acquire(length)
+        ser.write(tx_view[:length])
 
     # Print locally too
-   
     print(
-        f"Received: "
+        f"Sent ({reason}): "
         f"L-stick({left_x:.2f},{left_y:.2f}) | "
         f"R-stick({right_x:.2f},{right_y:.2f}) | "
         f"L1:{l1} R1:{r1} L2:{l2:.2f} R2:{r2:.2f} | "
         f"X:{cross} O:{circle} □:{square} △:{triangle}"
         )
-
-    # Small delay to avoid spamming
-    time.sleep(0.1) # This value can be changed 
\ No newline at end of file
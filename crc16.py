@@ -0,0 +1,184 @@
+"""
+CRC-16/Kermit checksum used by the packet protocol.
+
+CRC-16/Kermit: polynomial 0x1021 (reflected 0x8408), initial value 0x0000,
+reflected input/output, no final XOR. Check value for b'123456789' is 0x2189.
+https://crccalc.com/?crc=123456789&method=&datatype=ascii&outtype=hex
+
+All functions accept any bytes-like object (bytes, bytearray, memoryview), so
+header + payload can be checksummed straight out of a receive buffer without
+concatenating them first.
+
+crcmod is used as an accelerator when it is installed; otherwise the
+table-driven pure Python implementation below is used. NumPy is optional too
+and only used by verify_many().
+"""
+
+import struct
+
+try:
+    import crcmod.predefined
+    _crcmod_func = crcmod.predefined.mkCrcFun('kermit')
+except ImportError:
+    _crcmod_func = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+CRC_INITIAL = 0x0000
+CRC_POLY_REFLECTED = 0x8408
+
+
+def _make_table() -> tuple:
+    """Builds the 256 entry lookup table for the reflected polynomial."""
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ CRC_POLY_REFLECTED
+            else:
+                crc >>= 1
+        table.append(crc)
+    return tuple(table)
+
+
+CRC16_TABLE = _make_table()
+
+
+def crc16_table(data, crc: int = CRC_INITIAL) -> int:
+    """
+    Table-driven CRC-16/Kermit in pure Python.
+
+    Args:
+        data: Bytes-like object to checksum.
+        crc: Running CRC value to continue from (CRC_INITIAL to start).
+
+    Returns:
+        The updated 16-bit CRC.
+    """
+    table = CRC16_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+if _crcmod_func is not None:
+    # crcmod's C extension is much faster than the pure Python loop, and its
+    # second argument continues from a previous CRC exactly like crc16_table.
+    crc16 = _crcmod_func
+    ACCELERATED = True
+else:
+    crc16 = crc16_table
+    ACCELERATED = False
+
+
+class Crc16:
+    """
+    Incremental CRC-16/Kermit, so a frame's CRC can be computed while its
+    bytes arrive.
+
+    Usage:
+        crc = Crc16()
+        crc.update(header)
+        crc.update(payload_chunk)
+        ok = crc.value == received_checksum
+    """
+
+    def __init__(self, data=b''):
+        self.value = CRC_INITIAL
+        if data:
+            self.update(data)
+
+    def update(self, data) -> 'Crc16':
+        """Feeds more bytes into the running CRC."""
+        self.value = crc16(data, self.value)
+        return self
+
+    def reset(self) -> None:
+        """Starts over for a new frame."""
+        self.value = CRC_INITIAL
+
+    def digest(self) -> bytes:
+        """The CRC as 2 big-endian bytes, as it appears on the wire."""
+        return struct.pack('>H', self.value)
+
+
+def verify_many(frames, start: int = 0, use_numpy: bool = None) -> list:
+    """
+    Checks the CRC of a whole list of frames at once.
+
+    Args:
+        frames: Sequence of bytes-like objects, each holding the checksummed
+            data (header + payload) followed by its 2-byte big-endian CRC.
+        start: Number of leading bytes in each frame that are not covered by
+            the CRC (e.g. protocol.SOF_SIZE for complete packets).
+        use_numpy: Force (True) or disable (False) the vectorized NumPy path.
+            By default NumPy is only used when crcmod is missing and there
+            are enough frames to be worth it; crcmod's C loop beats it.
+
+    Returns:
+        A list of booleans, True where the frame's CRC is valid.
+    """
+    if use_numpy is None:
+        use_numpy = np is not None and not ACCELERATED and len(frames) >= 32
+    if use_numpy and np is None:
+        raise RuntimeError("verify_many(use_numpy=True) requires numpy")
+
+    if not use_numpy:
+        results = []
+        for frame in frames:
+            data_end = len(frame) - 2
+            if data_end < start:
+                results.append(False)
+                continue
+            received = (frame[data_end] << 8) | frame[data_end + 1]
+            with memoryview(frame) as view:
+                results.append(crc16(view[start:data_end]) == received)
+        return results
+
+    return _verify_many_numpy(frames, start)
+
+
+_NP_TABLE = None
+
+
+def _verify_many_numpy(frames, start: int) -> list:
+    """
+    Vectorized verify_many(): runs the table lookup for every frame in lockstep,
+    one byte column at a time.
+
+    With an initial value of 0 and no final XOR, leading zero bytes leave the
+    CRC at 0, so shorter frames are simply left-padded with zeros.
+    """
+    global _NP_TABLE
+    if _NP_TABLE is None:
+        _NP_TABLE = np.array(CRC16_TABLE, dtype=np.uint16)
+
+    count = len(frames)
+    if count == 0:
+        return []
+
+    lengths = np.fromiter((len(frame) for frame in frames), dtype=np.int64, count=count)
+    valid_length = lengths >= start + 2
+    data_lengths = np.where(valid_length, lengths - start - 2, 0)
+    width = int(data_lengths.max())
+
+    matrix = np.zeros((count, width), dtype=np.uint8)
+    received = np.zeros(count, dtype=np.uint16)
+    for row, frame in enumerate(frames):
+        data_length = data_lengths[row]
+        if not valid_length[row]:
+            continue
+        buf = np.frombuffer(frame, dtype=np.uint8)[start:]
+        matrix[row, width - data_length:] = buf[:data_length]
+        received[row] = (int(buf[data_length]) << 8) | int(buf[data_length + 1])
+
+    crc = np.zeros(count, dtype=np.uint16)
+    for column in range(width):
+        crc = (crc >> 8) ^ _NP_TABLE[(crc ^ matrix[:, column]) & 0xFF]
+
+    return ((crc == received) & valid_length).tolist()
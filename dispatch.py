@@ -0,0 +1,107 @@
+"""
+Packet handler registry with typed payload codecs.
+
+Each packet type is registered once with a handler and (optionally) the
+precompiled struct.Struct that describes its payload. Dispatch is a single
+list lookup by type ID, a length check against the codec and an
+unpack_from() straight from the payload memoryview, so registering more
+types never slows down the hot path and handlers receive decoded values
+instead of raw bytes.
+
+Codecs default to protocol.PAYLOAD_CODECS, the same table the sender packs
+with (ProtocolSender.send_values), so both ends always agree on the layout.
+
+Usage:
+    dispatcher = Dispatcher()
+
+    @dispatcher.handler(protocol.TYPE_MOTOR)
+    def on_motor(left, right):          # values from MOTOR_STRUCT
+        ...
+
+    dispatcher.register(protocol.TYPE_TEXT, on_text)   # no codec: raw payload
+    dispatcher.dispatch(packet['type'], packet['payload'])
+"""
+
+import protocol
+
+TABLE_SIZE = 256
+
+# Sentinel: use the codec from protocol.PAYLOAD_CODECS.
+DEFAULT_CODEC = object()
+
+
+class Dispatcher:
+    def __init__(self, codecs=None, default_handler=None, on_length_error=None):
+        """
+        Args:
+            codecs: Type ID -> struct.Struct table used when register() is
+                not given a codec. Defaults to protocol.PAYLOAD_CODECS.
+            default_handler: Called as default_handler(packet_type, payload)
+                for types without a handler.
+            on_length_error: Called as on_length_error(packet_type, payload,
+                expected_size) when a payload does not match its codec.
+        """
+        self.codecs = protocol.PAYLOAD_CODECS if codecs is None else codecs
+        self.default_handler = default_handler
+        self.on_length_error = on_length_error
+        # Indexed by type ID: (handler, unpack_from or None, payload size)
+        self._table = [None] * TABLE_SIZE
+
+        # Statistics
+        self.length_errors = 0
+        self.unhandled = 0
+
+    def register(self, packet_type: int, handler, codec=DEFAULT_CODEC) -> None:
+        """
+        Registers the handler for a packet type, replacing any previous one.
+
+        With a codec the handler is called with the unpacked values
+        (handler(*codec.unpack_from(payload))); with codec=None it is called
+        with the raw payload.
+        """
+        if codec is DEFAULT_CODEC:
+            codec = self.codecs.get(packet_type)
+        if codec is None:
+            self._table[packet_type] = (handler, None, None)
+        else:
+            self._table[packet_type] = (handler, codec.unpack_from, codec.size)
+
+    def unregister(self, packet_type: int) -> None:
+        self._table[packet_type] = None
+
+    def handler(self, packet_type: int, codec=DEFAULT_CODEC):
+        """Decorator form of register()."""
+        def decorator(func):
+            self.register(packet_type, func, codec)
+            return func
+        return decorator
+
+    def dispatch(self, packet_type: int, payload) -> bool:
+        """
+        Calls the handler registered for packet_type.
+
+        Returns:
+            True if a registered handler was called.
+        """
+        entry = self._table[packet_type]
+        if entry is None:
+            self.unhandled += 1
+            if self.default_handler is not None:
+                self.default_handler(packet_type, payload)
+            return False
+
+        handler, unpack_from, size = entry
+        if unpack_from is None:
+            handler(payload)
+            return True
+        if len(payload) != size:
+            self.length_errors += 1
+            if self.on_length_error is not None:
+                self.on_length_error(packet_type, payload, size)
+            return False
+        handler(*unpack_from(payload))
+        return True
+
+    def dispatch_packet(self, packet: dict) -> bool:
+        """dispatch() for a packet dictionary from the decoder."""
+        return self.dispatch(packet['type'], packet['payload'])
@@ -0,0 +1,266 @@
+"""
+Fragmentation and reassembly for messages larger than one frame.
+
+A frame carries at most 255 payload bytes, so config blobs, logs or map
+tiles are split into Type 11 fragment packets:
+
+Fragment payload (Type 11):
+    '>BHHB'  inner packet type, message id, fragment index, flags
+    [data]   up to 249 bytes of the message
+
+Bit 0 of the flags marks the last fragment, so the sender never needs to
+know the total size up front and can stream from a file or generator.
+Fragments are ordinary packets with their own sequence numbers: they go
+through the TxScheduler as BULK traffic (control frames are sent in between)
+and can be made reliable by listing TYPE_FRAGMENT in the reliable types.
+
+Usage (sender):
+    fragmenter = Fragmenter(send_packet)    # send_packet(type, payload)
+    fragmenter.send(protocol.TYPE_TEXT, open('config.json', 'rb'))
+
+Usage (receiver):
+    reassembler = Reassembler()
+    for message in reassembler.on_packet(fragment_packet):
+        dispatch_packet(message['type'], message['payload'])
+    reassembler.poll()                      # regularly, to expire stale messages
+"""
+
+import collections
+import struct
+import time
+
+import protocol
+
+FRAGMENT_HEADER_STRUCT = struct.Struct('>BHHB')
+FLAG_LAST = 0x01
+MAX_FRAGMENT_DATA = protocol.MAX_PAYLOAD_SIZE - FRAGMENT_HEADER_STRUCT.size
+MESSAGE_ID_MODULO = 65536
+
+
+def iter_chunks(source, size: int):
+    """
+    Yields the data of source in chunks of exactly size bytes (the last one
+    may be shorter).
+
+    source may be a bytes-like object (sliced without copying), a file-like
+    object with read(), or an iterable of bytes-like chunks of any size.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        for start in range(0, len(view), size):
+            yield view[start:start + size]
+        return
+
+    if hasattr(source, 'read'):
+        while True:
+            chunk = source.read(size)
+            if not chunk:
+                return
+            yield chunk
+
+    pending = bytearray()
+    for piece in source:
+        pending += piece
+        while len(pending) >= size:
+            yield bytes(pending[:size])
+            del pending[:size]
+    if pending:
+        yield bytes(pending)
+
+
+class Fragmenter:
+    def __init__(self, send_packet, fragment_size: int = MAX_FRAGMENT_DATA):
+        """
+        Args:
+            send_packet: Called as send_packet(packet_type, payload) for each
+                fragment.
+            fragment_size: Message bytes per fragment (at most 249).
+        """
+        self.send_packet = send_packet
+        self.fragment_size = min(fragment_size, MAX_FRAGMENT_DATA)
+        self.next_message_id = 0
+
+        # Statistics
+        self.messages_sent = 0
+        self.fragments_sent = 0
+
+    def fragments(self, packet_type: int, source):
+        """
+        Yields the Type 11 payloads for one message, reading source lazily.
+        Callers can send other packets between fragments.
+        """
+        message_id = self.next_message_id
+        self.next_message_id = (message_id + 1) % MESSAGE_ID_MODULO
+
+        chunks = iter_chunks(source, self.fragment_size)
+        # Read one chunk ahead so the last fragment can be flagged.
+        chunk = next(chunks, b'')
+        index = 0
+        while True:
+            following = next(chunks, None)
+            flags = FLAG_LAST if following is None else 0
+            yield FRAGMENT_HEADER_STRUCT.pack(packet_type, message_id, index, flags) + chunk
+            self.fragments_sent += 1
+            if following is None:
+                self.messages_sent += 1
+                return
+            chunk = following
+            index += 1
+
+    def send(self, packet_type: int, source) -> int:
+        """
+        Sends one message of any size as fragments.
+
+        Returns:
+            The number of fragments sent.
+        """
+        count = 0
+        for payload in self.fragments(packet_type, source):
+            self.send_packet(protocol.TYPE_FRAGMENT, payload)
+            count += 1
+        return count
+
+
+class _Message:
+    """Reassembly state of one message."""
+
+    def __init__(self, packet_type: int, now: float, sink):
+        self.type = packet_type
+        self.updated = now
+        self.next_index = 0
+        self.pending = {}               # index -> (data, last), out of order
+        self.pending_bytes = 0
+        self.data = bytearray()         # Unused when streaming into a sink
+        self.size = 0
+        self.sink = sink
+
+
+class Reassembler:
+    def __init__(self, max_message_size: int = 64 * 1024, max_buffered: int = 256 * 1024,
+                 timeout: float = 5.0, on_stream=None):
+        """
+        Args:
+            max_message_size: Larger messages are dropped.
+            max_buffered: Total bytes held for all incomplete messages; the
+                oldest message is dropped when a new fragment would exceed it.
+            timeout: Incomplete messages are dropped after this many seconds
+                without a new fragment.
+            on_stream: Optional factory for streaming consumers. Called as
+                on_stream(packet_type, message_id) on the first fragment of a
+                message, it returns an object with write(data), close() and
+                abort(). Data is written in order as soon as it is contiguous
+                and is not kept in memory; close() marks a complete message,
+                abort() a dropped one.
+        """
+        self.max_message_size = max_message_size
+        self.max_buffered = max_buffered
+        self.timeout = timeout
+        self.on_stream = on_stream
+
+        self.messages = {}              # message id -> _Message, oldest first
+        self.buffered = 0
+        self.aborted = collections.deque(maxlen=16)   # Ignore their late fragments
+
+        # Statistics
+        self.completed = 0
+        self.dropped = 0
+
+    def on_packet(self, packet: dict) -> list:
+        """
+        Handles a Type 11 fragment packet.
+
+        Returns:
+            The messages completed by this fragment, as packet dictionaries
+            ('type', 'seq', 'payload') where seq is the message id. Always
+            empty when streaming.
+        """
+        payload = packet['payload']
+        if len(payload) < FRAGMENT_HEADER_STRUCT.size:
+            return []
+        packet_type, message_id, index, flags = FRAGMENT_HEADER_STRUCT.unpack_from(payload)
+        if message_id in self.aborted:
+            return []
+        # Copy: the payload may be a view into the decoder's buffer.
+        data = bytes(payload[FRAGMENT_HEADER_STRUCT.size:])
+        last = bool(flags & FLAG_LAST)
+        now = time.monotonic()
+
+        message = self.messages.get(message_id)
+        if message is None:
+            sink = self.on_stream(packet_type, message_id) if self.on_stream else None
+            message = self.messages[message_id] = _Message(packet_type, now, sink)
+        message.updated = now
+
+        if index < message.next_index or index in message.pending:
+            return []       # Duplicate
+        message.size += len(data)
+        if message.size > self.max_message_size:
+            self._drop(message_id)
+            return []
+
+        in_order = index == message.next_index
+        # Out-of-order data waits in memory; so does in-order data unless it
+        # is streamed straight into a sink.
+        if (not in_order or message.sink is None) and not self._reserve(message_id, len(data)):
+            return []
+
+        if not in_order:
+            message.pending[index] = (data, last)
+            message.pending_bytes += len(data)
+            return []
+
+        complete = self._append(message, data, last)
+        while not complete and message.next_index in message.pending:
+            data, last = message.pending.pop(message.next_index)
+            message.pending_bytes -= len(data)
+            if message.sink is not None:
+                self.buffered -= len(data)
+            complete = self._append(message, data, last)
+
+        if not complete:
+            return []
+        del self.messages[message_id]
+        self.buffered -= len(message.data)
+        self.completed += 1
+        if message.sink is not None:
+            message.sink.close()
+            return []
+        return [{'type': message.type, 'seq': message_id, 'payload': bytes(message.data)}]
+
+    def _append(self, message: _Message, data: bytes, last: bool) -> bool:
+        """Adds the next in-order fragment. Returns True if it was the last one."""
+        if message.sink is not None:
+            message.sink.write(data)
+        else:
+            message.data += data
+        message.next_index += 1
+        return last
+
+    def _reserve(self, message_id: int, size: int) -> bool:
+        """
+        Accounts for size more buffered bytes, dropping the oldest messages
+        to make room. Returns False if message_id itself had to be dropped.
+        """
+        self.buffered += size
+        while self.buffered > self.max_buffered:
+            oldest = next(iter(self.messages))
+            self._drop(oldest)
+            if oldest == message_id:
+                self.buffered -= size
+                return False
+        return True
+
+    def _drop(self, message_id: int) -> None:
+        message = self.messages.pop(message_id)
+        self.buffered -= len(message.data) + message.pending_bytes
+        self.aborted.append(message_id)
+        self.dropped += 1
+        if message.sink is not None:
+            message.sink.abort()
+
+    def poll(self) -> None:
+        """Drops incomplete messages that have timed out."""
+        now = time.monotonic()
+        for message_id, message in list(self.messages.items()):
+            if now - message.updated >= self.timeout:
+                self._drop(message_id)
@@ -8,129 +8,222 @@ Hardware Setup:
 """
 
 import serial
-import struct
-import time
 import sys
 import os
+import time
 
 # Add the parent directory to the path to import protocol
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 import protocol
+from serial_reader import SerialReader
+from coalesce import split_container
+from arq import ReliableReceiver
+from fragment import Reassembler
+from dispatch import Dispatcher
+from metrics import LinkMetrics, MetricsExporter
+from latency import make_pong
+from latest_value import LatestValueMailbox
+import capture
+import packet_log
+from packet_log import PacketLog
 
 # Configuration
-SERIAL_PORT = '/dev/ttyUSB0'  # RFD900 modem on Jetson
+SERIAL_PORT = os.environ.get('RFD_PORT', '/dev/ttyUSB0')  # RFD900 modem on Jetson
 BAUD_RATE = 57600
 TIMEOUT = 1
+METRICS_PATH = None  # e.g. '/tmp/rover_link.prom' for the node_exporter textfile collector
+LOG_LEVEL = packet_log.INFO  # packet_log.DEBUG, INFO, WARNING or ERROR
+LOG_SAMPLE_EVERY = 1  # Log one packet in N (warnings are always logged)
+LOG_PATH = None  # e.g. 'rover.log'; view it with: python packet_log.py rover.log
+CAPTURE_PATH = None  # e.g. 'rover.cap' to record the raw serial stream (see capture.py)
+REPLAY_PATH = None  # Replay this capture through the handlers instead of opening the port
+REPLAY_SPEED = 1.0  # 1.0 = real time, 10.0 = ten times faster, None = as fast as possible
+LATEST_TYPES = (protocol.TYPE_MOTOR,)  # Only the newest of these per read is handled; older ones are skipped
 
 class ProtocolReceiver:
-    def __init__(self, port, baud_rate=57600):
-        """Initialize serial connection."""
-        self.ser = serial.Serial(port, baud_rate, timeout=TIMEOUT)
-        self.buffer = b''
+    def __init__(self, port, baud_rate=57600, metrics_path=None,
+                 log_level=packet_log.INFO, log_sample_every=1, log_path=None,
+                 capture_path=None, latest_types=None):
+        """
+        Initialize serial connection.
+
+        Link metrics are kept in self.metrics; with metrics_path they are
+        also written to that file periodically (see metrics.py).
+        Per-packet output goes through self.log, printed by a background
+        thread: log_level sets the verbosity, log_sample_every=N logs one
+        packet in N and log_path also keeps binary records (see packet_log.py).
+        With capture_path every byte read is recorded with its arrival time
+        (see capture.py). With port=None no serial port is opened; feed data
+        with process_data() or replay().
+        Packet types in latest_types are delivered latest-wins: of those
+        decoded from one read, only the newest per type reaches its handler,
+        and skipped ones are counted as superseded_commands (see
+        latest_value.py).
+        """
+        self.ser = None
+        self.reader = None
+        if port is not None:
+            self.ser = serial.Serial(port, baud_rate, timeout=TIMEOUT)
+            self.reader = SerialReader(self.ser)
+        self.capture = capture.CaptureWriter(capture_path) if capture_path else None
+        self.decoder = protocol.StreamDecoder()
+        self.reliable = ReliableReceiver(self.send_frame)
+        self.reassembler = Reassembler()
+
+        # Handlers by packet type; fixed-layout payloads are decoded with the
+        # shared codecs in protocol.PAYLOAD_CODECS before the handler runs.
+        self.dispatcher = Dispatcher(default_handler=self.process_unknown,
+                                     on_length_error=self.report_length_error)
+        self.dispatcher.register(protocol.TYPE_PING, self.process_ping, codec=None)
+        self.dispatcher.register(protocol.TYPE_MOTOR, self.process_motor_command)
+        self.dispatcher.register(protocol.TYPE_TEXT, self.process_text_message)
+        self.dispatcher.register(protocol.TYPE_SENSOR, self.process_sensor_data)
         self.packet_count = 0
         self.error_count = 0
+        self.bytes_skipped = 0       # decoder.bytes_skipped at the last check
         self.last_sequence = None
+        self.rx_time_ns = 0          # When the data being processed arrived
+        self.pong_sequence = 0
+
+        self.metrics = LinkMetrics()
+        self.metrics_exporter = None
+        if metrics_path:
+            self.metrics_exporter = MetricsExporter(self.metrics, metrics_path)
+            self.metrics_exporter.start()
+
+        self.latest_types = set(latest_types or ())
+        self.mailbox = LatestValueMailbox(self.metrics)
 
+        self.log = PacketLog(level=log_level, sample_every=log_sample_every, path=log_path)
+        self.log.start()
+
+        if self.ser is None:
+            return
         print(f"Connected to {port} at {baud_rate} baud")
         print(f"Waiting for packets (SOF: {protocol.START_OF_FRAME.hex()})...")
         print("-" * 60)
 
-    def process_motor_command(self, payload):
-        """Process motor command packet (Type 1)."""
-        if len(payload) != 8:
-            print(f"  ERROR: Expected 8 bytes for motor command, got {len(payload)}")
-            return
+    def send_frame(self, packet_type, sequence_number, payload):
+        """Send a packet back to the laptop (ACKs and NACKs)."""
+        if self.ser is not None:
+            self.ser.write(protocol.pack(packet_type, sequence_number, payload))
 
-        left_speed, right_speed = struct.unpack('>ff', payload)
-        print(f"  MOTOR COMMAND: Left={left_speed:+.2f}, Right={right_speed:+.2f}")
+    def process_motor_command(self, left_speed, right_speed):
+        """Process motor command packet (Type 1)."""
+        self.log.log(packet_log.EVENT_MOTOR, v0=left_speed, v1=right_speed)
 
         # Here you would send commands to your motor controller
         # Example: send to Arduino, control GPIO, etc.
 
     def process_text_message(self, payload):
         """Process text message packet (Type 2)."""
-        try:
-            message = payload.decode('utf-8')
-            print(f"  TEXT MESSAGE: '{message}'")
-        except UnicodeDecodeError:
-            print(f"  TEXT MESSAGE: (decode error) Raw: {payload.hex()}")
+        self.log.log(packet_log.EVENT_TEXT, length=len(payload), data=payload)
 
-    def process_sensor_data(self, payload):
+    def process_sensor_data(self, temperature, humidity, pressure):
         """Process sensor data packet (Type 3)."""
-        if len(payload) != 12:
-            print(f"  ERROR: Expected 12 bytes for sensor data, got {len(payload)}")
-            return
-
-        temperature, humidity, pressure = struct.unpack('>fff', payload)
-        print(f"  SENSOR DATA: Temp={temperature:.1f}°C, Humidity={humidity:.1f}%, "
-              f"Pressure={pressure:.2f}hPa")
+        self.log.log(packet_log.EVENT_SENSOR, v0=temperature, v1=humidity, v2=pressure)
 
     def process_ping(self, payload):
-        """Process ping packet (Type 0)."""
-        print(f"  PING received (payload: {len(payload)} bytes)")
+        """Process ping packet (Type 0): answer with a pong (Type 12)."""
+        self.log.log(packet_log.EVENT_PING, length=len(payload))
+        pong = make_pong(payload, self.rx_time_ns)
+        if pong is not None:
+            self.send_frame(protocol.TYPE_PONG, self.pong_sequence, pong)
+            self.pong_sequence = (self.pong_sequence + 1) % 65536
 
     def process_packet(self, packet_data):
         """Process a received packet based on its type."""
+        if packet_data['type'] == protocol.TYPE_CONTAINER:
+            # Several coalesced messages in one frame, handle each one
+            for sub_packet in split_container(packet_data):
+                self.process_packet(sub_packet)
+            return
+
+        if packet_data['type'] == protocol.TYPE_RELIABLE:
+            # Reliable channel: the ARQ receiver ACKs it and returns whatever
+            # is now deliverable in order. These messages have their own
+            # sequence space, so they skip the gap check below.
+            for message in self.reliable.on_packet(packet_data):
+                self.packet_count += 1
+                self.metrics.record_rx(message['type'], None, len(message['payload']))
+                self.log.begin_packet()
+                self.log.log(packet_log.EVENT_RX_RELIABLE, message['type'], message['seq'],
+                             len(message['payload']), self.packet_count)
+                if message['type'] == protocol.TYPE_FRAGMENT:
+                    self.process_fragment(message)
+                else:
+                    self.dispatch_packet(message['type'], message['payload'])
+            return
+
         packet_type = packet_data['type']
         sequence = packet_data['seq']
         payload = packet_data['payload']
 
         self.packet_count += 1
+        self.metrics.record_rx(packet_type, sequence, len(payload))
 
-        print(f"\n[PACKET #{self.packet_count}] Type={packet_type}, Seq={sequence}, "
-              f"Payload={len(payload)} bytes")
+        self.log.begin_packet()
+        self.log.log(packet_log.EVENT_RX, packet_type, sequence, len(payload), self.packet_count)
 
         # Check for missing packets
         if self.last_sequence is not None:
             expected_seq = (self.last_sequence + 1) % 65536
             if sequence != expected_seq:
                 missed = (sequence - expected_seq) % 65536
-                print(f"  WARNING: Missed {missed} packet(s)! "
-                      f"Expected seq={expected_seq}, got seq={sequence}")
+                self.log.log(packet_log.EVENT_SEQUENCE_GAP, packet_type, sequence,
+                             number=missed, v0=expected_seq)
 
         self.last_sequence = sequence
 
-        # Route to appropriate handler based on packet type
-        if packet_type == 0:
-            self.process_ping(payload)
-        elif packet_type == 1:
-            self.process_motor_command(payload)
-        elif packet_type == 2:
-            self.process_text_message(payload)
-        elif packet_type == 3:
-            self.process_sensor_data(payload)
-        else:
-            print(f"  UNKNOWN TYPE: {packet_type}")
-            print(f"  Raw payload: {payload.hex()}")
+        if packet_type == protocol.TYPE_FRAGMENT:
+            self.process_fragment(packet_data)
+            return
+
+        self.dispatch_packet(packet_type, payload)
+
+    def process_fragment(self, packet_data):
+        """Process a fragment packet (Type 11), dispatching completed messages."""
+        for message in self.reassembler.on_packet(packet_data):
+            self.log.log(packet_log.EVENT_REASSEMBLED, message['type'], message['seq'],
+                         len(message['payload']))
+            self.dispatch_packet(message['type'], message['payload'])
+
+    def process_unknown(self, packet_type, payload):
+        """Handle a packet type without a registered handler."""
+        self.log.log(packet_log.EVENT_UNKNOWN, packet_type, length=len(payload), data=payload)
+
+    def report_length_error(self, packet_type, payload, expected_size):
+        """A fixed-layout payload had the wrong size."""
+        self.log.log(packet_log.EVENT_LENGTH_ERROR, packet_type, length=len(payload),
+                     number=expected_size)
+
+    def dispatch_packet(self, packet_type, payload):
+        """Route to the handler registered for the packet type."""
+        if packet_type in self.latest_types:
+            # Held until the whole read is decoded; a newer one replaces it
+            self.mailbox.put(packet_type, payload)
+            return
+        self.dispatcher.dispatch(packet_type, payload)
+
+    def deliver_latest(self):
+        """Hand the newest command of each latest-wins type to its handler."""
+        for packet_type, payload in self.mailbox.drain():
+            self.dispatcher.dispatch(packet_type, payload)
 
     def receive_and_process(self):
         """Continuously receive and process packets."""
         try:
             while True:
-                # Read available data from serial port
-                if self.ser.in_waiting > 0:
-                    new_data = self.ser.read(self.ser.in_waiting)
-                    self.buffer += new_data
-
-                # Try to unpack a packet from the buffer
-                packet_data, bytes_consumed = protocol.unpack(self.buffer)
-
-                if packet_data is not None:
-                    # Successfully unpacked a packet
-                    self.process_packet(packet_data)
-                    self.buffer = self.buffer[bytes_consumed:]
-
-                elif bytes_consumed > 0:
-                    # Consumed some bytes but no valid packet (corrupted data)
-                    self.error_count += 1
-                    print(f"\n[ERROR #{self.error_count}] Corrupted packet detected, "
-                          f"skipping {bytes_consumed} bytes")
-                    self.buffer = self.buffer[bytes_consumed:]
-
-                # Small sleep to prevent busy-waiting
-                time.sleep(0.01)
+                # Block until data arrives, then take everything available
+                new_data = self.reader.read()
+                self.reassembler.poll()
+                if new_data:
+                    if self.capture is not None:
+                        self.capture.write(new_data)
+                    self.process_data(new_data)
 
         except KeyboardInterrupt:
+            self.log.flush()
             print("\n\nReceiver stopped by user.")
             self.print_statistics()
 
@@ -140,9 +233,56 @@ class ProtocolReceiver:
             traceback.print_exc()
 
         finally:
-            self.ser.close()
+            self.close()
             print("Serial port closed.")
 
+    def process_data(self, new_data):
+        """Decode received bytes and process every complete packet."""
+        self.rx_time_ns = time.time_ns()
+        self.metrics.record_rx_bytes(len(new_data))
+        self.decoder.feed(new_data)
+
+        # Decode and process every complete packet that is buffered,
+        # so a backlog is cleared in one pass instead of one per sleep
+        for packet_data in self.decoder:
+            self.process_packet(packet_data)
+        self.deliver_latest()
+        self.metrics.update_decoder(self.decoder)
+
+        if self.decoder.error_count > self.error_count:
+            # One record per read: the frames dropped for a bad CRC, and all
+            # the bytes skipped (garbage and those frames) in this read
+            self.log.log(packet_log.EVENT_CRC_ERROR, v0=self.decoder.error_count - self.error_count,
+                         length=self.decoder.bytes_skipped - self.bytes_skipped,
+                         number=self.decoder.error_count)
+            self.error_count = self.decoder.error_count
+        self.bytes_skipped = self.decoder.bytes_skipped
+
+    def replay(self, path, speed=1.0):
+        """
+        Feed a capture file through the decoder and handlers.
+
+        Args:
+            speed: 1.0 for the original timing, larger to play faster,
+                None to play as fast as possible.
+
+        Returns:
+            The replay statistics from capture.replay().
+        """
+        result = capture.replay(path, self.process_data, speed)
+        self.log.flush()
+        return result
+
+    def close(self):
+        """Stop the background writers and close the port and capture file."""
+        self.log.stop()
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.stop()
+        if self.capture is not None:
+            self.capture.close()
+        if self.ser is not None:
+            self.ser.close()
+
     def print_statistics(self):
         """Print reception statistics."""
         print("\n" + "=" * 60)
@@ -153,6 +293,18 @@ class ProtocolReceiver:
         if self.packet_count > 0:
             success_rate = (self.packet_count / (self.packet_count + self.error_count)) * 100
             print(f"Success rate: {success_rate:.1f}%")
+
+        snapshot = self.metrics.snapshot()
+        print(f"Packets lost (sequence gaps): {snapshot['packets_lost']} "
+              f"({snapshot['loss_rate'] * 100:.1f}%)")
+        print(f"Garbage bytes skipped: {snapshot['garbage_bytes_skipped']}")
+        print(f"Throughput: {snapshot['rx']['raw_bytes_per_second']:.0f} B/s raw, "
+              f"{snapshot['rx']['goodput_bytes_per_second']:.0f} B/s goodput")
+        print(f"Inter-arrival jitter: {snapshot['jitter_seconds'] * 1000:.2f} ms")
+        if self.latest_types:
+            print(f"Stale commands skipped: {self.mailbox.superseded} of {self.mailbox.posted}")
+        print(f"Log records: {self.log.written} written, {self.log.dropped} dropped "
+              f"(writer behind), {self.log.sampled_out} sampled out")
         print("=" * 60)
 
 
@@ -161,8 +313,22 @@ def main():
     print("RFD-900x Protocol Receiver Test - JETSON SIDE")
     print("=" * 60)
 
+    if REPLAY_PATH:
+        receiver = ProtocolReceiver(None, metrics_path=METRICS_PATH, log_level=LOG_LEVEL,
+                                    log_sample_every=LOG_SAMPLE_EVERY, log_path=LOG_PATH,
+                                    latest_types=LATEST_TYPES)
+        print(f"Replaying {REPLAY_PATH}...")
+        result = receiver.replay(REPLAY_PATH, REPLAY_SPEED)
+        print(f"Replayed {result['bytes']} bytes in {result['elapsed']:.2f} s")
+        receiver.print_statistics()
+        receiver.close()
+        return
+
     try:
-        receiver = ProtocolReceiver(SERIAL_PORT, BAUD_RATE)
+        receiver = ProtocolReceiver(SERIAL_PORT, BAUD_RATE, metrics_path=METRICS_PATH,
+                                    log_level=LOG_LEVEL, log_sample_every=LOG_SAMPLE_EVERY,
+                                    log_path=LOG_PATH, capture_path=CAPTURE_PATH,
+                                    latest_types=LATEST_TYPES)
         receiver.receive_and_process()
 
     except serial.SerialException as e:
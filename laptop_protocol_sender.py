@@ -7,8 +7,9 @@ Hardware Setup:
 - Configure COM port below (check Device Manager)
 """
 
+import collections
 import serial
-import struct
+import threading
 import time
 import sys
 import os
@@ -16,62 +17,454 @@ import os
 # Add the parent directory to the path to import protocol
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 import protocol
+from coalesce import Coalescer
+import tx_scheduler
+from tx_scheduler import TxScheduler
+from arq import ReliableSender
+from fragment import Fragmenter
+from metrics import LinkMetrics, MetricsExporter
+from latency import LatencyMonitor
+from pacing import Pacer
+import packet_log
+from packet_log import PacketLog
+from serial_reader import SerialReader
 
 # Configuration
-COM_PORT = 'COM8'  # Change to your RFD900 COM port (check Device Manager)
+COM_PORT = os.environ.get('RFD_PORT', 'COM8')  # Change to your RFD900 COM port (check Device Manager)
 BAUD_RATE = 57600
 TIMEOUT = 1
+COALESCE_WINDOW = None  # Seconds, e.g. 0.005 to combine small messages into one frame
+PRIORITIZE = False      # Send control commands ahead of telemetry and text
+RELIABLE_TYPES = ()     # Packet types to retransmit until ACKed, e.g. (protocol.TYPE_TEXT,)
+FEC_SYMBOLS = None      # Reed-Solomon parity bytes per frame block, e.g. 8 on a noisy link
+FRAGMENT_QUEUE_DEPTH = 4  # Fragments queued ahead of the scheduler at most
+COMPRESS = False        # Compress text, containers and fragments with the shared dictionary
+METRICS_PATH = None     # e.g. 'laptop_link.prom' or 'laptop_link.json', rewritten every 5 s
+LOG_LEVEL = packet_log.INFO  # packet_log.DEBUG adds a hex dump of every frame
+LOG_SAMPLE_EVERY = 1   # Log one frame in N
+LOG_PATH = None        # e.g. 'laptop.log'; view it with: python packet_log.py laptop.log
+PING_INTERVAL = None   # Seconds between background pings, e.g. 1.0 for a continuous latency signal
+ALARM_RTT = None       # p95 round trip (s) that raises the latency alarm; None = 3x the best seen
+PACE = False           # Pace frames to the link's capacity so the modem's buffer stays shallow
+PACING_PING_INTERVAL = 1.0  # Ping interval used for pacing when PING_INTERVAL is None
 
 class ProtocolSender:
-    def __init__(self, port, baud_rate=57600):
-        """Initialize serial connection."""
-        self.ser = serial.Serial(port, baud_rate, timeout=TIMEOUT)
+    def __init__(self, port, baud_rate=57600, coalesce_window=None, prioritize=False,
+                 reliable_types=None, fec_symbols=None, compress=False,
+                 metrics_path=None, log_level=packet_log.INFO, log_sample_every=1,
+                 log_path=None, ping_interval=None, alarm_rtt=None, pace=False):
+        """
+        Initialize serial connection.
+
+        port is a serial port name, or an already open serial port object
+        (e.g. LinkEmulator().laptop from link_emulator.py).
+
+        If coalesce_window is set (seconds, e.g. 0.005), messages sent within
+        that window are combined into one container frame (see coalesce.py).
+        If prioritize is set, messages go through a TxScheduler so control
+        commands are sent before telemetry and text (see tx_scheduler.py).
+        Packet types listed in reliable_types are sent over the ARQ reliable
+        channel and retransmitted until acknowledged (see arq.py).
+        If fec_symbols is set, frames are sent in FEC mode with that many
+        Reed-Solomon parity bytes per block (see protocol.pack_fec).
+        Payloads over 255 bytes are split into fragments (see fragment.py).
+        If compress is set, text and batched frames are compressed whenever
+        that makes them smaller (see compression.py).
+        Link metrics are kept in self.metrics; with metrics_path they are
+        also written to that file periodically (see metrics.py).
+        Sent frames are logged through self.log, printed by a background
+        thread: log_level sets the verbosity, log_sample_every=N logs one
+        frame in N and log_path also keeps binary records (see packet_log.py).
+        Pongs from the rover feed self.latency (round-trip percentiles and
+        clock offset, see latency.py); with ping_interval a ping is sent that
+        often in the background. The latency alarm fires when the p95 round
+        trip exceeds alarm_rtt (default: 3x the shortest round trip seen).
+        If pace is set, frames are held back to the rate the link can carry
+        (self.pacer, see pacing.py); the rate adapts to the round trips of
+        the pongs and to ARQ retransmissions. Pacing needs those round trips,
+        so without ping_interval it pings every PACING_PING_INTERVAL seconds.
+        """
+        if isinstance(port, str):
+            self.ser = serial.Serial(port, baud_rate, timeout=TIMEOUT)
+        else:
+            self.ser = port
+            port = getattr(port, 'port', port)
         self.sequence_number = 0
+        self.fec_symbols = fec_symbols
+        self.compress = compress
+
+        self.metrics = LinkMetrics()
+        self.metrics_exporter = None
+        if metrics_path:
+            self.metrics_exporter = MetricsExporter(self.metrics, metrics_path)
+            self.metrics_exporter.start()
+
+        self.log = PacketLog(level=log_level, sample_every=log_sample_every, path=log_path)
+        self.log.start()
+
+        self.latency = LatencyMonitor(alarm_rtt=alarm_rtt, metrics=self.metrics,
+                                      on_alarm=self._latency_alarm)
+
+        self.pacer = None
+        if pace:
+            self.pacer = Pacer(baud_rate, metrics=self.metrics)
+            ping_interval = ping_interval or PACING_PING_INTERVAL
+
+        # Serializes use of tx_buffer and the port between the caller and
+        # the background threads (scheduler, coalescer, retransmissions).
+        self.tx_lock = threading.RLock()
+
+        # Held from taking a sequence number until the frame is written or
+        # handed to the coalescer, so frames go out in sequence order.
+        # Lock order: sequence_lock, then the coalescer's, then tx_lock.
+        self.sequence_lock = threading.Lock()
+
+        # Packets are built in place in this buffer, so sending does not
+        # allocate any per-packet bytes objects.
+        self.tx_buffer = bytearray(protocol.MAX_PACKET_SIZE)
+        self.tx_view = memoryview(self.tx_buffer)
+
+        # With both coalescing and pacing, a writer thread paces and writes
+        # the coalesced frames: the coalescer emits them holding its lock
+        # (and often sequence_lock), where nothing may sleep.
+        self.paced_frames = None
+        self.writer_thread = None
+        if coalesce_window is not None and self.pacer is not None:
+            self.paced_frames = collections.deque()
+            self._paced_ready = threading.Condition()
+            self.writing = True
+            self.writer_thread = threading.Thread(target=self._paced_write_loop, daemon=True)
+            self.writer_thread.start()
+
+        self.coalescer = None
+        if coalesce_window is not None:
+            self.coalescer = Coalescer(self._write_coalesced_frame, window=coalesce_window)
+            self.coalescer.start()
+
+        self.scheduler = None
+        if prioritize:
+            self.scheduler = TxScheduler(self._transmit)
+            self.scheduler.start()
+
+        self.reliable = None
+        self.reliable_types = set(reliable_types or ())
+        if self.reliable_types:
+            self.reliable = ReliableSender(self._write_reliable_frame)
+        self.retransmissions_seen = 0
+
+        # ACKs/NACKs and pongs come back from the rover; read them in the background
+        self.reader = SerialReader(self.ser, poll_interval=0.02)
+        self.rx_decoder = protocol.StreamDecoder()
+        self.receiving = True
+        self.reader_thread = threading.Thread(target=self._receive_loop, daemon=True)
+        self.reader_thread.start()
+
+        self.ping_interval = ping_interval
+        self._ping_stop = threading.Event()
+        self.ping_thread = None
+        if ping_interval:
+            self.ping_thread = threading.Thread(target=self._ping_loop, daemon=True)
+            self.ping_thread.start()
+
+        self.fragmenter = Fragmenter(self.send_packet)
+
         print(f"Connected to {port} at {baud_rate} baud")
         print(f"Start of Frame marker: {protocol.START_OF_FRAME.hex()}")
         print("-" * 60)
 
     def send_packet(self, packet_type, payload):
         """Pack and send a packet using the protocol."""
-        packet = protocol.pack(packet_type, self.sequence_number, payload)
+        if len(payload) > protocol.MAX_PAYLOAD_SIZE:
+            return self.send_large(packet_type, payload)
+
+        if self.scheduler is not None:
+            # Queued by priority, sent from the scheduler thread via _transmit
+            self.scheduler.submit(packet_type, payload)
+            return True
+
+        return self._transmit(packet_type, payload)
+
+    def send_large(self, packet_type, source):
+        """
+        Send a message of any size as Type 11 fragments.
+
+        source may be bytes, a file opened in binary mode or an iterable of
+        chunks; it is read one fragment at a time. With prioritize set, only
+        a few fragments are queued at once so control commands keep going
+        out in between.
+        """
+        print(f"\nSending fragmented message (Type {packet_type})")
+        for payload in self.fragmenter.fragments(packet_type, source):
+            if self.scheduler is not None:
+                self.scheduler.wait_for_room(tx_scheduler.BULK, FRAGMENT_QUEUE_DEPTH)
+            self.send_packet(protocol.TYPE_FRAGMENT, payload)
+        return True
 
-        if packet is None:
-            print("Error: Failed to pack packet (payload too large?)")
-            return False
+    def _transmit(self, packet_type, payload):
+        """Assign the next sequence number and send (or coalesce) the message."""
+        if packet_type in self.reliable_types:
+            # Uses the reliable channel's own sequence numbers
+            self.reliable.send(packet_type, payload)
+            return True
+
+        if self.coalescer is None:
+            # Wait for the link before taking any lock; coalesced frames are
+            # paced by the writer thread
+            self._pace(len(payload))
+        with self.sequence_lock:
+            sequence_number = self._next_sequence()
+            if self.coalescer is not None:
+                self.coalescer.add(packet_type, sequence_number, payload)
+            else:
+                self._write_frame(packet_type, sequence_number, payload)
+        return True
 
-        self.ser.write(packet)
-        print(f"[SENT] Type: {packet_type}, Seq: {self.sequence_number}, "
-              f"Payload: {len(payload)} bytes")
-        print(f"       Hex: {packet.hex(' ')}")
+    def _next_sequence(self):
+        """Take the next sequence number; sequence_lock must be held."""
+        sequence_number = self.sequence_number
+        self.sequence_number = (sequence_number + 1) % 65536
+        return sequence_number
+
+    def send_struct(self, packet_type, codec, *values):
+        """Pack values with a precompiled payload codec and send them."""
+        if (self.coalescer is not None or self.scheduler is not None
+                or packet_type in self.reliable_types or self.fec_symbols
+                or (self.compress and packet_type in protocol.COMPRESSIBLE_TYPES)):
+            return self.send_packet(packet_type, codec.pack(*values))
+
+        self._pace(codec.size)
+        with self.sequence_lock, self.tx_lock:
+            sequence_number = self._next_sequence()
+            length = protocol.pack_struct_into(self.tx_buffer, 0, packet_type,
+                                               sequence_number, codec, *values)
+            self._write_packet(packet_type, sequence_number, self.tx_view[:length], codec.size)
+        return True
 
-        self.sequence_number = (self.sequence_number + 1) % 65536
+    def send_values(self, packet_type, *values):
+        """Send a fixed-layout packet, encoded with its codec from protocol.PAYLOAD_CODECS."""
+        return self.send_struct(packet_type, protocol.PAYLOAD_CODECS[packet_type], *values)
+
+    def _frame_length(self, payload_length):
+        """Bytes on the wire for a frame carrying payload_length bytes."""
+        if self.fec_symbols:
+            return protocol.fec_frame_size(payload_length, self.fec_symbols)
+        return protocol.MIN_PACKET_SIZE + payload_length
+
+    def _pace(self, payload_length, wait=True):
+        """
+        Take the pacer's tokens for a frame, sleeping until the frame may go
+        unless wait is False. Sleeps, so call it before taking sequence_lock
+        or tx_lock: other senders and pings must not queue behind the wait.
+        The length is taken before compression, so it errs on the safe side.
+        """
+        if self.pacer is None:
+            return
+        if wait:
+            self.pacer.acquire(self._frame_length(payload_length))
+        else:
+            self.pacer.reserve(self._frame_length(payload_length))
+
+    def _write_coalesced_frame(self, packet_type, sequence_number, payload):
+        """Coalescer output: write the frame, or queue it for the writer thread when pacing."""
+        if self.paced_frames is None:
+            self._write_frame(packet_type, sequence_number, payload)
+        else:
+            # The coalescer reuses its buffer; queue a copy
+            self._queue_paced_frame(packet_type, sequence_number, bytes(payload))
+
+    def _queue_paced_frame(self, packet_type, sequence_number, payload):
+        """Queue a frame for the writer thread; a payload of None is a ping stamped when written."""
+        with self._paced_ready:
+            self.paced_frames.append((packet_type, sequence_number, payload))
+            self._paced_ready.notify()
+
+    def _paced_write_loop(self):
+        """Wait for the pacer and write each queued frame in order, holding no lock while waiting."""
+        while True:
+            with self._paced_ready:
+                while not self.paced_frames and self.writing:
+                    self._paced_ready.wait()
+                if not self.paced_frames:
+                    return
+                packet_type, sequence_number, payload = self.paced_frames.popleft()
+            if payload is None:
+                payload = protocol.PAYLOAD_CODECS[protocol.TYPE_PING].pack(self.latency.stamp())
+                self._pace(len(payload), wait=False)
+            else:
+                self._pace(len(payload))
+            self._write_frame(packet_type, sequence_number, payload)
+
+    def _write_reliable_frame(self, packet_type, sequence_number, payload):
+        """
+        ARQ output. It runs under the reliable channel's lock, often on the
+        receive thread, so it must not sleep: the frame only takes its
+        tokens, and the debt holds back the paced frames after it. The ARQ
+        window bounds the burst.
+        """
+        self._pace(len(payload), wait=False)
+        self._write_frame(packet_type, sequence_number, payload)
+
+    def _write_frame(self, packet_type, sequence_number, payload):
+        """Pack one frame into tx_buffer and write it; pacing is up to the caller."""
+        if self.compress:
+            packet_type, payload = protocol.compress_payload(packet_type, payload)
+        with self.tx_lock:
+            if self.fec_symbols:
+                packet = protocol.pack_fec(packet_type, sequence_number, payload, self.fec_symbols)
+            else:
+                length = protocol.pack_into(self.tx_buffer, 0, packet_type, sequence_number, payload)
+                packet = self.tx_view[:length]
+            self._write_packet(packet_type, sequence_number, packet, len(payload))
+
+    def _receive_loop(self):
+        """Handle ACKs/NACKs and pongs from the rover and run the retransmit timers."""
+        while self.receiving:
+            try:
+                data = self.reader.read()
+            except (serial.SerialException, OSError):
+                break  # Port closed
+            if data:
+                received_ns = time.time_ns()
+                self.metrics.record_rx_bytes(len(data))
+                self.rx_decoder.feed(data)
+                for packet in self.rx_decoder:
+                    # ACKs, NACKs and pongs each number their frames in their
+                    # own way, so their seqs say nothing about lost packets
+                    self.metrics.record_rx(packet['type'], None, len(packet['payload']))
+                    if packet['type'] == protocol.TYPE_PONG:
+                        self.process_pong(packet, received_ns)
+                    elif self.reliable is not None:
+                        if packet['type'] == protocol.TYPE_ACK:
+                            self.reliable.on_ack(packet['payload'])
+                        elif packet['type'] == protocol.TYPE_NACK:
+                            self.reliable.on_nack(packet['payload'])
+                self.metrics.update_decoder(self.rx_decoder)
+            if self.reliable is not None:
+                self.reliable.poll()
+                if self.reliable.retransmissions != self.retransmissions_seen:
+                    self.retransmissions_seen = self.reliable.retransmissions
+                    if self.pacer is not None:
+                        self.pacer.on_loss()
+
+    def process_pong(self, packet, received_ns):
+        """Record the round trip of a pong (Type 12)."""
+        sample = self.latency.on_pong(packet['payload'], received_ns)
+        if sample is None:
+            return
+        if self.pacer is not None:
+            self.pacer.on_rtt(sample['rtt'])
+        self.log.begin_packet()
+        self.log.log(packet_log.EVENT_PONG, protocol.TYPE_PONG, packet['seq'],
+                     v0=sample['rtt'] * 1000, v1=self.latency.percentiles()['p95'] * 1000,
+                     v2=self.latency.offset * 1000)
+
+    def _latency_alarm(self, active, p95):
+        """Called by the LatencyMonitor when the latency alarm changes."""
+        if active:
+            self.log.log(packet_log.EVENT_LATENCY_ALARM, v0=p95 * 1000,
+                         v1=self.latency.alarm_limit * 1000)
+        else:
+            self.log.log(packet_log.EVENT_LATENCY_OK, v0=p95 * 1000)
+
+    def _ping_loop(self):
+        """Send a ping every ping_interval seconds."""
+        while not self._ping_stop.wait(self.ping_interval):
+            self._send_stamped_ping()
+
+    def _send_stamped_ping(self):
+        """
+        Send a ping stamped just before it is written, ahead of anything
+        waiting in the scheduler or held back by the pacer, so its round trip
+        measures the link rather than the sender's own queues.
+
+        Frames that already hold lower sequence numbers still go first: with
+        the writer thread the ping joins its queue and is stamped there.
+        """
+        with self.sequence_lock:
+            if self.coalescer is not None:
+                # Messages waiting there hold lower sequence numbers; send them first
+                self.coalescer.flush()
+            sequence_number = self._next_sequence()
+            if self.paced_frames is not None:
+                self._queue_paced_frame(protocol.TYPE_PING, sequence_number, None)
+                return True
+            payload = protocol.PAYLOAD_CODECS[protocol.TYPE_PING].pack(self.latency.stamp())
+            # Never held back, but it still uses up its share of the link
+            self._pace(len(payload), wait=False)
+            self._write_frame(protocol.TYPE_PING, sequence_number, payload)
         return True
 
+    def _write_packet(self, packet_type, sequence_number, packet, payload_length):
+        """Write a packed frame (usually a view of tx_buffer)."""
+        self.ser.write(packet)
+        self.metrics.record_tx(packet_type & protocol.TYPE_ID_MASK, payload_length, len(packet))
+        self.log.begin_packet()
+        self.log.log(packet_log.EVENT_TX, packet_type, sequence_number, len(packet))
+        self.log.log(packet_log.EVENT_TX_HEX, packet_type, sequence_number, len(packet), data=packet)
+
+    def close(self):
+        """Flush anything still queued or being coalesced and close the port."""
+        if self.scheduler is not None:
+            self.scheduler.stop()
+        if self.coalescer is not None:
+            self.coalescer.stop()
+        if self.ping_thread is not None:
+            self._ping_stop.set()
+            self.ping_thread.join()
+        if self.writer_thread is not None:
+            with self._paced_ready:
+                self.writing = False
+                self._paced_ready.notify()
+            self.writer_thread.join()
+        self.receiving = False
+        self.reader_thread.join()
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.stop()
+        self.log.stop()
+        self.ser.close()
+
     def send_motor_command(self, left_speed, right_speed):
         """Send motor speed command (Type 1 packet)."""
         # Pack two floats as payload (8 bytes total)
-        payload = struct.pack('>ff', left_speed, right_speed)
         print(f"\nSending motor command: Left={left_speed:.2f}, Right={right_speed:.2f}")
-        return self.send_packet(packet_type=1, payload=payload)
+        return self.send_values(protocol.TYPE_MOTOR, left_speed, right_speed)
 
     def send_text_message(self, message):
         """Send a text message (Type 2 packet)."""
         payload = message.encode('utf-8')
         print(f"\nSending text message: '{message}'")
-        return self.send_packet(packet_type=2, payload=payload)
+        return self.send_packet(packet_type=protocol.TYPE_TEXT, payload=payload)
 
     def send_sensor_data(self, temperature, humidity, pressure):
         """Send sensor data (Type 3 packet)."""
         # Pack three floats as payload (12 bytes total)
-        payload = struct.pack('>fff', temperature, humidity, pressure)
         print(f"\nSending sensor data: Temp={temperature}°C, Humidity={humidity}%, "
               f"Pressure={pressure}hPa")
-        return self.send_packet(packet_type=3, payload=payload)
+        return self.send_values(protocol.TYPE_SENSOR, temperature, humidity, pressure)
 
     def send_ping(self):
-        """Send a ping packet (Type 0, empty payload)."""
+        """Send a ping packet (Type 0) stamped with the current time; the rover answers with a pong."""
         print("\nSending ping...")
-        return self.send_packet(packet_type=0, payload=b'')
+        return self._send_stamped_ping()
+
+    def print_latency(self):
+        """Print the round-trip statistics from the pongs received so far."""
+        snapshot = self.latency.snapshot()
+        if not snapshot['pongs_received']:
+            print(f"\nNo pongs received yet ({snapshot['pings_sent']} pings sent).")
+            return
+        print(f"\nRound trip over the last {len(self.latency.samples)} pongs: "
+              f"p50 {snapshot['p50'] * 1000:.1f} ms, p95 {snapshot['p95'] * 1000:.1f} ms, "
+              f"p99 {snapshot['p99'] * 1000:.1f} ms (best {snapshot['min_rtt'] * 1000:.1f} ms)")
+        print(f"Rover clock offset: {snapshot['offset'] * 1000:+.1f} ms")
+        print(f"Pongs: {snapshot['pongs_received']}/{snapshot['pings_sent']}, "
+              f"latency alarm {'ACTIVE' if snapshot['alarm_active'] else 'off'} "
+              f"({snapshot['alarms']} raised)")
+        if self.pacer is not None:
+            pacing = self.pacer.snapshot()
+            print(f"Pacing at {pacing['rate'] * 100:.0f}% of the link "
+                  f"({pacing['bytes_per_second']:.0f} B/s), {pacing['delayed']}/{pacing['frames']} "
+                  f"frames held back for {pacing['wait_time']:.1f} s in total")
 
     def run_interactive_test(self):
         """Interactive test menu."""
@@ -86,6 +479,8 @@ class ProtocolSender:
             print("  3 - Send sensor data")
             print("  4 - Send ping")
             print("  5 - Run automated test sequence")
+            print("  6 - Send a file (fragmented)")
+            print("  7 - Show round-trip latency")
             print("  q - Quit")
 
             choice = input("\nEnter choice: ").strip().lower()
@@ -117,9 +512,20 @@ class ProtocolSender:
             elif choice == '5':
                 self.run_automated_test()
 
+            elif choice == '6':
+                path = input("Enter file path: ").strip()
+                try:
+                    with open(path, 'rb') as f:
+                        self.send_large(protocol.TYPE_TEXT, f)
+                except OSError as e:
+                    print(f"Could not read file: {e}")
+
+            elif choice == '7':
+                self.print_latency()
+
             elif choice == 'q':
                 print("\nClosing connection...")
-                self.ser.close()
+                self.close()
                 break
 
             else:
@@ -158,7 +564,12 @@ def main():
     print("=" * 60)
 
     try:
-        sender = ProtocolSender(COM_PORT, BAUD_RATE)
+        sender = ProtocolSender(COM_PORT, BAUD_RATE, coalesce_window=COALESCE_WINDOW,
+                                prioritize=PRIORITIZE, reliable_types=RELIABLE_TYPES,
+                                fec_symbols=FEC_SYMBOLS, compress=COMPRESS,
+                                metrics_path=METRICS_PATH, log_level=LOG_LEVEL,
+                                log_sample_every=LOG_SAMPLE_EVERY, log_path=LOG_PATH,
+                                ping_interval=PING_INTERVAL, alarm_rtt=ALARM_RTT, pace=PACE)
         sender.run_interactive_test()
 
     except serial.SerialException as e:
@@ -0,0 +1,191 @@
+"""
+Round-trip latency and clock offset from Type 0 pings.
+
+The laptop stamps each ping with its clock (t1). The rover answers with a
+Type 12 pong carrying t1 plus its own receive (t2) and transmit (t3) times,
+and the laptop notes when the pong arrives (t4). As in NTP:
+
+    round trip   = (t4 - t1) - (t3 - t2)       time on the link, both ways
+    clock offset = ((t2 - t1) + (t3 - t4)) / 2  rover clock minus laptop clock
+
+The offset assumes the two directions take equally long; it is taken from
+the sample with the shortest round trip in the window, which has the least
+queueing and so the least asymmetry.
+
+LatencyMonitor keeps a rolling window of round trips, reports p50/p95/p99
+and raises an alarm when p95 climbs above a limit: alarm_rtt if given,
+otherwise alarm_factor times the shortest round trip seen so far. The alarm
+clears again once p95 drops below clear_ratio of the limit. With a
+LinkMetrics object the figures are also published as gauges.
+
+Usage:
+    monitor = LatencyMonitor(metrics=sender.metrics, alarm_rtt=0.5)
+    sender.send_values(protocol.TYPE_PING, monitor.stamp())
+    ...
+    sample = monitor.on_pong(pong_payload)       # in the receive loop
+    monitor.percentiles()                         # {'p50': ..., 'p95': ..., 'p99': ...}
+
+    # Rover side:
+    payload = make_pong(ping_payload, receive_ns)
+"""
+
+import collections
+import math
+import time
+
+import protocol
+
+PING = protocol.MESSAGES['ping']
+PONG = protocol.MESSAGES['pong']
+
+
+def make_pong(ping_payload, receive_ns: int):
+    """
+    Builds the pong payload answering a ping.
+
+    Args:
+        receive_ns: time.time_ns() when the ping arrived.
+
+    Returns:
+        The Type 12 payload (transmit time taken now), or None for a ping
+        without a timestamp.
+    """
+    if len(ping_payload) != PING.size:
+        return None
+    origin, = PING.unpack(ping_payload)
+    return PONG.pack(origin, receive_ns, time.time_ns())
+
+
+def _percentile(ordered: list, percent: float) -> float:
+    """Nearest-rank percentile of a sorted list."""
+    rank = math.ceil(percent / 100 * len(ordered))
+    return ordered[max(rank, 1) - 1]
+
+
+class LatencyMonitor:
+    def __init__(self, window: int = 100, alarm_rtt: float = None, alarm_factor: float = 3.0,
+                 clear_ratio: float = 0.8, min_samples: int = 5, metrics=None, on_alarm=None):
+        """
+        Args:
+            window: Round trips kept for the percentiles and the offset.
+            alarm_rtt: p95 round trip (seconds) that raises the alarm.
+            alarm_factor: Without alarm_rtt, the alarm limit is this many
+                times the shortest round trip seen.
+            clear_ratio: The alarm clears when p95 is below this fraction
+                of the limit.
+            min_samples: Samples needed before the alarm is evaluated.
+            metrics: LinkMetrics to publish gauges and counters to.
+            on_alarm: Called as on_alarm(active, p95_seconds) when the alarm
+                is raised or cleared.
+        """
+        self.alarm_rtt = alarm_rtt
+        self.alarm_factor = alarm_factor
+        self.clear_ratio = clear_ratio
+        self.min_samples = min_samples
+        self.metrics = metrics
+        self.on_alarm = on_alarm
+        self.samples = collections.deque(maxlen=window)   # (rtt, offset) in seconds
+        self.alarm_active = False
+
+        # Statistics
+        self.pings_sent = 0
+        self.pongs_received = 0
+        self.alarms = 0
+        self.min_rtt = None
+        self.last_rtt = None
+
+    def stamp(self) -> int:
+        """The origin timestamp for the next ping."""
+        self.pings_sent += 1
+        if self.metrics is not None:
+            self.metrics.increment('pings_sent')
+        return time.time_ns()
+
+    def on_pong(self, payload, receive_ns: int = None):
+        """
+        Records a pong.
+
+        Args:
+            receive_ns: time.time_ns() when the pong arrived (default now).
+
+        Returns:
+            {'rtt', 'offset'} in seconds, or None for a malformed pong.
+        """
+        if receive_ns is None:
+            receive_ns = time.time_ns()
+        if len(payload) != PONG.size:
+            return None
+        origin, receive, transmit = PONG.unpack(payload)
+        rtt = max(0, (receive_ns - origin) - (transmit - receive)) / 1e9
+        offset = ((receive - origin) + (transmit - receive_ns)) / 2e9
+
+        self.pongs_received += 1
+        self.last_rtt = rtt
+        if self.min_rtt is None or rtt < self.min_rtt:
+            self.min_rtt = rtt
+        self.samples.append((rtt, offset))
+        self._check_alarm()
+        self._publish()
+        return {'rtt': rtt, 'offset': offset}
+
+    def percentiles(self) -> dict:
+        """p50/p95/p99 round trip over the window, in seconds (None without samples)."""
+        if not self.samples:
+            return {'p50': None, 'p95': None, 'p99': None}
+        ordered = sorted(rtt for rtt, _ in self.samples)
+        return {name: _percentile(ordered, percent)
+                for name, percent in (('p50', 50), ('p95', 95), ('p99', 99))}
+
+    @property
+    def offset(self):
+        """Rover clock minus laptop clock in seconds, from the best sample (None without samples)."""
+        if not self.samples:
+            return None
+        return min(self.samples)[1]
+
+    @property
+    def alarm_limit(self):
+        if self.alarm_rtt is not None:
+            return self.alarm_rtt
+        if self.min_rtt is None:
+            return None
+        return self.alarm_factor * self.min_rtt
+
+    def snapshot(self) -> dict:
+        data = self.percentiles()
+        data.update({
+            'last_rtt': self.last_rtt,
+            'min_rtt': self.min_rtt,
+            'offset': self.offset,
+            'pings_sent': self.pings_sent,
+            'pongs_received': self.pongs_received,
+            'alarm_active': self.alarm_active,
+            'alarms': self.alarms,
+        })
+        return data
+
+    def _check_alarm(self) -> None:
+        limit = self.alarm_limit
+        if limit is None or len(self.samples) < self.min_samples:
+            return
+        p95 = self.percentiles()['p95']
+        if not self.alarm_active and p95 > limit:
+            self.alarm_active = True
+            self.alarms += 1
+            if self.metrics is not None:
+                self.metrics.increment('latency_alarms')
+            if self.on_alarm is not None:
+                self.on_alarm(True, p95)
+        elif self.alarm_active and p95 < limit * self.clear_ratio:
+            self.alarm_active = False
+            if self.on_alarm is not None:
+                self.on_alarm(False, p95)
+
+    def _publish(self) -> None:
+        if self.metrics is None:
+            return
+        self.metrics.increment('pongs_received')
+        for name, value in self.percentiles().items():
+            self.metrics.set_gauge(f'rtt_{name}_seconds', value)
+        self.metrics.set_gauge('clock_offset_seconds', self.offset)
+        self.metrics.set_gauge('latency_alarm', 1.0 if self.alarm_active else 0.0)
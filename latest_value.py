@@ -0,0 +1,64 @@
+"""
+Latest-value mailbox: control commands that pile up are skipped, not queued.
+
+When the rover falls behind (a slow handler, a burst released by the radio
+after a fade), handling every motor command in turn means driving on input
+that is already out of date. Control packets are instead posted to a
+mailbox with one slot per channel; a newer command overwrites the one still
+waiting, and once the receive buffer has been drained only the newest
+command per channel is passed on:
+
+    for packet in decoder:                   # everything received so far
+        mailbox.put(packet['type'], packet['payload'])
+    for channel, payload in mailbox.drain():
+        handle(channel, payload)             # once per channel, newest only
+
+Overwritten commands are counted in `superseded` and, with a LinkMetrics
+object, in its 'superseded_commands' counter. Channels are delivered in the
+order they first received a command since the last drain.
+"""
+
+import threading
+
+
+class LatestValueMailbox:
+    def __init__(self, metrics=None, counter: str = 'superseded_commands'):
+        """
+        Args:
+            metrics: LinkMetrics whose counter is bumped for every command
+                overwritten before delivery.
+            counter: Name of that counter.
+        """
+        self.metrics = metrics
+        self.counter = counter
+        self._slots = {}
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.posted = 0
+        self.delivered = 0
+        self.superseded = 0
+
+    def put(self, channel, value) -> None:
+        """Posts a command, replacing any command on the channel not yet delivered."""
+        with self._lock:
+            replaced = channel in self._slots
+            self._slots[channel] = value
+            self.posted += 1
+            if replaced:
+                self.superseded += 1
+        if replaced and self.metrics is not None:
+            self.metrics.increment(self.counter)
+
+    def drain(self) -> list:
+        """Takes the newest command of every channel, as (channel, value) pairs."""
+        with self._lock:
+            if not self._slots:
+                return []
+            items = list(self._slots.items())
+            self._slots.clear()
+            self.delivered += len(items)
+        return items
+
+    def __len__(self) -> int:
+        return len(self._slots)
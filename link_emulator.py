@@ -0,0 +1,473 @@
+"""
+Emulated RFD-900x radio link, for testing without radios.
+
+Each direction of the link is modelled as the modem sees it:
+
+    serial in (baud) -> modem TX buffer -> air packets (air rate, overhead,
+    latency, drops, bit errors) -> serial out (baud)
+
+- Serial writes take len * 10 / baud seconds to reach the modem; a writer
+  that outruns the port blocks once OS_BUFFER_SIZE bytes are pending, like
+  a real serial driver.
+- The modem buffers up to tx_buffer_size bytes; anything beyond that is
+  lost (counted in tx_overflow_bytes), as with flow control disabled.
+- The buffer is sent in air packets of up to max_air_packet bytes, each
+  costing (bytes + air_overhead) * 8 / air_rate seconds of airtime, and
+  arrives latency seconds after it has been sent.
+- A whole air packet is lost with probability drop_rate. Bits are flipped
+  by a Gilbert-Elliott model: bit_error_rate normally, burst_bit_error_rate
+  inside bursts, which start with probability burst_rate per byte and last
+  burst_length bytes on average.
+
+LinkEmulator connects two in-process EmulatedSerial endpoints (laptop and
+rover) that behave like serial.Serial objects. PtyLinkEmulator connects two
+pseudo-terminals instead, so the unmodified scripts can open them: run
+
+    python link_emulator.py --ber 1e-5 --drop 0.01
+
+and point the scripts at the printed ports through the RFD_PORT
+environment variable, e.g. RFD_PORT=/dev/pts/5 python jetson_protocol_receiver.py
+
+Usage:
+    emulator = LinkEmulator(bit_error_rate=1e-5, seed=1)
+    emulator.start()
+    sender = emulator.laptop            # serial.Serial-like
+    receiver = emulator.rover
+    ...
+    emulator.stop()
+"""
+
+import argparse
+import collections
+import os
+import random
+import select
+import threading
+import time
+
+# RFD-900x defaults (SERIAL_SPEED=57, AIR_SPEED=64, ECC off)
+BAUD_RATE = 57600
+AIR_RATE = 64000            # Air data rate, bits per second
+AIR_OVERHEAD = 13           # Preamble, sync word, header and CRC per air packet, bytes
+MAX_AIR_PACKET = 252        # Payload bytes per air packet
+LATENCY = 0.002             # Radio and firmware latency per air packet, seconds
+TX_BUFFER_SIZE = 2048       # Modem transmit buffer, bytes
+OS_BUFFER_SIZE = 4096       # Serial driver buffer in front of the modem, bytes
+
+
+class ErrorModel:
+    """Gilbert-Elliott bit error model: a good state and a bursty bad state."""
+
+    def __init__(self, bit_error_rate: float = 0.0, burst_rate: float = 0.0,
+                 burst_length: float = 8.0, burst_bit_error_rate: float = 0.05,
+                 rng: random.Random = None):
+        """
+        Args:
+            bit_error_rate: Bit error rate outside bursts.
+            burst_rate: Probability per byte that a burst starts.
+            burst_length: Mean burst length in bytes.
+            burst_bit_error_rate: Bit error rate inside a burst.
+        """
+        self.bit_error_rate = bit_error_rate
+        self.burst_rate = burst_rate
+        self.burst_end_rate = 1.0 / max(burst_length, 1.0)
+        self.burst_bit_error_rate = burst_bit_error_rate
+        self.rng = rng or random.Random()
+        self.in_burst = False
+
+        # Statistics
+        self.bits_flipped = 0
+        self.bursts = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.bit_error_rate or self.burst_rate)
+
+    def corrupt(self, data: bytes) -> bytes:
+        """Returns data with bit errors applied."""
+        if not self.enabled:
+            return data
+        rng = self.rng
+        out = bytearray(data)
+        for index in range(len(out)):
+            if self.in_burst:
+                if rng.random() < self.burst_end_rate:
+                    self.in_burst = False
+            elif self.burst_rate and rng.random() < self.burst_rate:
+                self.in_burst = True
+                self.bursts += 1
+            rate = self.burst_bit_error_rate if self.in_burst else self.bit_error_rate
+            if rate:
+                for bit in range(8):
+                    if rng.random() < rate:
+                        out[index] ^= 1 << bit
+                        self.bits_flipped += 1
+        return bytes(out)
+
+
+class RadioLink:
+    """One direction of the link: serial in, modem, air, serial out."""
+
+    def __init__(self, deliver, baud_rate: int = BAUD_RATE, air_rate: int = AIR_RATE,
+                 air_overhead: int = AIR_OVERHEAD, max_air_packet: int = MAX_AIR_PACKET,
+                 latency: float = LATENCY, tx_buffer_size: int = TX_BUFFER_SIZE,
+                 os_buffer_size: int = OS_BUFFER_SIZE, drop_rate: float = 0.0,
+                 error_model: ErrorModel = None, rng: random.Random = None):
+        """
+        Args:
+            deliver: Called as deliver(bytes) from the link thread when bytes
+                come out of the far modem's serial port.
+        """
+        self.deliver = deliver
+        self.byte_rate = baud_rate / 10          # 8N1: 10 bits per byte
+        self.air_rate = air_rate
+        self.air_overhead = air_overhead
+        self.max_air_packet = max_air_packet
+        self.latency = latency
+        self.tx_buffer_size = tx_buffer_size
+        self.os_buffer_size = os_buffer_size
+        self.drop_rate = drop_rate
+        self.rng = rng or random.Random()
+        self.error_model = error_model or ErrorModel(rng=self.rng)
+
+        self._condition = threading.Condition()
+        self._incoming = collections.deque()     # (time reaching the modem, bytes)
+        self._tx_buffer = bytearray()
+        self._deliveries = collections.deque()   # (time out of the far modem, bytes)
+        self._serial_free_at = 0.0
+        self._air_free_at = 0.0
+        self._rx_free_at = 0.0
+        self._running = False
+        self._thread = None
+
+        # Statistics
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.tx_overflow_bytes = 0
+        self.air_packets = 0
+        self.air_packets_dropped = 0
+        self.airtime = 0.0
+
+    def send(self, data) -> None:
+        """Writes bytes into the serial port; blocks while the port is backed up."""
+        if not data:
+            return
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                start = max(now, self._serial_free_at)
+                pending = (start - now) * self.byte_rate
+                if pending == 0 or pending + len(data) <= self.os_buffer_size:
+                    break
+                self._condition.wait((pending + len(data) - self.os_buffer_size) / self.byte_rate)
+            self._serial_free_at = start + len(data) / self.byte_rate
+            self._incoming.append((self._serial_free_at, bytes(data)))
+            self.bytes_in += len(data)
+            self._condition.notify_all()
+
+    def start(self) -> None:
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'tx_overflow_bytes': self.tx_overflow_bytes,
+            'air_packets': self.air_packets,
+            'air_packets_dropped': self.air_packets_dropped,
+            'bits_flipped': self.error_model.bits_flipped,
+            'error_bursts': self.error_model.bursts,
+            'airtime_seconds': self.airtime,
+        }
+
+    def _transmit_locked(self, now: float) -> None:
+        """Sends one air packet from the TX buffer."""
+        size = min(len(self._tx_buffer), self.max_air_packet)
+        packet = bytes(self._tx_buffer[:size])
+        del self._tx_buffer[:size]
+
+        airtime = (size + self.air_overhead) * 8 / self.air_rate
+        self._air_free_at = now + airtime
+        self.air_packets += 1
+        self.airtime += airtime
+        if self.rng.random() < self.drop_rate:
+            self.air_packets_dropped += 1
+            return
+
+        packet = self.error_model.corrupt(packet)
+        arrival = self._air_free_at + self.latency
+        self._rx_free_at = max(arrival, self._rx_free_at) + size / self.byte_rate
+        self._deliveries.append((self._rx_free_at, packet))
+
+    def _run(self) -> None:
+        while True:
+            due = []
+            with self._condition:
+                if not self._running:
+                    return
+                now = time.monotonic()
+
+                # Serial port -> modem TX buffer
+                while self._incoming and self._incoming[0][0] <= now:
+                    _, chunk = self._incoming.popleft()
+                    room = self.tx_buffer_size - len(self._tx_buffer)
+                    if len(chunk) > room:
+                        self.tx_overflow_bytes += len(chunk) - room
+                        chunk = chunk[:room]
+                    self._tx_buffer += chunk
+                    self._condition.notify_all()     # Room in the serial port again
+
+                # Modem TX buffer -> air
+                if self._tx_buffer and now >= self._air_free_at:
+                    self._transmit_locked(now)
+
+                # Far modem -> serial out
+                while self._deliveries and self._deliveries[0][0] <= now:
+                    due.append(self._deliveries.popleft()[1])
+
+                if not due:
+                    wake = []
+                    if self._incoming:
+                        wake.append(self._incoming[0][0])
+                    if self._tx_buffer:
+                        wake.append(self._air_free_at)
+                    if self._deliveries:
+                        wake.append(self._deliveries[0][0])
+                    timeout = min(wake) - now if wake else None
+                    if timeout is None or timeout > 0:
+                        self._condition.wait(timeout)
+
+            for data in due:
+                self.bytes_out += len(data)
+                self.deliver(data)
+
+
+class EmulatedSerial:
+    """In-process stand-in for serial.Serial at one end of an emulated link."""
+
+    def __init__(self, port: str, timeout: float = 1.0):
+        self.port = port
+        self.timeout = timeout
+        self.is_open = True
+        self.link = None            # RadioLink carrying what this end writes
+        self._buffer = bytearray()
+        self._condition = threading.Condition()
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self._buffer)
+
+    def read(self, size: int = 1) -> bytes:
+        """Reads up to size bytes, waiting up to timeout for all of them."""
+        with self._condition:
+            if self.timeout is None:
+                self._condition.wait_for(lambda: len(self._buffer) >= size or not self.is_open)
+            elif self.timeout > 0:
+                self._condition.wait_for(lambda: len(self._buffer) >= size or not self.is_open,
+                                         self.timeout)
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            return data
+
+    def write(self, data) -> int:
+        self.link.send(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def reset_input_buffer(self) -> None:
+        with self._condition:
+            self._buffer.clear()
+
+    def close(self) -> None:
+        with self._condition:
+            self.is_open = False
+            self._condition.notify_all()
+
+    def _deliver(self, data: bytes) -> None:
+        with self._condition:
+            self._buffer += data
+            self._condition.notify_all()
+
+
+class LinkEmulator:
+    """Both directions of an emulated link between in-process endpoints."""
+
+    def __init__(self, bit_error_rate: float = 0.0, burst_rate: float = 0.0,
+                 burst_length: float = 8.0, burst_bit_error_rate: float = 0.05,
+                 seed: int = None, **link_options):
+        """
+        Args:
+            bit_error_rate, burst_rate, burst_length, burst_bit_error_rate:
+                See ErrorModel; the same for both directions.
+            seed: Makes drops and bit errors reproducible.
+            link_options: Passed to both RadioLinks (baud_rate, air_rate,
+                latency, tx_buffer_size, drop_rate, ...).
+        """
+        self.laptop = EmulatedSerial('emulated-laptop')
+        self.rover = EmulatedSerial('emulated-rover')
+
+        links = []
+        for index, deliver in enumerate((self._deliver_to_rover, self._deliver_to_laptop)):
+            rng = random.Random(None if seed is None else seed + index)
+            error_model = ErrorModel(bit_error_rate, burst_rate, burst_length,
+                                     burst_bit_error_rate, rng=rng)
+            links.append(RadioLink(deliver, error_model=error_model, rng=rng, **link_options))
+        self.uplink, self.downlink = links     # laptop -> rover, rover -> laptop
+        self.laptop.link = self.uplink
+        self.rover.link = self.downlink
+
+    def _deliver_to_rover(self, data: bytes) -> None:
+        self.rover._deliver(data)
+
+    def _deliver_to_laptop(self, data: bytes) -> None:
+        self.laptop._deliver(data)
+
+    def start(self) -> None:
+        self.uplink.start()
+        self.downlink.start()
+
+    def stop(self) -> None:
+        self.uplink.stop()
+        self.downlink.stop()
+        self.laptop.close()
+        self.rover.close()
+
+    def stats(self) -> dict:
+        return {'uplink': self.uplink.stats(), 'downlink': self.downlink.stats()}
+
+
+class PtyLinkEmulator(LinkEmulator):
+    """
+    The emulated link between two pseudo-terminals (POSIX only).
+
+    laptop_port and rover_port are device paths that any program can open
+    with serial.Serial.
+    """
+
+    def __init__(self, **options):
+        import pty
+        import tty
+
+        super().__init__(**options)
+        self._masters = []
+        self._slaves = []
+        for _ in range(2):
+            master, slave = pty.openpty()
+            tty.setraw(slave)
+            os.set_blocking(master, False)
+            self._masters.append(master)
+            self._slaves.append(slave)   # Kept open so the pty survives reconnects
+        self.laptop_port = os.ttyname(self._slaves[0])
+        self.rover_port = os.ttyname(self._slaves[1])
+        self._pumps = []
+
+        # Statistics
+        self.pty_overflow_bytes = 0      # Delivered while the reader was not keeping up
+
+    def _write_master(self, master: int, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            try:
+                written = os.write(master, view)
+            except BlockingIOError:
+                self.pty_overflow_bytes += len(view)
+                return
+            view = view[written:]
+
+    def _deliver_to_rover(self, data: bytes) -> None:
+        self._write_master(self._masters[1], data)
+
+    def _deliver_to_laptop(self, data: bytes) -> None:
+        self._write_master(self._masters[0], data)
+
+    def _pump(self, master: int, link: RadioLink) -> None:
+        """Moves what a program writes to its pty into the link."""
+        while self._pumping:
+            ready, _, _ = select.select([master], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                data = os.read(master, 4096)
+            except (BlockingIOError, OSError):
+                continue
+            link.send(data)
+
+    def start(self) -> None:
+        super().start()
+        self._pumping = True
+        for master, link in zip(self._masters, (self.uplink, self.downlink)):
+            thread = threading.Thread(target=self._pump, args=(master, link), daemon=True)
+            thread.start()
+            self._pumps.append(thread)
+
+    def stop(self) -> None:
+        self._pumping = False
+        for thread in self._pumps:
+            thread.join()
+        self._pumps = []
+        super().stop()
+        for fd in self._masters + self._slaves:
+            os.close(fd)
+        self._masters = []
+        self._slaves = []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emulate an RFD-900x link between two pseudo-terminals.")
+    parser.add_argument('--baud', type=int, default=BAUD_RATE, help="serial baud rate")
+    parser.add_argument('--air-rate', type=int, default=AIR_RATE, help="air data rate, bits/s")
+    parser.add_argument('--latency', type=float, default=LATENCY, help="latency per air packet, s")
+    parser.add_argument('--tx-buffer', type=int, default=TX_BUFFER_SIZE, help="modem TX buffer, bytes")
+    parser.add_argument('--ber', type=float, default=0.0, help="bit error rate")
+    parser.add_argument('--drop', type=float, default=0.0, help="air packet drop rate")
+    parser.add_argument('--burst-rate', type=float, default=0.0, help="error burst start probability per byte")
+    parser.add_argument('--burst-length', type=float, default=8.0, help="mean error burst length, bytes")
+    parser.add_argument('--burst-ber', type=float, default=0.05, help="bit error rate inside bursts")
+    parser.add_argument('--seed', type=int, default=None, help="random seed")
+    parser.add_argument('--stats-interval', type=float, default=10.0, help="seconds between statistics")
+    args = parser.parse_args()
+
+    emulator = PtyLinkEmulator(
+        bit_error_rate=args.ber, burst_rate=args.burst_rate, burst_length=args.burst_length,
+        burst_bit_error_rate=args.burst_ber, seed=args.seed, baud_rate=args.baud,
+        air_rate=args.air_rate, latency=args.latency, tx_buffer_size=args.tx_buffer,
+        drop_rate=args.drop)
+    emulator.start()
+
+    print("=" * 60)
+    print("Emulated RFD-900x link")
+    print("=" * 60)
+    print(f"Laptop side: {emulator.laptop_port}")
+    print(f"Rover side:  {emulator.rover_port}")
+    print()
+    print(f"  RFD_PORT={emulator.rover_port} python jetson_protocol_receiver.py")
+    print(f"  RFD_PORT={emulator.laptop_port} python laptop_protocol_sender.py")
+    print("-" * 60)
+
+    try:
+        while True:
+            time.sleep(args.stats_interval)
+            for name, stats in emulator.stats().items():
+                print(f"{name:>8}: {stats['bytes_in']} in, {stats['bytes_out']} out, "
+                      f"{stats['air_packets']} air packets ({stats['air_packets_dropped']} dropped), "
+                      f"{stats['bits_flipped']} bits flipped, {stats['tx_overflow_bytes']} overflowed")
+    except KeyboardInterrupt:
+        print("\nStopping emulator.")
+    finally:
+        emulator.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""
+Live link metrics for the sender and the receiver.
+
+LinkMetrics collects, while the link is running:
+- packets and payload bytes per packet type, for each direction
+- raw throughput (bytes on the wire) and goodput (payload bytes)
+- CRC errors, FEC corrections and garbage bytes skipped by the decoder
+- a histogram of sequence gaps (packets missed per gap) and of loss bursts
+  (gaps closer together than burst_spacing packets are merged)
+- inter-arrival jitter, smoothed like RFC 3550
+
+snapshot() returns everything as a plain dict; MetricsExporter writes it
+periodically as JSON or in the Prometheus text format (for the
+node_exporter textfile collector), so the numbers can be watched in the
+field while the link is under load.
+
+Usage:
+    metrics = LinkMetrics()
+    metrics.record_rx_bytes(len(data))              # raw bytes read
+    metrics.record_rx(packet['type'], packet['seq'], len(packet['payload']))
+    metrics.update_decoder(decoder)                  # CRC errors etc.
+
+    exporter = MetricsExporter(metrics, '/tmp/rover_link.prom', interval=5.0)
+    exporter.start()
+"""
+
+import collections
+import json
+import os
+import threading
+import time
+
+# Upper bounds of the histogram buckets (packets); the last bucket is open.
+GAP_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+RATE_WINDOW = 5.0       # Seconds of history used for the throughput rates
+
+
+def _bucket(value: int) -> str:
+    for bound in GAP_BUCKETS:
+        if value <= bound:
+            return str(bound)
+    return '+Inf'
+
+
+def _empty_histogram() -> dict:
+    histogram = {str(bound): 0 for bound in GAP_BUCKETS}
+    histogram['+Inf'] = 0
+    return histogram
+
+
+class _Direction:
+    """Counters for one direction of the link."""
+
+    def __init__(self):
+        self.packets = {}               # type -> count
+        self.payload_bytes = {}         # type -> bytes
+        self.raw_bytes = 0
+        self.total_payload = 0
+        self.samples = collections.deque()   # (time, raw total, payload total) for the rates
+
+    def add_sample(self, now: float) -> None:
+        self.samples.append((now, self.raw_bytes, self.total_payload))
+        self._prune(now)
+
+    def _prune(self, now: float) -> None:
+        # Keep the newest sample at or before the window's start as its baseline
+        cutoff = now - RATE_WINDOW
+        while len(self.samples) > 1 and self.samples[1][0] <= cutoff:
+            self.samples.popleft()
+
+    def rates(self, now: float) -> (float, float):
+        """(raw bytes/s, payload bytes/s) over the RATE_WINDOW seconds up to now."""
+        if not self.samples:
+            return 0.0, 0.0
+        self._prune(now)
+        start, raw_start, payload_start = self.samples[0]
+        # Measured up to now, so the rates fall to zero when the link goes idle
+        elapsed = min(now - start, RATE_WINDOW)
+        if elapsed <= 0:
+            return 0.0, 0.0
+        return (self.raw_bytes - raw_start) / elapsed, (self.total_payload - payload_start) / elapsed
+
+    def snapshot(self, now: float) -> dict:
+        raw_rate, goodput = self.rates(now)
+        return {
+            'packets': sum(self.packets.values()),
+            'payload_bytes': self.total_payload,
+            'raw_bytes': self.raw_bytes,
+            'raw_bytes_per_second': raw_rate,
+            'goodput_bytes_per_second': goodput,
+            'packets_by_type': {str(t): n for t, n in sorted(self.packets.items())},
+            'payload_bytes_by_type': {str(t): n for t, n in sorted(self.payload_bytes.items())},
+        }
+
+
+class LinkMetrics:
+    def __init__(self, burst_spacing: int = 4):
+        """
+        Args:
+            burst_spacing: Gaps separated by fewer than this many received
+                packets count as one loss burst.
+        """
+        self.burst_spacing = burst_spacing
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.rx = _Direction()
+        self.tx = _Direction()
+
+        # Decoder counters (copied from the StreamDecoder)
+        self.crc_errors = 0
+        self.corrected = 0
+        self.bytes_skipped = 0
+        self.version_errors = 0
+
+        # Sequence tracking
+        self.last_sequence = None
+        self.lost = 0
+        self.gap_histogram = _empty_histogram()
+        self.burst_histogram = _empty_histogram()
+        self.burst_lost = 0             # Packets lost in the bursts in burst_histogram
+        self.burst_length = 0           # Packets lost in the current burst
+        self.since_gap = 0              # Packets received since the last gap
+
+        # Inter-arrival jitter
+        self.last_arrival = None
+        self.last_interval = None
+        self.jitter = 0.0
+        self.mean_interval = 0.0
+
+        # Extra counters and gauges other components report (e.g.
+        # superseded commands, round-trip time percentiles)
+        self.counters = {}
+        self.gauges = {}
+
+    def record_rx_bytes(self, count: int) -> None:
+        """Raw bytes read from the port, including framing and garbage."""
+        with self.lock:
+            self.rx.raw_bytes += count
+            self.rx.add_sample(time.monotonic())
+
+    def record_tx_bytes(self, count: int) -> None:
+        """Raw bytes written to the port."""
+        with self.lock:
+            self.tx.raw_bytes += count
+            self.tx.add_sample(time.monotonic())
+
+    def record_tx(self, packet_type: int, payload_length: int, frame_length: int = None) -> None:
+        """A packet sent; frame_length (if given) also counts as raw bytes."""
+        with self.lock:
+            tx = self.tx
+            tx.packets[packet_type] = tx.packets.get(packet_type, 0) + 1
+            tx.payload_bytes[packet_type] = tx.payload_bytes.get(packet_type, 0) + payload_length
+            tx.total_payload += payload_length
+            if frame_length is not None:
+                tx.raw_bytes += frame_length
+            tx.add_sample(time.monotonic())
+
+    def record_rx(self, packet_type: int, sequence: int, payload_length: int) -> None:
+        """A packet received. sequence=None skips the gap tracking (e.g. reliable-channel messages)."""
+        now = time.monotonic()
+        with self.lock:
+            rx = self.rx
+            rx.packets[packet_type] = rx.packets.get(packet_type, 0) + 1
+            rx.payload_bytes[packet_type] = rx.payload_bytes.get(packet_type, 0) + payload_length
+            rx.total_payload += payload_length
+            rx.add_sample(now)
+
+            if sequence is not None:
+                self._track_sequence(sequence)
+            self._track_arrival(now)
+
+    def _track_sequence(self, sequence: int) -> None:
+        if self.last_sequence is not None:
+            missed = (sequence - self.last_sequence - 1) % 65536
+            # A huge "gap" means the sequence went backwards (e.g. the sender
+            # restarted); that is not a loss.
+            if 0 < missed < 32768:
+                self.lost += missed
+                self.gap_histogram[_bucket(missed)] += 1
+                if self.burst_length and self.since_gap >= self.burst_spacing:
+                    self._end_burst()
+                self.burst_length += missed
+                self.since_gap = 0
+        self.last_sequence = sequence
+        self.since_gap += 1
+        if self.burst_length and self.since_gap >= self.burst_spacing:
+            self._end_burst()
+
+    def _end_burst(self) -> None:
+        self.burst_histogram[_bucket(self.burst_length)] += 1
+        self.burst_lost += self.burst_length
+        self.burst_length = 0
+
+    def _track_arrival(self, now: float) -> None:
+        if self.last_arrival is not None:
+            interval = now - self.last_arrival
+            if self.last_interval is not None:
+                self.jitter += (abs(interval - self.last_interval) - self.jitter) / 16
+            self.mean_interval += (interval - self.mean_interval) / 16
+            self.last_interval = interval
+        self.last_arrival = now
+
+    def update_decoder(self, decoder) -> None:
+        """Copies the error counters of a protocol.StreamDecoder."""
+        with self.lock:
+            self.crc_errors = decoder.error_count
+            self.corrected = decoder.corrected_count
+            self.bytes_skipped = decoder.bytes_skipped
+            self.version_errors = decoder.version_errors
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        """Bumps a named extra counter."""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name: str, value: float) -> None:
+        """Sets a named extra gauge."""
+        with self.lock:
+            self.gauges[name] = value
+
+    def snapshot(self) -> dict:
+        """All metrics as a JSON-serializable dict."""
+        now = time.monotonic()
+        with self.lock:
+            received = sum(self.rx.packets.values())
+            frames = received + self.crc_errors
+            expected = received + self.lost
+            return {
+                'uptime_seconds': now - self.started,
+                'rx': self.rx.snapshot(now),
+                'tx': self.tx.snapshot(now),
+                'crc_errors': self.crc_errors,
+                'crc_error_rate': self.crc_errors / frames if frames else 0.0,
+                'fec_corrected': self.corrected,
+                'version_errors': self.version_errors,
+                'garbage_bytes_skipped': self.bytes_skipped,
+                'packets_lost': self.lost,
+                'loss_rate': self.lost / expected if expected else 0.0,
+                'sequence_gap_histogram': dict(self.gap_histogram),
+                'burst_loss_histogram': dict(self.burst_histogram),
+                'burst_loss_packets': self.burst_lost,
+                'jitter_seconds': self.jitter,
+                'mean_interarrival_seconds': self.mean_interval,
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self, prefix: str = 'rfd_link') -> str:
+        """The snapshot in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        declared = set()
+
+        def metric(name, value, kind='gauge', help_text='', labels=None):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f'# HELP {prefix}_{name} {help_text}')
+                lines.append(f'# TYPE {prefix}_{name} {kind}')
+            label_text = ''
+            if labels:
+                label_text = '{' + ','.join(f'{k}="{v}"' for k, v in labels.items()) + '}'
+            lines.append(f'{prefix}_{name}{label_text} {value}')
+
+        for direction in ('rx', 'tx'):
+            data = snapshot[direction]
+            labels = {'direction': direction}
+            metric('raw_bytes_total', data['raw_bytes'], 'counter', 'Bytes on the wire', labels)
+            metric('raw_bytes_per_second', f"{data['raw_bytes_per_second']:.1f}", 'gauge',
+                   'Raw throughput', labels)
+            metric('goodput_bytes_per_second', f"{data['goodput_bytes_per_second']:.1f}", 'gauge',
+                   'Payload throughput', labels)
+            for packet_type, count in data['packets_by_type'].items():
+                metric('packets_total', count, 'counter', 'Packets by type',
+                       {'direction': direction, 'type': packet_type})
+            for packet_type, count in data['payload_bytes_by_type'].items():
+                metric('payload_bytes_total', count, 'counter', 'Payload bytes by type',
+                       {'direction': direction, 'type': packet_type})
+
+        metric('crc_errors_total', snapshot['crc_errors'], 'counter', 'Frames dropped by the CRC check')
+        metric('crc_error_rate', f"{snapshot['crc_error_rate']:.6f}", 'gauge', 'CRC errors per frame')
+        metric('fec_corrected_total', snapshot['fec_corrected'], 'counter', 'Frames repaired by FEC')
+        metric('garbage_bytes_total', snapshot['garbage_bytes_skipped'], 'counter',
+               'Bytes skipped while looking for a frame')
+        metric('packets_lost_total', snapshot['packets_lost'], 'counter', 'Packets missing from the sequence')
+        metric('jitter_seconds', f"{snapshot['jitter_seconds']:.6f}", 'gauge', 'Inter-arrival jitter')
+
+        for name, key, sum_key, help_text in (
+                ('sequence_gap', 'sequence_gap_histogram', 'packets_lost', 'Packets missed per gap'),
+                ('burst_loss', 'burst_loss_histogram', 'burst_loss_packets', 'Packets lost per burst')):
+            lines.append(f'# HELP {prefix}_{name} {help_text}')
+            lines.append(f'# TYPE {prefix}_{name} histogram')
+            cumulative = 0
+            for bound, count in snapshot[key].items():
+                cumulative += count
+                lines.append(f'{prefix}_{name}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_{name}_sum {snapshot[sum_key]}')
+            lines.append(f'{prefix}_{name}_count {cumulative}')
+
+        for name, value in sorted(snapshot['counters'].items()):
+            metric(f'{name}_total', value, 'counter', name.replace('_', ' '))
+        for name, value in sorted(snapshot['gauges'].items()):
+            metric(name, f'{value:.6f}', 'gauge', name.replace('_', ' '))
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsExporter:
+    """Writes a LinkMetrics snapshot to a file every interval seconds."""
+
+    def __init__(self, metrics: LinkMetrics, path: str, interval: float = 5.0, format: str = None):
+        """
+        Args:
+            path: Output file. Written atomically (temp file + rename).
+            format: 'json' or 'prometheus'; by default '.json' files get JSON
+                and everything else the Prometheus text format.
+        """
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        if format is None:
+            format = 'json' if path.endswith('.json') else 'prometheus'
+        self.format = format
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def write(self) -> None:
+        """Writes one snapshot now."""
+        text = self.metrics.to_json() if self.format == 'json' else self.metrics.to_prometheus()
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as f:
+            f.write(text)
+        os.replace(temporary, self.path)
+
+    def start(self) -> None:
+        """Starts the background writer thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the writer thread after one final write."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.write()
+        self.write()
@@ -0,0 +1,195 @@
+"""
+Token-bucket pacing of frames to the RFD-900x's real capacity.
+
+A serial write returns as soon as the bytes reach the modem, so a sender
+that writes as fast as it is asked fills the modem's transmit buffer and
+every later command waits behind it, adding seconds of latency. The Pacer
+instead spends tokens worth each frame's time on the link before the frame
+is written, so frames leave at the rate the radio can actually carry them
+and the modem queue stays shallow; the backlog builds up in the sender,
+where the TxScheduler can still reorder and supersede it.
+
+A frame's cost is the longer of its serial time (10 bits per byte) and its
+airtime (payload plus per-air-packet overhead at the air data rate). Tokens
+are seconds of link time and refill at `rate` (a fraction of the link, 1.0
+= flat out), up to `burst` seconds.
+
+The rate adapts like a delay-based congestion controller:
+
+    queueing delay = round trip - shortest round trip seen recently
+
+- queueing delay above target_delay, or a loss, cuts the rate by
+  `decrease` (at most once per round trip, so one cut can take effect
+  before the next);
+- otherwise each round-trip sample raises it by `increase`, up to max_rate.
+
+Round trips come from pongs (latency.py), so adaptation needs pings to be
+sent regularly (PING_INTERVAL); without samples the rate stays fixed.
+
+Usage:
+    pacer = Pacer(baud_rate=57600)
+    pacer.acquire(len(frame))                   # sleeps until the frame may go
+    ser.write(frame)
+
+    pacer.on_rtt(rtt_seconds)                   # on every pong
+    pacer.on_loss()                             # on every retransmission
+"""
+
+import collections
+import threading
+import time
+
+import protocol
+
+# RFD-900x defaults (SERIAL_SPEED=57, AIR_SPEED=64, ECC off)
+BAUD_RATE = 57600
+AIR_RATE = 64000            # Air data rate, bits per second
+AIR_OVERHEAD = 13           # Preamble, sync word, header and CRC per air packet, bytes
+MAX_AIR_PACKET = 252        # Payload bytes per air packet
+
+
+def frame_cost(length: int, baud_rate: int = BAUD_RATE, air_rate: int = AIR_RATE,
+               air_overhead: int = AIR_OVERHEAD, max_air_packet: int = MAX_AIR_PACKET) -> float:
+    """
+    Time a frame of length bytes occupies the link, in seconds: the longer
+    of its serial time and its airtime.
+    """
+    serial_time = length * 10 / baud_rate
+    air_packets = max(1, -(-length // max_air_packet))
+    airtime = (length + air_packets * air_overhead) * 8 / air_rate
+    return max(serial_time, airtime)
+
+
+class Pacer:
+    def __init__(self, baud_rate: int = BAUD_RATE, air_rate: int = AIR_RATE,
+                 air_overhead: int = AIR_OVERHEAD, max_air_packet: int = MAX_AIR_PACKET,
+                 rate: float = 0.9, min_rate: float = 0.1, max_rate: float = 0.95,
+                 burst: float = 0.05, target_delay: float = 0.05, increase: float = 0.02,
+                 decrease: float = 0.8, rtt_window: int = 50, metrics=None):
+        """
+        Args:
+            rate: Starting rate, as a fraction of the link's capacity.
+            min_rate, max_rate: Limits for the adapted rate.
+            burst: Bucket depth in seconds of link time; at least one
+                full-size frame. This is roughly how much the modem may
+                have queued at once.
+            target_delay: Queueing delay (seconds of round trip above the
+                shortest) tolerated before the rate is cut.
+            increase: Added to the rate per round-trip sample without
+                excess delay.
+            decrease: Factor the rate is cut by on excess delay or loss.
+            rtt_window: Round-trip samples the shortest round trip is taken
+                from, so a changed path is picked up again.
+            metrics: LinkMetrics to publish gauges and counters to.
+        """
+        self.link = dict(baud_rate=baud_rate, air_rate=air_rate, air_overhead=air_overhead,
+                         max_air_packet=max_air_packet)
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = max(burst, frame_cost(protocol.MAX_PACKET_SIZE, **self.link))
+        self.target_delay = target_delay
+        self.increase = increase
+        self.decrease = decrease
+        self.metrics = metrics
+
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+        self.rtts = collections.deque(maxlen=rtt_window)
+        self.queue_delay = None
+        self._last_cut = 0.0
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.frames = 0
+        self.delayed = 0
+        self.wait_time = 0.0
+        self.cuts = 0
+
+        self._publish()
+
+    @property
+    def capacity(self) -> float:
+        """Bytes per second the link carries flat out, in full air packets."""
+        size = self.link['max_air_packet']
+        return size / frame_cost(size, **self.link)
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, length: int) -> float:
+        """
+        Takes the tokens for a frame of length bytes, going into debt if
+        there are not enough.
+
+        Returns:
+            Seconds to wait before writing the frame (0 if it may go now).
+        """
+        cost = frame_cost(length, **self.link)
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= cost
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            self.frames += 1
+            if wait:
+                self.delayed += 1
+                self.wait_time += wait
+        return wait
+
+    def acquire(self, length: int) -> float:
+        """Waits until a frame of length bytes may be written; returns the time waited."""
+        wait = self.reserve(length)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def on_rtt(self, rtt: float) -> None:
+        """Adapts the rate to a measured round trip (seconds)."""
+        with self._lock:
+            self.rtts.append(rtt)
+            self.queue_delay = rtt - min(self.rtts)
+            if self.queue_delay > self.target_delay:
+                self._cut(rtt)
+            else:
+                self._set_rate(self.rate + self.increase)
+        self._publish()
+
+    def on_loss(self) -> None:
+        """Cuts the rate after lost frames (e.g. ARQ retransmissions)."""
+        with self._lock:
+            self._cut(min(self.rtts) if self.rtts else 0.0)
+        self._publish()
+
+    def _cut(self, interval: float) -> None:
+        now = time.monotonic()
+        if now - self._last_cut < interval:
+            return
+        self._last_cut = now
+        self.cuts += 1
+        if self.metrics is not None:
+            self.metrics.increment('pacing_rate_cuts')
+        self._set_rate(self.rate * self.decrease)
+
+    def _set_rate(self, rate: float) -> None:
+        # Settle the tokens earned at the old rate first
+        self._refill(time.monotonic())
+        self.rate = min(self.max_rate, max(self.min_rate, rate))
+
+    def snapshot(self) -> dict:
+        return {
+            'rate': self.rate,
+            'bytes_per_second': self.rate * self.capacity,
+            'queue_delay': self.queue_delay,
+            'frames': self.frames,
+            'delayed': self.delayed,
+            'wait_time': self.wait_time,
+            'cuts': self.cuts,
+        }
+
+    def _publish(self) -> None:
+        if self.metrics is None:
+            return
+        self.metrics.set_gauge('pacing_rate', self.rate)
+        if self.queue_delay is not None:
+            self.metrics.set_gauge('pacing_queue_delay_seconds', self.queue_delay)
@@ -0,0 +1,349 @@
+"""
+Non-blocking packet log.
+
+Printing from the packet handlers puts the terminal on the hot path: on the
+Jetson console a few print() calls per packet take longer than the radio
+needs to deliver the next packet. PacketLog instead packs every event into
+a fixed-size binary record in a preallocated ring buffer, and a background
+thread formats the records for the console and/or appends them unformatted
+to a log file. A handler never waits for stdout: if the writer falls behind
+and the ring fills up, new records are dropped and counted.
+
+Verbosity is a level threshold (DEBUG, INFO, WARNING, ERROR). With
+sample_every=N only one packet in N is logged below WARNING: call
+begin_packet() once per packet, and every INFO/DEBUG record up to the next
+call follows that packet's decision, so the lines of one packet stay
+together. Warnings and errors are always logged.
+
+Record layout (little-endian, SLOT_SIZE bytes):
+    d   timestamp (time.time())
+    B   level
+    B   event (see EVENTS)
+    B   packet type
+    B   data bytes used
+    H   sequence number
+    I   length (payload or frame bytes)
+    I   number (packet count, missed packets, ...)
+    3f  values (motor speeds, sensor readings, ...)
+    DATA_SIZE bytes of data (text, the start of a frame, ...)
+
+Log files start with FILE_HEADER and are pretty-printed offline with:
+
+    python packet_log.py rover.log [--level debug]
+
+Usage:
+    log = PacketLog(level=INFO, sample_every=10, path='rover.log')
+    log.start()
+    log.begin_packet()
+    log.log(EVENT_MOTOR, v0=left, v1=right)
+    log.stop()
+"""
+
+import argparse
+import datetime
+import struct
+import sys
+import threading
+import time
+
+import protocol
+
+# Levels, numbered like the logging module's
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {DEBUG: 'debug', INFO: 'info', WARNING: 'warning', ERROR: 'error'}
+
+RECORD_STRUCT = struct.Struct('<dBBBBHII3f')
+SLOT_SIZE = 64
+DATA_SIZE = SLOT_SIZE - RECORD_STRUCT.size    # 30 bytes
+
+FILE_MAGIC = b'PLOG'
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct('<4sHH')          # magic, version, slot size
+
+DEFAULT_CAPACITY = 4096     # Records in the ring buffer (256 KiB)
+FLUSH_INTERVAL = 0.05       # Seconds between writer passes
+
+# Events
+EVENT_RX = 1
+EVENT_RX_RELIABLE = 2
+EVENT_SEQUENCE_GAP = 3
+EVENT_CRC_ERROR = 4
+EVENT_PING = 5
+EVENT_MOTOR = 6
+EVENT_TEXT = 7
+EVENT_SENSOR = 8
+EVENT_REASSEMBLED = 9
+EVENT_UNKNOWN = 10
+EVENT_LENGTH_ERROR = 11
+EVENT_TX = 12
+EVENT_TX_HEX = 13
+EVENT_CONTROLLER = 14
+EVENT_ARDUINO = 15
+EVENT_PONG = 16
+EVENT_LATENCY_ALARM = 17
+EVENT_LATENCY_OK = 18
+
+
+def _format_controller(record: dict) -> str:
+    state = protocol.decode_controller(record['data'])
+    if state is None:
+        return "Received: (truncated controller record)"
+    return (f"Received: "
+            f"L-stick({state['left_x']:.2f},{state['left_y']:.2f}) | "
+            f"R-stick({state['right_x']:.2f},{state['right_y']:.2f}) | "
+            f"L1:{state['l1']} R1:{state['r1']} L2:{state['l2']:.2f} R2:{state['r2']:.2f} | "
+            f"X:{state['cross']} O:{state['circle']} □:{state['square']} △:{state['triangle']}")
+
+
+# Event -> (name, default level, format string or function(record) -> str).
+# Format strings see the record fields: type, seq, length, number, v0-v2,
+# text (data as UTF-8) and hex (data as hex).
+EVENTS = {
+    EVENT_RX: ('rx', INFO,
+               "\n[PACKET #{number}] Type={type}, Seq={seq}, Payload={length} bytes"),
+    EVENT_RX_RELIABLE: ('rx_reliable', INFO,
+                        "\n[PACKET #{number}] Type={type}, Reliable Seq={seq}, Payload={length} bytes"),
+    EVENT_SEQUENCE_GAP: ('sequence_gap', WARNING,
+                         "  WARNING: Missed {number} packet(s)! Expected seq={v0:.0f}, got seq={seq}"),
+    EVENT_CRC_ERROR: ('crc_error', WARNING,
+                      "\n[ERROR #{number}] {v0:.0f} corrupted packet(s) dropped, "
+                      "{length} bytes skipped in this read"),
+    EVENT_PING: ('ping', INFO, "  PING received (payload: {length} bytes)"),
+    EVENT_MOTOR: ('motor', INFO, "  MOTOR COMMAND: Left={v0:+.2f}, Right={v1:+.2f}"),
+    EVENT_TEXT: ('text', INFO, "  TEXT MESSAGE: '{text}'"),
+    EVENT_SENSOR: ('sensor', INFO,
+                   "  SENSOR DATA: Temp={v0:.1f}°C, Humidity={v1:.1f}%, Pressure={v2:.2f}hPa"),
+    EVENT_REASSEMBLED: ('reassembled', INFO,
+                        "  REASSEMBLED: Type={type}, Message ID={seq}, {length} bytes"),
+    EVENT_UNKNOWN: ('unknown', WARNING, "  UNKNOWN TYPE: {type}\n  Raw payload: {hex}"),
+    EVENT_LENGTH_ERROR: ('length_error', WARNING,
+                         "  ERROR: Expected {number} bytes for type {type}, got {length}"),
+    EVENT_TX: ('tx', INFO, "[SENT] Type: {type}, Seq: {seq}, Frame: {length} bytes"),
+    EVENT_TX_HEX: ('tx_hex', DEBUG, "       Hex: {hex}"),
+    EVENT_CONTROLLER: ('controller', INFO, _format_controller),
+    EVENT_ARDUINO: ('arduino', INFO, "→ Sent {number} to Arduino"),
+    EVENT_PONG: ('pong', INFO,
+                 "[PONG] Seq: {seq}, RTT: {v0:.1f} ms (p95 {v1:.1f} ms), clock offset: {v2:+.1f} ms"),
+    EVENT_LATENCY_ALARM: ('latency_alarm', WARNING,
+                          "[LATENCY ALARM] p95 round trip {v0:.1f} ms, limit {v1:.1f} ms"),
+    EVENT_LATENCY_OK: ('latency_ok', INFO, "[LATENCY OK] p95 round trip back to {v0:.1f} ms"),
+}
+
+# Default level by event code, for a list lookup in log()
+EVENT_LEVELS = [INFO] * 256
+for _event, (_name, _level, _format) in EVENTS.items():
+    EVENT_LEVELS[_event] = _level
+
+
+def parse_record(buffer, offset: int = 0) -> dict:
+    """Unpacks the record in the slot at offset."""
+    (timestamp, level, event, packet_type, data_length, seq,
+     length, number, v0, v1, v2) = RECORD_STRUCT.unpack_from(buffer, offset)
+    start = offset + RECORD_STRUCT.size
+    data = bytes(buffer[start:start + data_length])
+    truncated = length > data_length and event != EVENT_CONTROLLER
+    return {
+        'time': timestamp, 'level': level, 'event': event, 'type': packet_type,
+        'seq': seq, 'length': length, 'number': number,
+        'v0': v0, 'v1': v1, 'v2': v2, 'data': data,
+        'text': data.decode('utf-8', 'replace') + ('...' if truncated else ''),
+        'hex': data.hex(' ') + (' ...' if truncated else ''),
+    }
+
+
+def iter_records(buffer):
+    """Yields the records of a buffer of whole slots."""
+    for offset in range(0, len(buffer) - SLOT_SIZE + 1, SLOT_SIZE):
+        yield parse_record(buffer, offset)
+
+
+def format_record(record: dict) -> str:
+    """The console text for a record."""
+    entry = EVENTS.get(record['event'])
+    if entry is None:
+        return f"  (unknown log event {record['event']})"
+    template = entry[2]
+    if callable(template):
+        return template(record)
+    return template.format(**record)
+
+
+def read_log(path: str):
+    """Yields the records of a log file written by PacketLog."""
+    with open(path, 'rb') as f:
+        header = f.read(FILE_HEADER.size)
+        if len(header) < FILE_HEADER.size:
+            return
+        magic, version, slot_size = FILE_HEADER.unpack(header)
+        if magic != FILE_MAGIC or version != FILE_VERSION or slot_size != SLOT_SIZE:
+            raise ValueError(f"{path} is not a version {FILE_VERSION} packet log")
+        # A record cut short by a crash is ignored by iter_records
+        yield from iter_records(f.read())
+
+
+class PacketLog:
+    def __init__(self, level: int = INFO, sample_every: int = 1, path: str = None,
+                 stream=sys.stdout, capacity: int = DEFAULT_CAPACITY,
+                 flush_interval: float = FLUSH_INTERVAL):
+        """
+        Args:
+            level: Records below this level are discarded immediately.
+            sample_every: Log one packet in N below WARNING (see begin_packet).
+            path: Binary log file the raw records are appended to.
+            stream: Where formatted records are printed; None for no console output.
+            capacity: Ring buffer size in records.
+            flush_interval: Seconds between writer passes.
+        """
+        self.level = level
+        self.sample_every = max(1, sample_every)
+        self.path = path
+        self.stream = stream
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+
+        self._buffer = bytearray(capacity * SLOT_SIZE)
+        self._view = memoryview(self._buffer)
+        self._head = 0          # Records written
+        self._tail = 0          # Records taken by the writer
+        self._lock = threading.Lock()
+        self._drain_lock = threading.Lock()
+        self._packets = 0
+        self._sampled = True
+
+        self._file = None
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Statistics
+        self.written = 0        # Records handed to the outputs
+        self.dropped = 0        # Records lost because the ring was full
+        self.sampled_out = 0    # Records skipped by sampling
+
+    def enabled(self, level: int) -> bool:
+        """True if a record at this level would currently be kept."""
+        return level >= self.level and (level >= WARNING or self._sampled)
+
+    def begin_packet(self) -> bool:
+        """
+        Starts a new packet for sampling.
+
+        Returns:
+            True if this packet's INFO/DEBUG records are logged.
+        """
+        self._sampled = self._packets % self.sample_every == 0
+        self._packets += 1
+        return self._sampled
+
+    def log(self, event: int, packet_type: int = 0, seq: int = 0, length: int = 0,
+            number: int = 0, v0: float = 0.0, v1: float = 0.0, v2: float = 0.0,
+            data=b'', level: int = None) -> bool:
+        """
+        Adds a record to the ring buffer. Never blocks on the outputs.
+
+        Args:
+            event: One of the EVENT_* codes.
+            data: Bytes kept with the record; only the first DATA_SIZE are stored.
+            level: Overrides the event's default level.
+
+        Returns:
+            True if the record was stored.
+        """
+        if level is None:
+            level = EVENT_LEVELS[event]
+        if level < self.level:
+            return False
+        if level < WARNING and not self._sampled:
+            self.sampled_out += 1
+            return False
+
+        data_length = min(len(data), DATA_SIZE)
+        with self._lock:
+            if self._head - self._tail >= self.capacity:
+                self.dropped += 1
+                return False
+            offset = (self._head % self.capacity) * SLOT_SIZE
+            RECORD_STRUCT.pack_into(self._buffer, offset, time.time(), level, event,
+                                    packet_type, data_length, seq, length, number, v0, v1, v2)
+            if data_length:
+                start = offset + RECORD_STRUCT.size
+                self._view[start:start + data_length] = data[:data_length]
+            self._head += 1
+        return True
+
+    def flush(self) -> int:
+        """
+        Writes out every buffered record now.
+
+        Returns:
+            The number of records written.
+        """
+        with self._drain_lock:
+            with self._lock:
+                count = self._head - self._tail
+                if not count:
+                    return 0
+                start = (self._tail % self.capacity) * SLOT_SIZE
+                end = start + count * SLOT_SIZE
+                if end <= len(self._buffer):
+                    chunk = bytes(self._view[start:end])
+                else:
+                    chunk = bytes(self._view[start:]) + bytes(self._view[:end - len(self._buffer)])
+                self._tail = self._head
+
+            if self._file is not None:
+                self._file.write(chunk)
+                self._file.flush()
+            if self.stream is not None:
+                lines = [format_record(record) for record in iter_records(chunk)]
+                self.stream.write('\n'.join(lines) + '\n')
+                self.stream.flush()
+            self.written += count
+            return count
+
+    def start(self) -> None:
+        """Opens the log file and starts the background writer thread."""
+        if self.path and self._file is None:
+            self._file = open(self.path, 'ab')
+            if self._file.tell() == 0:
+                self._file.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, SLOT_SIZE))
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the writer thread after writing out everything buffered."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pretty-print a binary packet log.")
+    parser.add_argument('path', help="log file written by PacketLog")
+    parser.add_argument('--level', choices=list(LEVEL_NAMES.values()), default='debug',
+                        help="lowest level to show")
+    args = parser.parse_args()
+    minimum = {name: level for level, name in LEVEL_NAMES.items()}[args.level]
+
+    for record in read_log(args.path):
+        if record['level'] < minimum:
+            continue
+        stamp = datetime.datetime.fromtimestamp(record['time']).strftime('%H:%M:%S.%f')[:-3]
+        for line in format_record(record).strip('\n').splitlines():
+            print(f"{stamp} {line}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,49 +1,90 @@
+import atexit
 import serial
+import sys
+import os
 
-PORT = '/dev/tinyUSB0'
+# Add the repository root to the path to import the shared protocol modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import protocol
+from serial_reader import SerialReader
+from controller_codec import ControllerDeltaDecoder
+from capture import CaptureWriter
+from latest_value import LatestValueMailbox
+import packet_log
+
+PORT = os.environ.get('RFD_PORT', '/dev/tinyUSB0')
 BAUD = 57600
+LOG_LEVEL = packet_log.INFO  # packet_log.WARNING silences the per-sample lines
+LOG_SAMPLE_EVERY = 1  # Print one sample in N
+LOG_PATH = None  # e.g. 'controller.log'; view it with: python packet_log.py controller.log
+CAPTURE_PATH = None  # e.g. 'controller.cap'; replay it with: python capture.py controller.cap --replay controller
 
 ser = serial.Serial(PORT, BAUD, timeout=1)
 print(f"Listening on {PORT} at {BAUD} baud for controller data...\n")
 
+# Blocks until data arrives instead of spinning on ser.in_waiting
+reader = SerialReader(ser)
+decoder = protocol.StreamDecoder()
+
+# Per-sample lines are printed by a background thread, never from this loop
+log = packet_log.PacketLog(level=LOG_LEVEL, sample_every=LOG_SAMPLE_EVERY, path=LOG_PATH)
+log.start()
+atexit.register(log.stop)
+
+# Records the raw serial stream with arrival times
+capture = CaptureWriter(CAPTURE_PATH) if CAPTURE_PATH else None
+if capture is not None:
+    atexit.register(capture.close)
+
+# Rebuilds the full controller state from keyframes and deltas
+controller = ControllerDeltaDecoder()
+request_sequence = 0
+
+# Every packet is decoded (deltas build on each other), but of the samples in
+# one read only the newest is acted on; stale ones are skipped, not queued
+commands = LatestValueMailbox()
+
 while True:
-    if ser.in_waiting > 0: # Checks that something actually arrived before trying to read it.
-        data = ser.readline().decode('utf-8', errors='ignore').strip()
-        if not data:
-            continue
+    data = reader.read()
+    if capture is not None:
+        capture.write(data)
+    decoder.feed(data)
+
+    for packet in decoder:
+        # Unpack all controller inputs (axes as floats, buttons as 0/1)
+        state = controller.decode(packet)
 
-        parts = data.split(',')
-        if len(parts) != 12: # Helps to prevent information that doens't contain 12 inputs from being read
+        if controller.keyframe_needed:
+            # A controller packet went missing, ask the sender for a full state
+            ser.write(protocol.pack(protocol.TYPE_KEYFRAME_REQUEST, request_sequence, b''))
+            request_sequence = (request_sequence + 1) % 65536
+            controller.keyframe_needed = False
+
+        if state is None: # Not a controller packet, or no keyframe received yet
             continue
+        commands.put(protocol.TYPE_CONTROLLER, (packet, state))
+
+    for _, (packet, state) in commands.drain():
+        left_x = state['left_x']
+        left_y = state['left_y']
+        right_x = state['right_x']
+        right_y = state['right_y']
+        l1 = state['l1']
+        r1 = state['r1']
+        l2 = state['l2']
+        r2 = state['r2']
+        cross = state['cross']
+        circle = state['circle']
+        square = state['square']
+        triangle = state['triangle']
 
-        # Convert
-        # Unpack all controller inputs
-        left_x, left_y, right_x, right_y, l1, r1, l2, r2, cross, circle, square, triangle = parts
-
-        # Convert analogs to floats and buttons to ints
-        left_x = float(left_x)
-        left_y = float(left_y)
-        right_x = float(right_x)
-        right_y = float(right_y)
-        l1 = int(l1)
-        r1 = int(r1)
-        l2 = float(l2)
-        r2 = float(r2)
-        cross = int(cross)
-        circle = int(circle)
-        square = int(square)
-        triangle = int(triangle)
-        
         # Example robot control logic:
         #if cross:  # Cross button pressed
             #print("→ Start motors")
         #if circle:  # Circle button pressed
             #print("→ Stop motors")
 
-        print(
-        f"Received: "
-        f"L-stick({left_x:.2f},{left_y:.2f}) | "
-        f"R-stick({right_x:.2f},{right_y:.2f}) | "
-        f"L1:{l1} R1:{r1} L2:{l2:.2f} R2:{r2:.2f} | "
-        f"X:{cross} O:{circle} □:{square} △:{triangle}"
-    )
\ No newline at end of file
+        log.begin_packet()
+        if log.enabled(packet_log.INFO):  # Skip encoding a sample that is not logged
+            log.log(packet_log.EVENT_CONTROLLER, protocol.TYPE_CONTROLLER, packet['seq'],
+                    len(packet['payload']), data=protocol.encode_controller(state))
\ No newline at end of file
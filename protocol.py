@@ -1,10 +1,17 @@
 import struct 
-import crcmod
+import crc16
+import compression
+import reed_solomon as rs
+import schema
 
 # This is the unique key to start off the packet. 
 START_OF_FRAME = b'\x1A\xCF'
+# Start of an FEC-protected frame, see pack_fec().
+START_OF_FRAME_FEC = b'\x1A\xCE'
 
-crc16_func = crcmod.predefined.mkCrcFun('kermit')
+# CRC-16/Kermit over any bytes-like object. Uses crcmod when it is installed
+# and a table-driven pure Python implementation otherwise (see crc16.py).
+crc16_func = crc16.crc16
 
 
 # Define the structure formats for packing and unpacking using Python's struct module.
@@ -17,6 +24,112 @@ HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
 SOF_SIZE = len(START_OF_FRAME)
 CRC_SIZE = 2 # CRC-16 is 2 bytes
 
+# Precompiled versions of the formats above so the hot paths don't re-parse
+# the format string on every packet.
+HEADER_STRUCT = struct.Struct(HEADER_FORMAT)
+CRC_STRUCT = struct.Struct('>H')
+
+# Smallest possible frame: SOF + header + CRC with an empty payload.
+MIN_PACKET_SIZE = SOF_SIZE + HEADER_SIZE + CRC_SIZE
+MAX_PAYLOAD_SIZE = 255
+MAX_PACKET_SIZE = MIN_PACKET_SIZE + MAX_PAYLOAD_SIZE
+
+# FEC frames: after the SOF, a 3-byte preamble (parity bytes per block,
+# payload length, check byte) tells the receiver how long the frame is
+# before anything has been corrected.
+FEC_PREAMBLE_STRUCT = struct.Struct('>BBB')
+FEC_PREAMBLE_SIZE = FEC_PREAMBLE_STRUCT.size
+DEFAULT_FEC_SYMBOLS = 8   # Parity bytes per block, corrects up to 4 bad bytes
+MAX_FEC_SYMBOLS = 64
+
+# Packet types.
+TYPE_PING = 0
+TYPE_MOTOR = 1
+TYPE_TEXT = 2
+TYPE_SENSOR = 3
+
+TYPE_CONTROLLER = 4           # Full controller state (also used as the keyframe)
+TYPE_CONTROLLER_DELTA = 5     # Changed controller fields only, see controller_codec.py
+TYPE_KEYFRAME_REQUEST = 6     # Receiver -> sender: please send a full controller state
+TYPE_CONTAINER = 7            # Several small messages in one frame, see coalesce.py
+TYPE_RELIABLE = 8             # Message on the reliable channel, see arq.py
+TYPE_ACK = 9                  # Reliable channel acknowledgement
+TYPE_NACK = 10                # Reliable channel retransmit request
+TYPE_FRAGMENT = 11            # Part of a message over 255 bytes, see fragment.py
+TYPE_PONG = 12                # Rover -> laptop: ping echo with the rover's timestamps, see latency.py
+
+# Type byte layout: bits 0-4 type ID, bits 5-6 schema version (see SCHEMA),
+# bit 7 compressed flag. Packers add the version bits; decoders check them
+# and return just the type ID.
+TYPE_ID_MASK = 0x1F
+VERSION_SHIFT = 5
+VERSION_MASK = 0x60
+# Bit 7 marks a payload compressed with the shared dictionary (see compression.py).
+COMPRESSED_FLAG = 0x80
+FLAGS_MASK = VERSION_MASK | COMPRESSED_FLAG
+
+# Types that compress_payload() tries to shrink: text, and the frames that
+# carry batches of messages (containers of telemetry, reliable messages,
+# fragments). A single 12-byte sensor reading never shrinks, and motor and
+# controller commands are tiny and latency critical.
+COMPRESSIBLE_TYPES = frozenset({TYPE_TEXT, TYPE_CONTAINER, TYPE_RELIABLE, TYPE_FRAGMENT})
+
+# Layout of every fixed-size payload, compiled into encoders and decoders by
+# schema.py. Both ends of the link use these definitions. Bump the version
+# whenever a layout changes: frames from the other version are then dropped
+# (and counted) instead of being misread.
+SCHEMA = {
+    'version': 0,
+    'messages': {
+        # Timestamps are time.time_ns() on the clock of the end that took
+        # them. An empty ping (older senders) is still accepted, just not echoed.
+        'ping': {'type': TYPE_PING, 'fields': [
+            {'name': 'origin', 'type': 'u64'},          # Laptop, when sent
+        ]},
+        'pong': {'type': TYPE_PONG, 'fields': [
+            {'name': 'origin', 'type': 'u64'},          # Copied from the ping
+            {'name': 'receive', 'type': 'u64'},         # Rover, ping received
+            {'name': 'transmit', 'type': 'u64'},        # Rover, pong sent
+        ]},
+        'motor': {'type': TYPE_MOTOR, 'fields': [
+            {'name': 'left', 'type': 'f32'},
+            {'name': 'right', 'type': 'f32'},
+        ]},
+        'sensor': {'type': TYPE_SENSOR, 'fields': [
+            {'name': 'temperature', 'type': 'f32'},
+            {'name': 'humidity', 'type': 'f32'},
+            {'name': 'pressure', 'type': 'f32'},
+        ]},
+        # Gamepad state: six axes quantized to int8 (-127..127 maps to
+        # -1.0..1.0) followed by one byte of button bits. 7 bytes in total.
+        'controller': {'type': TYPE_CONTROLLER, 'fields': [
+            {'name': axis, 'type': 'i8', 'scale': 127, 'min': -1.0, 'max': 1.0}
+            for axis in ('left_x', 'left_y', 'right_x', 'right_y', 'l2', 'r2')
+        ] + [
+            {'name': 'buttons', 'type': 'bits',
+             'bits': ['l1', 'r1', 'cross', 'circle', 'square', 'triangle']},
+        ]},
+    },
+}
+MESSAGES = schema.compile_schema(SCHEMA)
+SCHEMA_VERSION = SCHEMA['version']
+VERSION_BITS = SCHEMA_VERSION << VERSION_SHIFT
+
+# Codecs for the raw stored values, shared by the sender and the receiver.
+PING_STRUCT = MESSAGES['ping'].struct          # Origin timestamp
+PONG_STRUCT = MESSAGES['pong'].struct          # Origin, receive and transmit timestamps
+MOTOR_STRUCT = MESSAGES['motor'].struct        # Left speed, Right speed
+SENSOR_STRUCT = MESSAGES['sensor'].struct      # Temperature, Humidity, Pressure
+CONTROLLER_STRUCT = MESSAGES['controller'].struct   # '>6bB'
+CONTROLLER_BUTTONS = tuple(SCHEMA['messages']['controller']['fields'][-1]['bits'])  # Bit 0 first
+CONTROLLER_AXES = MESSAGES['controller'].names[:-len(CONTROLLER_BUTTONS)]
+
+# Payload codec for each fixed-layout packet type: the compiled schema
+# messages, which pack and unpack scaled values (e.g. controller axes as
+# floats). The sender packs with these and dispatch.Dispatcher unpacks with
+# them. Types not listed (text, containers, ...) have variable payloads.
+PAYLOAD_CODECS = {message.type_id: message for message in MESSAGES.values()}
+
 
 def pack(packet_type: int, sequence_number: int, payload: bytes) -> bytes:
     """
@@ -37,23 +150,192 @@ def pack(packet_type: int, sequence_number: int, payload: bytes) -> bytes:
 
     # Pack the header fields.
     payload_length = len(payload)
-    header = struct.pack(HEADER_FORMAT, packet_type, sequence_number, payload_length)
+    header = HEADER_STRUCT.pack(packet_type | VERSION_BITS, sequence_number, payload_length)
 
-    # Combine header and payload to calculate checksum.
-    data_to_checksum = header + payload
-    
-    # Calculate the CRC-16 checksum.
-    checksum = crc16_func(data_to_checksum)
+    # Calculate the CRC-16 checksum incrementally over header and payload.
+    checksum = crc16_func(payload, crc16_func(header))
     
     # Pack the checksum into 2 bytes (big-endian).
     packed_checksum = struct.pack('>H', checksum)
 
     # Construct the final packet.
-    full_packet = START_OF_FRAME + data_to_checksum + packed_checksum
+    full_packet = START_OF_FRAME + header + payload + packed_checksum
 
     return full_packet
 
 
+def pack_into(buf: bytearray, offset: int, packet_type: int, sequence_number: int, payload) -> int:
+    """
+    Packs a complete packet directly into a caller-owned buffer, without
+    creating any intermediate bytes objects.
+
+    Args:
+        buf: A writable buffer (e.g. a preallocated bytearray of MAX_PACKET_SIZE).
+        offset: Where in buf the packet starts.
+        packet_type: An integer ID (0-255) for the packet.
+        sequence_number: An integer sequence number (0-65535).
+        payload: The byte payload to be sent (0-255 bytes), any bytes-like object.
+
+    Returns:
+        The total packet length written to buf[offset:].
+        Returns None if the payload is too large.
+    """
+    payload_length = len(payload)
+    if payload_length > MAX_PAYLOAD_SIZE:
+        print(f"Error: Payload size {payload_length} is greater than the maximum of 255 bytes.")
+        return None
+
+    payload_start = offset + SOF_SIZE + HEADER_SIZE
+    payload_end = payload_start + payload_length
+    buf[payload_start:payload_end] = payload
+    return _finish_frame(buf, offset, packet_type, sequence_number, payload_length)
+
+
+def pack_struct_into(buf: bytearray, offset: int, packet_type: int, sequence_number: int,
+                     codec: struct.Struct, *values) -> int:
+    """
+    Packs a packet whose payload is encoded by a precompiled struct.Struct
+    (e.g. MOTOR_STRUCT), writing the payload values straight into buf.
+
+    Returns:
+        The total packet length written to buf[offset:].
+    """
+    codec.pack_into(buf, offset + SOF_SIZE + HEADER_SIZE, *values)
+    return _finish_frame(buf, offset, packet_type, sequence_number, codec.size)
+
+
+def _finish_frame(buf, offset: int, packet_type: int, sequence_number: int, payload_length: int) -> int:
+    """Writes SOF, header and CRC around a payload already placed in buf."""
+    header_start = offset + SOF_SIZE
+    payload_end = header_start + HEADER_SIZE + payload_length
+
+    buf[offset:header_start] = START_OF_FRAME
+    HEADER_STRUCT.pack_into(buf, header_start, packet_type | VERSION_BITS, sequence_number, payload_length)
+
+    with memoryview(buf) as view:
+        checksum = crc16_func(view[header_start:payload_end])
+    CRC_STRUCT.pack_into(buf, payload_end, checksum)
+
+    return payload_end + CRC_SIZE - offset
+
+
+def compress_payload(packet_type: int, payload) -> (int, bytes):
+    """
+    Compresses a payload if its type is in COMPRESSIBLE_TYPES and the result
+    is smaller.
+
+    Returns:
+        (packet_type, payload): with COMPRESSED_FLAG set and the compressed
+        bytes, or the arguments unchanged.
+    """
+    if packet_type in COMPRESSIBLE_TYPES and payload:
+        compressed = compression.compress(payload)
+        if compressed is not None:
+            return packet_type | COMPRESSED_FLAG, compressed
+    return packet_type, payload
+
+
+def pack_compressed(packet_type: int, sequence_number: int, payload: bytes) -> bytes:
+    """Like pack(), but compresses the payload when that makes it smaller."""
+    packet_type, payload = compress_payload(packet_type, payload)
+    return pack(packet_type, sequence_number, payload)
+
+
+def _unwrap(packet_type: int, payload):
+    """
+    Slow path for a received type byte with flag bits other than the
+    current schema version: decompresses the payload if needed.
+
+    Returns:
+        (type ID, payload), or None if the frame is from another schema
+        version or its compressed payload is corrupt.
+    """
+    if packet_type & VERSION_MASK != VERSION_BITS:
+        return None
+    if packet_type & COMPRESSED_FLAG:
+        try:
+            payload = compression.decompress(payload)
+        except compression.CompressionError:
+            return None
+    return packet_type & TYPE_ID_MASK, payload
+
+
+def _fec_preamble_check(nsym: int, payload_length: int) -> int:
+    return crc16_func(bytes((nsym, payload_length))) & 0xFF
+
+
+def pack_fec(packet_type: int, sequence_number: int, payload: bytes, nsym: int = DEFAULT_FEC_SYMBOLS) -> bytes:
+    """
+    Packs a packet in FEC mode: header + payload + CRC are protected by
+    Reed-Solomon parity, so up to nsym // 2 corrupted bytes per block are
+    corrected at the receiver instead of the whole frame being dropped.
+
+    Frame layout:
+        START_OF_FRAME_FEC (2 bytes)
+        nsym, payload length, check byte (3 bytes)
+        header + payload + CRC-16, split into blocks of up to 255 - nsym
+        bytes, each followed by its nsym parity bytes
+
+    The overhead is 13 + nsym bytes per block (vs. 8 for a plain frame).
+    unpack_all(), iter_packets() and StreamDecoder accept both frame kinds.
+
+    Returns:
+        The full FEC frame, or None if the payload is too large.
+    """
+    if len(payload) > MAX_PAYLOAD_SIZE:
+        print(f"Error: Payload size {len(payload)} is greater than the maximum of 255 bytes.")
+        return None
+    if not 0 < nsym < MAX_FEC_SYMBOLS:
+        raise ValueError(f"nsym must be between 1 and {MAX_FEC_SYMBOLS - 1}")
+
+    header = HEADER_STRUCT.pack(packet_type | VERSION_BITS, sequence_number, len(payload))
+    checksum = crc16_func(payload, crc16_func(header))
+    data = header + payload + CRC_STRUCT.pack(checksum)
+
+    frame = bytearray(START_OF_FRAME_FEC)
+    frame += FEC_PREAMBLE_STRUCT.pack(nsym, len(payload), _fec_preamble_check(nsym, len(payload)))
+    block_data_size = rs.MAX_CODEWORD_SIZE - nsym
+    for block_start in range(0, len(data), block_data_size):
+        block = data[block_start:block_start + block_data_size]
+        frame += block
+        frame += rs.encode(block, nsym)
+    return bytes(frame)
+
+
+def fec_frame_size(payload_length: int, nsym: int = DEFAULT_FEC_SYMBOLS) -> int:
+    """Returns the size of the frame pack_fec() builds for a payload of payload_length bytes."""
+    data_length = HEADER_SIZE + payload_length + CRC_SIZE
+    blocks = -(-data_length // (rs.MAX_CODEWORD_SIZE - nsym))
+    return SOF_SIZE + FEC_PREAMBLE_STRUCT.size + data_length + blocks * nsym
+
+
+def encode_controller(state: dict) -> bytes:
+    """
+    Encodes a gamepad state into a Type 4 payload.
+
+    Args:
+        state: A dictionary with a float for every name in CONTROLLER_AXES
+            and a truthy/falsy value for every name in CONTROLLER_BUTTONS.
+
+    Returns:
+        The 7-byte payload, ready for pack(TYPE_CONTROLLER, ...).
+    """
+    return MESSAGES['controller'].encode(state)
+
+
+def decode_controller(payload) -> dict:
+    """
+    Decodes a Type 4 payload back into a gamepad state.
+
+    Returns:
+        A dictionary with floats for the axes and 0/1 for the buttons, or
+        None if the payload has the wrong length.
+    """
+    if len(payload) != CONTROLLER_STRUCT.size:
+        return None
+    return MESSAGES['controller'].decode(payload)
+
+
 def unpack(buffer: bytes) -> (dict, int):
     """
     Unpacks a packet from a byte buffer.
@@ -77,42 +359,45 @@ def unpack(buffer: bytes) -> (dict, int):
         # No SOF found, the buffer does not contain a valid packet start.
         return None, 0 # Consume 0 bytes, no packet found
 
-    # Adjust buffer to start at the SOF
-    buffer = buffer[sof_index:]
-    
     # 2. Check if the buffer is long enough for a minimal packet (header + CRC, 0-len payload)
-    if len(buffer) < SOF_SIZE + HEADER_SIZE + CRC_SIZE:
+    # All offsets below are relative to the start of the buffer so that nothing
+    # is copied until the payload itself is extracted.
+    if len(buffer) - sof_index < SOF_SIZE + HEADER_SIZE + CRC_SIZE:
         # Not enough data for a full header and CRC yet.
         return None, sof_index # Consume bytes up to the potential SOF
 
     # 3. Unpack the header to find the payload length.
-    header_start = SOF_SIZE
-    header_end = SOF_SIZE + HEADER_SIZE
-    packet_type, sequence_number, payload_length = struct.unpack(HEADER_FORMAT, buffer[header_start:header_end]) # >BHB
+    header_start = sof_index + SOF_SIZE
+    header_end = header_start + HEADER_SIZE
+    packet_type, sequence_number, payload_length = HEADER_STRUCT.unpack_from(buffer, header_start) # >BHB
     
     # 4. Check if the buffer contains the full declared packet.
     expected_packet_size = SOF_SIZE + HEADER_SIZE + payload_length + CRC_SIZE # note that payload length is variable extracted. 
-    if len(buffer) < expected_packet_size:
+    if len(buffer) - sof_index < expected_packet_size:
         # The full packet has not arrived yet.
         return None, sof_index # Consume bytes up to the potential SOF
 
     # 5. Extract the data and checksum from the buffer.
     payload_start = header_end
     payload_end = payload_start + payload_length
-    payload = buffer[payload_start:payload_end]
+    payload = bytes(buffer[payload_start:payload_end])
 
-    checksum_start = payload_end
-    checksum_end = checksum_start + CRC_SIZE
-    received_checksum, = struct.unpack('>H', buffer[checksum_start:checksum_end])
+    received_checksum, = CRC_STRUCT.unpack_from(buffer, payload_end)
 
     # 6. Verify the checksum.
-    data_to_checksum = buffer[header_start:payload_end] # This is header + payload
+    data_to_checksum = memoryview(buffer)[header_start:payload_end] # This is header + payload
     calculated_checksum = crc16_func(data_to_checksum)
+    data_to_checksum.release()
     
     if received_checksum == calculated_checksum:
         # Checksum is valid, Packet is good.
+        if packet_type & FLAGS_MASK != VERSION_BITS:
+            unwrapped = _unwrap(packet_type, payload)
+            if unwrapped is None:
+                return None, expected_packet_size + sof_index
+            packet_type, payload = unwrapped
         unpacked_data = {
-            'type': packet_type,
+            'type': packet_type & TYPE_ID_MASK,
             'seq': sequence_number,
             'payload': payload
         }
@@ -123,3 +408,380 @@ def unpack(buffer: bytes) -> (dict, int):
         # We consume up to the end of this corrupted packet to look for the next one.
         print(f"Checksum mismatch! Received: {received_checksum}, Calculated: {calculated_checksum}")
         return None, expected_packet_size + sof_index
+
+
+def verify_packets(packets) -> list:
+    """
+    Checks the CRC of a list of complete packets (as returned by pack()) in
+    one batch, vectorized with NumPy when it is available.
+
+    Returns:
+        A list of booleans, True where the packet's checksum is valid.
+    """
+    return crc16.verify_many(packets, start=SOF_SIZE)
+
+
+# Results of scanning a buffer for a single frame, see _scan_frame().
+FRAME_INCOMPLETE = 0  # No complete frame yet; resume scanning at next_pos.
+FRAME_OK = 1          # Valid frame.
+FRAME_BAD_CRC = 2     # Complete frame whose checksum did not match (or FEC could not fix).
+FRAME_CORRECTED = 3   # Valid FEC frame after correcting some bytes.
+
+SOF_PREFIX = START_OF_FRAME[:1]
+SOF_MARKER = START_OF_FRAME[1]
+FEC_SOF_MARKER = START_OF_FRAME_FEC[1]
+
+
+def _scan_frame(buffer, pos: int, end: int) -> tuple:
+    """
+    Scans buffer[pos:end] for the next frame (plain or FEC).
+
+    Plain frames are parsed and checked in place without copying anything.
+
+    Returns:
+        A tuple (status, sof_index, next_pos, packet_type, sequence_number,
+        payload_start, payload_end, source). next_pos is where scanning should
+        resume: just after the frame for FRAME_OK / FRAME_CORRECTED, or the
+        first byte that still has to be kept for FRAME_INCOMPLETE. For
+        FRAME_BAD_CRC it is the end of the would-be frame, but callers resume
+        at sof_index + 1: the SOF may have been a false match in noise, and
+        its bogus length must not swallow the real frames behind it.
+        sof_index is -1 when no Start of Frame was found.
+        The payload is source[payload_start:payload_end]; source is the
+        buffer itself except for FEC frames that needed correcting.
+    """
+    while True:
+        sof_index = buffer.find(SOF_PREFIX, pos, end)
+        if sof_index == -1:
+            return FRAME_INCOMPLETE, -1, end, None, None, None, None, None
+        if end - sof_index < SOF_SIZE:
+            # Could be the first half of a SOF.
+            return FRAME_INCOMPLETE, sof_index, sof_index, None, None, None, None, None
+
+        marker = buffer[sof_index + 1]
+        if marker == SOF_MARKER:
+            break
+        if marker == FEC_SOF_MARKER:
+            result = _scan_fec_frame(buffer, sof_index, end)
+            if result is not None:
+                return result
+        pos = sof_index + 1
+
+    if end - sof_index < MIN_PACKET_SIZE:
+        return FRAME_INCOMPLETE, sof_index, sof_index, None, None, None, None, None
+
+    header_start = sof_index + SOF_SIZE
+    packet_type, sequence_number, payload_length = HEADER_STRUCT.unpack_from(buffer, header_start)
+
+    packet_size = MIN_PACKET_SIZE + payload_length
+    if end - sof_index < packet_size:
+        return FRAME_INCOMPLETE, sof_index, sof_index, None, None, None, None, None
+
+    payload_start = header_start + HEADER_SIZE
+    payload_end = payload_start + payload_length
+    received_checksum, = CRC_STRUCT.unpack_from(buffer, payload_end)
+
+    with memoryview(buffer) as view:
+        calculated_checksum = crc16_func(view[header_start:payload_end])
+
+    status = FRAME_OK if received_checksum == calculated_checksum else FRAME_BAD_CRC
+    return (status, sof_index, sof_index + packet_size,
+            packet_type, sequence_number, payload_start, payload_end, buffer)
+
+
+def _scan_fec_frame(buffer, sof_index: int, end: int):
+    """
+    Parses the FEC frame starting at sof_index, see pack_fec().
+
+    Returns:
+        A _scan_frame() result tuple, or None if the preamble is invalid
+        (the SOF was a false match and scanning should continue after it).
+    """
+    preamble_start = sof_index + SOF_SIZE
+    if end - preamble_start < FEC_PREAMBLE_SIZE:
+        return FRAME_INCOMPLETE, sof_index, sof_index, None, None, None, None, None
+
+    nsym, payload_length, check = FEC_PREAMBLE_STRUCT.unpack_from(buffer, preamble_start)
+    if check != _fec_preamble_check(nsym, payload_length) or not 0 < nsym < MAX_FEC_SYMBOLS:
+        return None
+
+    data_size = HEADER_SIZE + payload_length + CRC_SIZE
+    block_data_size = rs.MAX_CODEWORD_SIZE - nsym
+    block_count = -(-data_size // block_data_size)
+    body_start = preamble_start + FEC_PREAMBLE_SIZE
+    frame_end = body_start + data_size + block_count * nsym
+    if end < frame_end:
+        return FRAME_INCOMPLETE, sof_index, sof_index, None, None, None, None, None
+
+    with memoryview(buffer) as view:
+        if block_count == 1:
+            # Fast path: if the CRC matches, nothing needs correcting.
+            data_end = body_start + data_size
+            received_checksum, = CRC_STRUCT.unpack_from(buffer, data_end - CRC_SIZE)
+            if crc16_func(view[body_start:data_end - CRC_SIZE]) == received_checksum:
+                packet_type, sequence_number, header_length = HEADER_STRUCT.unpack_from(buffer, body_start)
+                if header_length == payload_length:
+                    payload_start = body_start + HEADER_SIZE
+                    return (FRAME_OK, sof_index, frame_end, packet_type, sequence_number,
+                            payload_start, payload_start + payload_length, buffer)
+
+        # Correct every block and reassemble header + payload + CRC.
+        data = bytearray()
+        corrected = 0
+        position = body_start
+        remaining = data_size
+        try:
+            while remaining:
+                block_size = min(remaining, block_data_size)
+                block, block_corrected = rs.decode(view[position:position + block_size + nsym], nsym)
+                data += block
+                corrected += block_corrected
+                position += block_size + nsym
+                remaining -= block_size
+        except rs.ReedSolomonError:
+            return FRAME_BAD_CRC, sof_index, frame_end, None, None, None, None, None
+
+    packet_type, sequence_number, header_length = HEADER_STRUCT.unpack_from(data, 0)
+    received_checksum, = CRC_STRUCT.unpack_from(data, data_size - CRC_SIZE)
+    if header_length != payload_length or crc16_func(data[:data_size - CRC_SIZE]) != received_checksum:
+        return FRAME_BAD_CRC, sof_index, frame_end, packet_type, sequence_number, None, None, None
+
+    status = FRAME_CORRECTED if corrected else FRAME_OK
+    return (status, sof_index, frame_end, packet_type, sequence_number,
+            HEADER_SIZE, HEADER_SIZE + payload_length, data)
+
+
+def iter_packets(buffer, start: int = 0):
+    """
+    Yields every complete, CRC-valid packet in the buffer in one pass.
+
+    Corrupted frames and garbage between frames are skipped silently; use
+    unpack_all() if they need to be reported. Payloads are zero-copy
+    memoryviews into the buffer.
+
+    Args:
+        buffer: The received bytes (bytes, bytearray or memoryview).
+        start: Offset to start scanning from.
+
+    Yields:
+        Dictionaries with 'type', 'seq' and 'payload', like unpack().
+    """
+    pos = start
+    end = len(buffer)
+    while True:
+        status, sof_index, pos, packet_type, sequence_number, payload_start, payload_end, source = _scan_frame(buffer, pos, end)
+        if status == FRAME_INCOMPLETE:
+            return
+        if status == FRAME_BAD_CRC:
+            pos = sof_index + 1
+            continue
+        payload = memoryview(source)[payload_start:payload_end]
+        if packet_type & FLAGS_MASK != VERSION_BITS:
+            unwrapped = _unwrap(packet_type, payload)
+            if unwrapped is None:
+                continue
+            packet_type, payload = unwrapped
+        yield {
+            'type': packet_type & TYPE_ID_MASK,
+            'seq': sequence_number,
+            'payload': payload
+        }
+
+
+def unpack_all(buffer, start: int = 0) -> (list, int, list):
+    """
+    Unpacks every complete packet from a byte buffer in one call.
+
+    Args:
+        buffer: The received bytes (bytes, bytearray or memoryview).
+        start: Offset to start scanning from.
+
+    Returns:
+        A tuple containing:
+        1. A list of packet dictionaries ('type', 'seq', 'payload') in the
+           order they appear. Payloads are memoryviews into the buffer.
+        2. The number of bytes consumed from the buffer (counted from 0). The
+           caller can drop buffer[:bytes_consumed]; anything after it is an
+           incomplete frame that needs more data.
+        3. A list of error dictionaries ('offset', 'length', 'type', 'seq'),
+           one for each frame that was dropped because of a CRC mismatch
+           (or a compressed payload that would not decompress, or a
+           different schema version).
+    """
+    packets = []
+    errors = []
+    pos = start
+    end = len(buffer)
+    while True:
+        status, sof_index, next_pos, packet_type, sequence_number, payload_start, payload_end, source = _scan_frame(buffer, pos, end)
+        if status == FRAME_INCOMPLETE:
+            return packets, next_pos, errors
+        payload = None
+        if status != FRAME_BAD_CRC:
+            payload = memoryview(source)[payload_start:payload_end]
+            if packet_type & FLAGS_MASK != VERSION_BITS:
+                unwrapped = _unwrap(packet_type, payload)
+                payload = None if unwrapped is None else unwrapped[1]
+        if payload is not None:
+            packets.append({
+                'type': packet_type & TYPE_ID_MASK,
+                'seq': sequence_number,
+                'payload': payload
+            })
+        else:
+            errors.append({
+                'offset': sof_index,
+                'length': next_pos - sof_index,
+                'type': packet_type,
+                'seq': sequence_number
+            })
+        pos = sof_index + 1 if status == FRAME_BAD_CRC else next_pos
+
+
+class StreamDecoder:
+    """
+    Stateful, incremental packet decoder for a continuous byte stream.
+
+    Bytes read from the serial port are appended to a single reusable
+    bytearray and parsed in place from a read cursor, so every received byte
+    is copied at most once no matter how much backlog builds up. Consumed
+    bytes are only discarded (compacted) once they make up a large share of
+    the buffer, which keeps the total work linear in the number of bytes fed.
+
+    Decoded packets use the same dict layout as unpack(), except that the
+    'payload' is a memoryview into the internal buffer. Payload views are only
+    valid until the next call to feed(); copy them with bytes() if they need
+    to be kept around. Compressed payloads (COMPRESSED_FLAG) are returned
+    already decompressed, as bytes. 'type' is always the bare type ID.
+
+    Usage:
+        decoder = StreamDecoder()
+        decoder.feed(ser.read(ser.in_waiting))
+        packet = decoder.next_packet()
+    """
+
+    # Compact once at least this many consumed bytes sit in front of the cursor.
+    COMPACT_THRESHOLD = 4096
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._start = 0          # Read cursor: first byte not yet consumed.
+        self._views = []         # Payload views handed out since the last feed().
+
+        # Running statistics.
+        self.packet_count = 0
+        self.error_count = 0     # Frames dropped because of a CRC mismatch.
+        self.corrected_count = 0 # FEC frames repaired instead of dropped.
+        self.version_errors = 0  # Frames from another schema version, dropped.
+        self.bytes_skipped = 0   # Bytes skipped while looking for a SOF, bad frames included.
+
+    def __len__(self):
+        """Number of buffered bytes that have not been consumed yet."""
+        return len(self._buffer) - self._start
+
+    def feed(self, data) -> None:
+        """Append newly received bytes to the decoder."""
+        self._release_views()
+
+        if self._start and (self._start >= self.COMPACT_THRESHOLD
+                            or self._start * 2 >= len(self._buffer)):
+            self._compact()
+
+        try:
+            self._buffer += data
+        except BufferError:
+            # A caller still holds a view derived from an old payload, so the
+            # bytearray cannot be resized. Move the unread tail to a new one.
+            self._buffer = bytearray(memoryview(self._buffer)[self._start:])
+            self._start = 0
+            self._buffer += data
+
+    def next_packet(self):
+        """
+        Decode the next complete, CRC-valid packet from the buffered data.
+
+        Returns:
+            A dictionary with 'type', 'seq' and 'payload' (a memoryview), or
+            None if no complete packet is available yet. Corrupted frames are
+            skipped and counted in error_count.
+        """
+        buffer = self._buffer
+        end = len(buffer)
+
+        while True:
+            status, sof_index, next_pos, packet_type, sequence_number, payload_start, payload_end, source = _scan_frame(buffer, self._start, end)
+
+            # Everything between the cursor and the frame (or resume point) is garbage.
+            garbage_end = next_pos if sof_index == -1 else sof_index
+            self.bytes_skipped += garbage_end - self._start
+            self._start = next_pos
+
+            if status == FRAME_INCOMPLETE:
+                return None
+
+            if status == FRAME_BAD_CRC:
+                # The rest of the frame is skipped as garbage on the rescan
+                self.error_count += 1
+                self.bytes_skipped += 1
+                self._start = sof_index + 1
+                continue
+
+            payload = memoryview(source)[payload_start:payload_end]
+            if packet_type & FLAGS_MASK != VERSION_BITS:
+                # Another schema version, or compressed: never a view of ours.
+                unwrapped = _unwrap(packet_type, payload)
+                payload.release()
+                if unwrapped is None:
+                    if packet_type & VERSION_MASK != VERSION_BITS:
+                        self.version_errors += 1
+                    else:
+                        self.error_count += 1
+                    continue
+                packet_type, payload = unwrapped
+            else:
+                self._views.append(payload)
+
+            if status == FRAME_CORRECTED:
+                self.corrected_count += 1
+            self.packet_count += 1
+            return {
+                'type': packet_type & TYPE_ID_MASK,
+                'seq': sequence_number,
+                'payload': payload
+            }
+
+    def drain(self) -> list:
+        """
+        Decode every complete packet currently buffered.
+
+        Returns:
+            A list of packet dictionaries (possibly empty). Payload views are
+            valid until the next call to feed().
+        """
+        packets = []
+        packet = self.next_packet()
+        while packet is not None:
+            packets.append(packet)
+            packet = self.next_packet()
+        return packets
+
+    def __iter__(self):
+        """Iterate over the packets currently buffered, see drain()."""
+        packet = self.next_packet()
+        while packet is not None:
+            yield packet
+            packet = self.next_packet()
+
+    def _release_views(self):
+        """Release payload views handed out since the last feed()."""
+        for view in self._views:
+            view.release()
+        self._views.clear()
+
+    def _compact(self):
+        """Drop the consumed bytes in front of the read cursor."""
+        try:
+            del self._buffer[:self._start]
+        except BufferError:
+            self._buffer = bytearray(memoryview(self._buffer)[self._start:])
+        self._start = 0
@@ -0,0 +1,237 @@
+"""
+Reed-Solomon error correction over GF(2^8), used by the FEC frame mode in
+protocol.py.
+
+A codeword is up to 255 bytes: the message followed by nsym parity bytes.
+Up to nsym // 2 corrupted bytes anywhere in the codeword can be corrected.
+
+Field: primitive polynomial 0x11D, generator 2, first consecutive root 0
+(the common "QR code" parameters, compatible with the reedsolo package).
+
+Based on the "Reed-Solomon codes for coders" tutorial on Wikiversity.
+"""
+
+PRIMITIVE_POLY = 0x11D
+MAX_CODEWORD_SIZE = 255
+
+
+class ReedSolomonError(Exception):
+    """Raised when a codeword has more errors than can be corrected."""
+
+
+# Exponent / logarithm tables. GF_EXP is doubled so products need no modulo.
+GF_EXP = [0] * 512
+GF_LOG = [0] * 256
+
+
+def _init_tables():
+    x = 1
+    for i in range(255):
+        GF_EXP[i] = x
+        GF_LOG[x] = i
+        x <<= 1
+        if x & 0x100:
+            x ^= PRIMITIVE_POLY
+    for i in range(255, 512):
+        GF_EXP[i] = GF_EXP[i - 255]
+
+
+_init_tables()
+
+
+def gf_mul(x: int, y: int) -> int:
+    if x == 0 or y == 0:
+        return 0
+    return GF_EXP[GF_LOG[x] + GF_LOG[y]]
+
+
+def gf_div(x: int, y: int) -> int:
+    if y == 0:
+        raise ZeroDivisionError()
+    if x == 0:
+        return 0
+    return GF_EXP[(GF_LOG[x] + 255 - GF_LOG[y]) % 255]
+
+
+def gf_pow(x: int, power: int) -> int:
+    return GF_EXP[(GF_LOG[x] * power) % 255]
+
+
+def gf_inverse(x: int) -> int:
+    return GF_EXP[255 - GF_LOG[x]]
+
+
+def gf_poly_scale(p: list, x: int) -> list:
+    return [gf_mul(coefficient, x) for coefficient in p]
+
+
+def gf_poly_add(p: list, q: list) -> list:
+    result = [0] * max(len(p), len(q))
+    for i, coefficient in enumerate(p):
+        result[i + len(result) - len(p)] = coefficient
+    for i, coefficient in enumerate(q):
+        result[i + len(result) - len(q)] ^= coefficient
+    return result
+
+
+def gf_poly_mul(p: list, q: list) -> list:
+    result = [0] * (len(p) + len(q) - 1)
+    for j, q_coefficient in enumerate(q):
+        if q_coefficient == 0:
+            continue
+        for i, p_coefficient in enumerate(p):
+            result[i + j] ^= gf_mul(p_coefficient, q_coefficient)
+    return result
+
+
+def gf_poly_eval(poly: list, x: int) -> int:
+    """Evaluates a polynomial (highest degree first) at x with Horner's scheme."""
+    y = poly[0]
+    for coefficient in poly[1:]:
+        y = gf_mul(y, x) ^ coefficient
+    return y
+
+
+def gf_poly_div(dividend: list, divisor: list) -> (list, list):
+    """Synthetic division; divisor must be monic. Returns (quotient, remainder)."""
+    output = list(dividend)
+    for i in range(len(dividend) - (len(divisor) - 1)):
+        coefficient = output[i]
+        if coefficient != 0:
+            for j in range(1, len(divisor)):
+                if divisor[j] != 0:
+                    output[i + j] ^= gf_mul(divisor[j], coefficient)
+    separator = -(len(divisor) - 1)
+    return output[:separator], output[separator:]
+
+
+_generator_cache = {}
+
+
+def generator_poly(nsym: int) -> list:
+    """The generator polynomial for nsym parity bytes (cached)."""
+    generator = _generator_cache.get(nsym)
+    if generator is None:
+        generator = [1]
+        for i in range(nsym):
+            generator = gf_poly_mul(generator, [1, gf_pow(2, i)])
+        _generator_cache[nsym] = generator
+    return generator
+
+
+def encode(data, nsym: int) -> bytes:
+    """
+    Computes the nsym parity bytes for data (len(data) + nsym <= 255).
+
+    Returns:
+        The parity bytes; the codeword is data + parity.
+    """
+    if len(data) + nsym > MAX_CODEWORD_SIZE:
+        raise ValueError(f"Codeword of {len(data) + nsym} bytes exceeds {MAX_CODEWORD_SIZE}")
+    generator = generator_poly(nsym)
+    remainder = [0] * nsym
+    # LFSR form of the polynomial division: only the remainder is kept.
+    for byte in data:
+        coefficient = byte ^ remainder[0]
+        remainder = remainder[1:] + [0]
+        if coefficient != 0:
+            for j in range(nsym):
+                remainder[j] ^= gf_mul(generator[j + 1], coefficient)
+    return bytes(remainder)
+
+
+def _syndromes(codeword: list, nsym: int) -> list:
+    # Leading 0 keeps the indexing of the tutorial's algorithms.
+    return [0] + [gf_poly_eval(codeword, gf_pow(2, i)) for i in range(nsym)]
+
+
+def _error_locator(syndromes: list, nsym: int) -> list:
+    """Berlekamp-Massey: finds the error locator polynomial."""
+    error_locator = [1]
+    old_locator = [1]
+    shift = len(syndromes) - nsym
+    for i in range(nsym):
+        k = i + shift
+        delta = syndromes[k]
+        for j in range(1, len(error_locator)):
+            delta ^= gf_mul(error_locator[-(j + 1)], syndromes[k - j])
+        old_locator = old_locator + [0]
+        if delta != 0:
+            if len(old_locator) > len(error_locator):
+                new_locator = gf_poly_scale(old_locator, delta)
+                old_locator = gf_poly_scale(error_locator, gf_inverse(delta))
+                error_locator = new_locator
+            error_locator = gf_poly_add(error_locator, gf_poly_scale(old_locator, delta))
+
+    while error_locator and error_locator[0] == 0:
+        del error_locator[0]
+    if (len(error_locator) - 1) * 2 > nsym:
+        raise ReedSolomonError("Too many errors to correct")
+    return error_locator
+
+
+def _error_positions(error_locator_reversed: list, length: int) -> list:
+    """Chien search: finds the roots of the error locator."""
+    error_count = len(error_locator_reversed) - 1
+    positions = []
+    for i in range(length):
+        if gf_poly_eval(error_locator_reversed, gf_pow(2, i)) == 0:
+            positions.append(length - 1 - i)
+    if len(positions) != error_count:
+        raise ReedSolomonError("Could not locate the errors")
+    return positions
+
+
+def _correct_errata(codeword: list, syndromes: list, positions: list) -> list:
+    """Forney algorithm: computes the error magnitudes and fixes them."""
+    coefficient_positions = [len(codeword) - 1 - p for p in positions]
+
+    locator = [1]
+    for position in coefficient_positions:
+        locator = gf_poly_mul(locator, gf_poly_add([1], [gf_pow(2, position), 0]))
+
+    _, evaluator = gf_poly_div(gf_poly_mul(syndromes[::-1], locator), [1] + [0] * len(locator))
+    evaluator = evaluator[::-1]
+
+    roots = [gf_pow(2, -(255 - position)) for position in coefficient_positions]
+
+    errors = [0] * len(codeword)
+    for i, root in enumerate(roots):
+        root_inverse = gf_inverse(root)
+        locator_prime = 1
+        for j, other in enumerate(roots):
+            if j != i:
+                locator_prime = gf_mul(locator_prime, 1 ^ gf_mul(root_inverse, other))
+        if locator_prime == 0:
+            raise ReedSolomonError("Could not compute error magnitude")
+        y = gf_mul(root, gf_poly_eval(evaluator[::-1], root_inverse))
+        errors[positions[i]] = gf_div(y, locator_prime)
+
+    return gf_poly_add(codeword, errors)
+
+
+def decode(codeword, nsym: int) -> (bytes, int):
+    """
+    Corrects a codeword (message + nsym parity bytes).
+
+    Returns:
+        (message, corrected): the corrected message without parity, and the
+        number of bytes that were corrected.
+
+    Raises:
+        ReedSolomonError if there are more than nsym // 2 errors.
+    """
+    if len(codeword) > MAX_CODEWORD_SIZE:
+        raise ValueError(f"Codeword of {len(codeword)} bytes exceeds {MAX_CODEWORD_SIZE}")
+    message = list(codeword)
+    syndromes = _syndromes(message, nsym)
+    if not any(syndromes):
+        return bytes(message[:len(message) - nsym]), 0
+
+    error_locator = _error_locator(syndromes, nsym)
+    positions = _error_positions(error_locator[::-1], len(message))
+    message = _correct_errata(message, syndromes, positions)
+
+    if any(_syndromes(message, nsym)):
+        raise ReedSolomonError("Could not correct message")
+    return bytes(message[:len(message) - nsym]), len(positions)
@@ -0,0 +1,248 @@
+"""
+Declarative message schema compiler.
+
+A schema lists every fixed-layout message once: its type ID and its fields,
+each with a wire type and optional scaling. compile_schema() turns it into
+Message objects whose encoders and decoders are generated Python source
+around one precompiled struct.Struct, so nothing is parsed or looked up per
+call and both ends of the link run exactly the same code.
+
+Schema format:
+    {
+        'version': 0,                       # 0-3, carried in the packet type byte
+        'messages': {
+            'motor': {'type': 1, 'fields': [
+                {'name': 'left', 'type': 'f32'},
+                {'name': 'right', 'type': 'f32'},
+            ]},
+            'controller': {'type': 4, 'fields': [
+                {'name': 'left_x', 'type': 'i8', 'scale': 127, 'min': -1.0, 'max': 1.0},
+                {'name': 'buttons', 'type': 'bits', 'bits': ['l1', 'r1']},
+            ]},
+        },
+    }
+
+Field keys:
+    type        f32, f64, i8, u8, i16, u16, i32, u32, i64, u64, or bits
+    scale       Integer types: the value is stored as round((value - offset) * scale)
+    offset      Subtracted before scaling (default 0)
+    min, max    The value is clamped to this range before it is stored
+    bits        For 'bits': names of the boolean flags, bit 0 first. They
+                appear as separate values (0/1) in the message.
+
+A compiled Message works like a struct.Struct on the values in field order
+(pack, pack_into, unpack, unpack_from, size), and also offers encode(dict) /
+decode(payload) -> dict and to_wire / from_wire for the raw stored integers.
+"""
+
+import struct
+
+MAX_VERSION = 3
+MAX_TYPE_ID = 31    # Type IDs use the low 5 bits of the type byte
+
+WIRE_FORMATS = {
+    'f32': 'f', 'f64': 'd',
+    'i8': 'b', 'u8': 'B',
+    'i16': 'h', 'u16': 'H',
+    'i32': 'i', 'u32': 'I',
+    'i64': 'q', 'u64': 'Q',
+}
+
+INTEGER_RANGES = {
+    'b': (-2 ** 7, 2 ** 7 - 1), 'B': (0, 2 ** 8 - 1),
+    'h': (-2 ** 15, 2 ** 15 - 1), 'H': (0, 2 ** 16 - 1),
+    'i': (-2 ** 31, 2 ** 31 - 1), 'I': (0, 2 ** 32 - 1),
+    'q': (-2 ** 63, 2 ** 63 - 1), 'Q': (0, 2 ** 64 - 1),
+}
+
+
+class SchemaError(ValueError):
+    """Raised for an invalid schema."""
+
+
+class Message:
+    """A compiled message layout; see the module docstring."""
+
+    def __init__(self, name: str, type_id: int, fields: list, names: tuple,
+                 wire_struct: struct.Struct, source: str):
+        self.name = name
+        self.type_id = type_id
+        self.fields = fields          # The field specs from the schema
+        self.names = names            # Value names in order (bits expanded)
+        self.struct = wire_struct     # Codec for the raw stored values
+        self.format = wire_struct.format
+        self.size = wire_struct.size
+        self.source = source          # Generated code, for inspection
+
+        namespace = {
+            '_pack': wire_struct.pack,
+            '_pack_into': wire_struct.pack_into,
+            '_unpack': wire_struct.unpack,
+            '_unpack_from': wire_struct.unpack_from,
+        }
+        exec(compile(source, f'<schema {name}>', 'exec'), namespace)
+        self.pack = namespace['pack']
+        self.pack_into = namespace['pack_into']
+        self.unpack = namespace['unpack']
+        self.unpack_from = namespace['unpack_from']
+        self.encode = namespace['encode']
+        self.decode = namespace['decode']
+        self.to_wire = namespace['to_wire']
+        self.from_wire = namespace['from_wire']
+
+        if not namespace['TRANSFORMED']:
+            # Values are stored as-is: use the Struct methods directly.
+            self.pack = wire_struct.pack
+            self.pack_into = wire_struct.pack_into
+            self.unpack = wire_struct.unpack
+            self.unpack_from = wire_struct.unpack_from
+
+    def __repr__(self):
+        return f"Message({self.name!r}, type_id={self.type_id}, format={self.format!r})"
+
+
+def _number(value) -> str:
+    return repr(float(value))
+
+
+def _field_code(field: dict, wire_code: str):
+    """
+    Returns (store, load): expression templates turning a value into the
+    stored integer/float and back. {} is replaced by the source expression.
+    """
+    scale = field.get('scale')
+    offset = field.get('offset', 0)
+    minimum = field.get('min')
+    maximum = field.get('max')
+
+    if wire_code in 'fd':
+        if scale is not None:
+            raise SchemaError(f"Field {field['name']!r}: scale needs an integer type")
+        store = '{}'
+        if maximum is not None:
+            store = f'min({_number(maximum)}, {store})'
+        if minimum is not None:
+            store = f'max({_number(minimum)}, {store})'
+        return store, '{}'
+
+    low, high = INTEGER_RANGES[wire_code]
+    if scale is None:
+        scale = 1
+    if minimum is not None:
+        low = max(low, round((minimum - offset) * scale))
+    if maximum is not None:
+        high = min(high, round((maximum - offset) * scale))
+
+    value = '{}'
+    if offset:
+        value = f'({value} - {_number(offset)})'
+    if scale != 1:
+        value = f'{value} * {_number(scale)}'
+    store = f'min({high}, max({low}, round({value})))'
+
+    load = '{}'
+    if scale != 1:
+        load = f'{load} / {_number(scale)}'
+    if offset:
+        load = f'{load} + {_number(offset)}'
+    return store, load
+
+
+def compile_message(name: str, spec: dict) -> Message:
+    """Compiles one message spec ({'type': id, 'fields': [...]})."""
+    type_id = spec['type']
+    if not 0 <= type_id <= MAX_TYPE_ID:
+        raise SchemaError(f"Message {name!r}: type {type_id} does not fit in 5 bits")
+
+    wire_format = '>'
+    names = []
+    stores = []        # Per wire value: expression template over the value names
+    loads = []         # Per value name: (wire index, expression template)
+    transformed = False
+
+    for field in spec['fields']:
+        field_type = field['type']
+        if field_type == 'bits':
+            flags = list(field['bits'])
+            width = 'B' if len(flags) <= 8 else 'H' if len(flags) <= 16 else 'I'
+            wire_index = len(stores)
+            wire_format += width
+            stores.append(' | '.join(f'({1 << bit} if {{{flag}}} else 0)'
+                                     for bit, flag in enumerate(flags)) or '0')
+            for bit, flag in enumerate(flags):
+                names.append(flag)
+                loads.append((wire_index, f'({{}} >> {bit}) & 1'))
+            transformed = True
+            continue
+
+        wire_code = WIRE_FORMATS.get(field_type)
+        if wire_code is None:
+            raise SchemaError(f"Field {field['name']!r}: unknown type {field_type!r}")
+        store, load = _field_code(field, wire_code)
+        transformed = transformed or store != '{}' or load != '{}'
+        wire_format += wire_code
+        stores.append(store.replace('{}', '{' + field['name'] + '}'))
+        names.append(field['name'])
+        loads.append((len(stores) - 1, load))
+
+    if len(set(names)) != len(names):
+        raise SchemaError(f"Message {name!r}: duplicate field names")
+
+    # Generated identifiers: v_<name> for values, w<i> for stored values.
+    def stored(by_value):
+        return [template.format(**{n: by_value(n) for n in names}) for template in stores]
+
+    def loaded():
+        return [template.format(f'w{index}') for index, template in loads]
+
+    params = ', '.join(f'v_{n}' for n in names)
+    wires = ', '.join(f'w{i}' for i in range(len(stores)))
+    positional = stored(lambda n: f'v_{n}')
+    by_key = stored(lambda n: f'm[{n!r}]')
+    values = loaded()
+    value_tuple = f"({', '.join(values)},)" if values else '()'
+    value_dict = '{' + ', '.join(f'{n!r}: {v}' for n, v in zip(names, values)) + '}'
+    unpacked = f'{wires}, = ' if stores else ''
+
+    lines = [
+        f'TRANSFORMED = {transformed}',
+        f'def pack({params}):',
+        f"    return _pack({', '.join(positional)})",
+        f'def pack_into(buf, offset{", " if names else ""}{params}):',
+        f"    _pack_into(buf, offset{', ' if stores else ''}{', '.join(positional)})",
+        'def unpack(buffer):',
+        f'    {unpacked}_unpack(buffer)',
+        f'    return {value_tuple}',
+        'def unpack_from(buffer, offset=0):',
+        f'    {unpacked}_unpack_from(buffer, offset)',
+        f'    return {value_tuple}',
+        'def encode(m):',
+        f"    return _pack({', '.join(by_key)})",
+        'def decode(buffer):',
+        f'    {unpacked}_unpack(buffer)',
+        f'    return {value_dict}',
+        'def to_wire(m):',
+        f"    return [{', '.join(by_key)}]",
+        'def from_wire(values):',
+        f'    {unpacked}values' if stores else '    pass',
+        f'    return {value_dict}',
+    ]
+    source = '\n'.join(lines) + '\n'
+    return Message(name, type_id, spec['fields'], tuple(names), struct.Struct(wire_format), source)
+
+
+def compile_schema(schema: dict) -> dict:
+    """
+    Compiles every message of a schema.
+
+    Returns:
+        {name: Message}. Raises SchemaError for invalid schemas.
+    """
+    version = schema.get('version', 0)
+    if not 0 <= version <= MAX_VERSION:
+        raise SchemaError(f"Schema version {version} does not fit in 2 bits")
+    messages = {name: compile_message(name, spec) for name, spec in schema['messages'].items()}
+    type_ids = [message.type_id for message in messages.values()]
+    if len(set(type_ids)) != len(type_ids):
+        raise SchemaError("Two messages share a type ID")
+    return messages
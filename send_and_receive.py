@@ -3,6 +3,8 @@ import time
 import threading
 import queue
 
+from serial_reader import SerialReader
+
 # --- Config ---
 PORT = "COM12"   # Make sure this matches your device
 BAUD = 57600
@@ -29,17 +31,15 @@ except Exception as e:
 # --- Message Receiving Loop ---
 # Continually checks for incoming data from the radio
 def recieve_loop():
+    # Blocks until data arrives instead of polling in_waiting every 10 ms
+    reader = SerialReader(ser)
     while True:
         try:
-            if ser.in_waiting > 0:
-                # Read and decode the incoming line
-                line = ser.readline().decode(errors='ignore').strip()
-                if line:
-                    print_queue.put(f"Received: {line}")
+            for line in reader.lines():
+                print_queue.put(f"Received: {line}")
         except Exception as e:
             print_queue.put(f"Read error: {e}")
-        
-        time.sleep(0.01) # Small sleep to save CPU power
+            time.sleep(1) # Back off so a lasting error (e.g. unplugged port) doesn't spin
 
 # --- Message Sending Loop ---
 # Waits for items to appear in the send_queue, then sends them
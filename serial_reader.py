@@ -0,0 +1,112 @@
+"""
+Event-driven serial reader shared by the receivers.
+
+Instead of polling ser.in_waiting and sleeping 10 ms between checks, the
+reader blocks in the kernel until bytes arrive (select() on the serial file
+descriptor) and returns everything available the moment it lands. On
+platforms where the port has no file descriptor (Windows), it falls back to a
+blocking read with a short timeout, which wakes up just as quickly when data
+arrives.
+
+Either way an idle link costs one wake-up per poll_interval instead of 100
+per second, and a command is handed to the decoder without the up-to-10 ms
+sleep in front of it.
+
+Usage:
+    reader = SerialReader(ser)
+    while True:
+        data = reader.read()        # b'' if nothing arrived within poll_interval
+        decoder.feed(data)
+"""
+
+import select
+import threading
+
+
+class SerialReader:
+    def __init__(self, ser, poll_interval=0.1):
+        """
+        Args:
+            ser: An open serial.Serial (or any object with read(), in_waiting
+                and optionally fileno()).
+            poll_interval: Longest time read() blocks before returning b'', so
+                callers can check for shutdown. It adds no latency to data.
+        """
+        self.ser = ser
+        self.poll_interval = poll_interval
+        self.running = False
+        self._thread = None
+
+        try:
+            self._fd = ser.fileno()
+        except (AttributeError, OSError, ValueError):
+            self._fd = None
+
+        if self._fd is None:
+            # No fd to select() on: let the driver block for us instead.
+            self.ser.timeout = poll_interval
+
+        # Statistics
+        self.wakeups = 0     # read() calls that returned data
+        self.bytes_read = 0
+
+    def read(self) -> bytes:
+        """
+        Blocks until data arrives (or poll_interval expires) and returns all
+        bytes that are available. Returns b'' on timeout.
+        """
+        if self._fd is not None:
+            ready, _, _ = select.select([self._fd], [], [], self.poll_interval)
+            if not ready:
+                return b''
+            data = self.ser.read(self.ser.in_waiting or 1)
+        else:
+            data = self.ser.read(1)
+            if data:
+                waiting = self.ser.in_waiting
+                if waiting:
+                    data += self.ser.read(waiting)
+
+        if data:
+            self.wakeups += 1
+            self.bytes_read += len(data)
+        return data
+
+    def run(self, on_data) -> None:
+        """Calls on_data(bytes) for every chunk received until stop() is called."""
+        self.running = True
+        while self.running:
+            data = self.read()
+            if data:
+                on_data(data)
+
+    def start(self, on_data) -> threading.Thread:
+        """Runs run(on_data) in a background daemon thread."""
+        self._thread = threading.Thread(target=self.run, args=(on_data,), daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self) -> None:
+        """Stops run() after its current read() returns (within poll_interval)."""
+        self.running = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+            self._thread = None
+
+    def lines(self, encoding='utf-8'):
+        """
+        Yields every complete, stripped, non-empty text line as soon as it
+        arrives. Used by the line-based (CSV/text) receivers.
+        """
+        self.running = True
+        pending = b''
+        while self.running:
+            data = self.read()
+            if not data:
+                continue
+            pending += data
+            *complete, pending = pending.split(b'\n')
+            for raw_line in complete:
+                line = raw_line.decode(encoding, errors='ignore').strip()
+                if line:
+                    yield line
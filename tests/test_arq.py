@@ -0,0 +1,127 @@
+"""Selective-repeat ARQ: recovery from loss and giving up on a message."""
+
+import collections
+import random
+import time
+
+import arq
+import protocol
+from arq import ReliableReceiver, ReliableSender
+
+
+class LossyPair:
+    """A ReliableSender and ReliableReceiver joined by queues that can drop frames."""
+
+    def __init__(self, drop=None, **sender_options):
+        self.drop = drop or (lambda direction, packet_type, sequence, payload: False)
+        self.to_receiver = collections.deque()
+        self.to_sender = collections.deque()
+        self.sender = ReliableSender(self._sender_frame, **sender_options)
+        self.receiver = ReliableReceiver(self._receiver_frame)
+        self.delivered = []
+
+    def _sender_frame(self, packet_type, sequence, payload):
+        if not self.drop('up', packet_type, sequence, bytes(payload)):
+            self.to_receiver.append({'type': packet_type, 'seq': sequence, 'payload': bytes(payload)})
+
+    def _receiver_frame(self, packet_type, sequence, payload):
+        if not self.drop('down', packet_type, sequence, bytes(payload)):
+            self.to_sender.append((packet_type, bytes(payload)))
+
+    def run(self, count, timeout=5.0):
+        """Sends count text messages and runs both ends until all are through or timeout."""
+        for i in range(count):
+            self.sender.send(protocol.TYPE_TEXT, b'message %d' % i)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            while self.to_receiver:
+                self.delivered += self.receiver.on_packet(self.to_receiver.popleft())
+            while self.to_sender:
+                packet_type, payload = self.to_sender.popleft()
+                if packet_type == protocol.TYPE_ACK:
+                    self.sender.on_ack(payload)
+                elif packet_type == protocol.TYPE_NACK:
+                    self.sender.on_nack(payload)
+            if not self.sender.pending() and not self.to_receiver and not self.to_sender:
+                return
+            self.sender.poll()
+            time.sleep(0.001)
+
+
+FAST_TIMERS = {'initial_rto': 0.01, 'min_rto': 0.005, 'max_rto': 0.05}
+
+
+def test_every_message_delivered_once_in_order_despite_loss():
+    rng = random.Random(3)
+    pair = LossyPair(lambda *frame: rng.random() < 0.2, max_retries=50, **FAST_TIMERS)
+    pair.run(80)
+
+    assert [bytes(message['payload']) for message in pair.delivered] == \
+        [b'message %d' % i for i in range(80)]
+    assert pair.sender.failed == 0
+    assert pair.sender.retransmissions > 0
+
+
+def test_receiver_skips_a_message_the_sender_gave_up_on():
+    def lose_first_message(direction, packet_type, sequence, payload):
+        return direction == 'up' and sequence == 0 and payload[0] == protocol.TYPE_TEXT
+
+    pair = LossyPair(lose_first_message, max_retries=2, **FAST_TIMERS)
+    pair.run(80)
+
+    assert [bytes(message['payload']) for message in pair.delivered] == \
+        [b'message %d' % i for i in range(1, 80)]
+    assert pair.sender.failed == 1
+    assert pair.receiver.skipped == 1
+    assert pair.sender.pending() == 0
+    assert not pair.receiver.buffered
+
+
+def test_placeholder_is_retransmitted_until_acknowledged():
+    # Everything the receiver sends back is lost for a while, so the
+    # placeholder itself must survive several timeouts.
+    start = time.monotonic()
+
+    def lose_acks_at_first(direction, packet_type, sequence, payload):
+        if direction == 'up':
+            return sequence == 0 and payload[0] == protocol.TYPE_TEXT
+        return time.monotonic() - start < 0.3
+
+    pair = LossyPair(lose_acks_at_first, max_retries=1, **FAST_TIMERS)
+    pair.run(5)
+
+    assert [bytes(message['payload']) for message in pair.delivered] == \
+        [b'message %d' % i for i in range(1, 5)]
+    assert pair.receiver.skipped == 1     # Only the message that never arrived
+    assert pair.sender.pending() == 0
+
+
+def test_backoff_never_exceeds_max_rto():
+    sent = []
+    sender = ReliableSender(lambda *frame: sent.append(time.monotonic()), initial_rto=0.01,
+                            min_rto=0.01, max_rto=0.04, max_retries=20)
+    sender.send(protocol.TYPE_TEXT, b'never acknowledged')
+    deadline = time.monotonic() + 0.6
+    while time.monotonic() < deadline:
+        sender.poll()
+        time.sleep(0.002)
+
+    gaps = [later - earlier for earlier, later in zip(sent, sent[1:])]
+    assert len(sent) >= 10             # Uncapped, retry 6 alone would wait 0.64 s
+    assert max(gaps) < 0.04 + 0.02
+
+
+def test_backoff_survives_a_long_outage():
+    # A placeholder is retried for as long as the link is down; thousands of
+    # retries must not overflow the backoff.
+    sent = []
+    sender = ReliableSender(lambda *frame: sent.append(frame), initial_rto=0.01,
+                            min_rto=0.01, max_rto=0.02, max_retries=2)
+    sender.send(protocol.TYPE_TEXT, b'never acknowledged')
+    for entry in sender.in_flight.values():
+        entry[2] = 5000
+    time.sleep(0.03)
+    sender.poll()
+
+    assert len(sent) == 2
+    assert sent[-1][2] == arq.SKIPPED_PAYLOAD
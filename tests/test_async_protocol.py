@@ -0,0 +1,68 @@
+"""asyncio transport: packets round-trip over a socketpair in order."""
+
+import asyncio
+import socket
+
+import protocol
+from async_protocol import AsyncDispatcher, PacketProtocol, open_socket_connection
+
+MESSAGES = [(protocol.TYPE_TEXT, b'text %d' % i) if i % 3 else (protocol.TYPE_SENSOR, bytes([i % 256]) * 200)
+            for i in range(300)]
+
+
+def test_packets_arrive_in_order_through_the_dispatcher():
+    async def main():
+        laptop, rover = socket.socketpair()
+        _, writer = await open_socket_connection(laptop, high_water=256)
+        reader, rover_writer = await open_socket_connection(rover)
+
+        received = []
+        dispatcher = AsyncDispatcher()
+
+        @dispatcher.handler(protocol.TYPE_TEXT)
+        def on_text(packet):
+            received.append((packet['type'], packet['seq'], bytes(packet['payload'])))
+
+        @dispatcher.handler(protocol.TYPE_SENSOR)
+        async def on_sensor(packet):
+            received.append((packet['type'], packet['seq'], bytes(packet['payload'])))
+            await asyncio.sleep(0)
+
+        async def send_all():
+            for packet_type, payload in MESSAGES:
+                await writer.send(packet_type, payload)
+            await writer.close()
+
+        await asyncio.gather(send_all(), dispatcher.run(reader))
+        await rover_writer.close()
+        return received
+
+    received = asyncio.run(asyncio.wait_for(main(), timeout=10))
+
+    assert received == [(packet_type, sequence, payload)
+                        for sequence, (packet_type, payload) in enumerate(MESSAGES)]
+
+
+def test_packet_protocol_decodes_split_writes():
+    async def main():
+        laptop, rover = socket.socketpair()
+        loop = asyncio.get_running_loop()
+        received = []
+        closed = loop.create_future()
+        transport, _ = await loop.create_connection(
+            lambda: PacketProtocol(lambda packet: received.append((packet['seq'], bytes(packet['payload']))),
+                                   lambda exc: closed.set_result(exc)),
+            sock=rover)
+
+        stream = b''.join(protocol.pack(protocol.TYPE_TEXT, i, b'message %d' % i) for i in range(50))
+        laptop.setblocking(False)
+        for start in range(0, len(stream), 7):
+            await loop.sock_sendall(laptop, stream[start:start + 7])
+        laptop.close()
+        await closed
+        transport.close()
+        return received
+
+    received = asyncio.run(asyncio.wait_for(main(), timeout=10))
+
+    assert received == [(i, b'message %d' % i) for i in range(50)]
@@ -0,0 +1,29 @@
+"""Link metrics: throughput rates and the Prometheus export."""
+
+import metrics
+from metrics import LinkMetrics, RATE_WINDOW
+
+
+def test_rates_fall_to_zero_when_the_link_goes_idle():
+    direction = metrics._Direction()
+    for second in range(10):
+        direction.raw_bytes += 1000
+        direction.total_payload += 800
+        direction.add_sample(100.0 + second)
+
+    assert direction.rates(109.0) == (1000.0, 800.0)
+    # Only the last three samples are still in the window
+    assert direction.rates(109.0 + RATE_WINDOW / 2) == (600.0, 480.0)
+    assert direction.rates(109.0 + RATE_WINDOW) == (0.0, 0.0)
+
+
+def test_prometheus_histograms_have_sum_and_count():
+    link = LinkMetrics(burst_spacing=2)
+    for sequence in (0, 3, 4, 5, 6, 10, 11, 12):
+        link.record_rx(1, sequence, 8)
+    text = link.to_prometheus()
+
+    assert 'rfd_link_sequence_gap_sum 5\n' in text
+    assert 'rfd_link_sequence_gap_count 2\n' in text
+    assert 'rfd_link_burst_loss_sum 5\n' in text
+    assert 'rfd_link_burst_loss_count 2\n' in text
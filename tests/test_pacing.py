@@ -0,0 +1,80 @@
+"""Pacing in the sender: waiting for the link holds no lock, and pacing gets its round trips."""
+
+import threading
+import time
+
+import packet_log
+import protocol
+from laptop_protocol_sender import PACING_PING_INTERVAL, ProtocolSender
+from link_emulator import LinkEmulator
+
+
+def make_sender(emulator, **options):
+    return ProtocolSender(emulator.laptop, log_level=packet_log.ERROR, **options)
+
+
+def test_ping_is_not_stuck_behind_a_frame_waiting_for_the_pacer():
+    emulator = LinkEmulator(seed=1)
+    emulator.start()
+    try:
+        sender = make_sender(emulator, pace=True)
+        # Half a second of debt: the next paced frame has to wait that long
+        sender.pacer.tokens = -0.5 * sender.pacer.rate
+
+        start = time.monotonic()
+        motor = threading.Thread(target=sender.send_values, args=(protocol.TYPE_MOTOR, 0.5, 0.5))
+        motor.start()
+        time.sleep(0.05)
+        assert motor.is_alive()
+
+        sender._send_stamped_ping()
+        ping_sent = time.monotonic() - start
+        motor.join()
+        motor_sent = time.monotonic() - start
+        sender.close()
+    finally:
+        emulator.stop()
+
+    assert ping_sent < 0.25
+    assert motor_sent >= 0.4
+    assert sender.sequence_number == 2
+
+
+def test_pacing_turns_on_pings():
+    emulator = LinkEmulator(seed=1)
+    emulator.start()
+    try:
+        paced = make_sender(emulator, pace=True)
+        unpaced = make_sender(emulator)
+        explicit = make_sender(emulator, pace=True, ping_interval=0.2)
+        for sender in (paced, unpaced, explicit):
+            sender.close()
+    finally:
+        emulator.stop()
+
+    assert paced.ping_interval == PACING_PING_INTERVAL and paced.ping_thread is not None
+    assert unpaced.ping_thread is None
+    assert explicit.ping_interval == 0.2
+
+
+def test_coalesced_frames_wait_for_the_pacer_without_blocking_senders():
+    emulator = LinkEmulator(seed=1)
+    emulator.start()
+    try:
+        sender = make_sender(emulator, pace=True, coalesce_window=0.005)
+        sender.pacer.tokens = -0.5 * sender.pacer.rate
+
+        start = time.monotonic()
+        sender.send_values(protocol.TYPE_MOTOR, 0.5, 0.5)
+        time.sleep(0.05)          # The window expires; the container waits for the pacer
+        sender.send_values(protocol.TYPE_MOTOR, 0.2, 0.2)
+        sender._send_stamped_ping()
+        calls_done = time.monotonic() - start
+        sender.close()
+        all_sent = time.monotonic() - start
+    finally:
+        emulator.stop()
+
+    assert calls_done < 0.25
+    assert all_sent >= 0.4
+    assert sender.sequence_number == 3
@@ -0,0 +1,98 @@
+"""Sequence numbers: in order when several threads send at once, and gap counting of the replies."""
+
+import threading
+import time
+
+import pytest
+
+import packet_log
+import protocol
+from coalesce import split_container
+from laptop_protocol_sender import ProtocolSender
+from link_emulator import LinkEmulator
+from metrics import LinkMetrics
+from serial_reader import SerialReader
+
+
+def collect(emulator, stop, result):
+    """Reads the rover end until stop is set, keeping every sequence number in order."""
+    reader = SerialReader(emulator.rover, poll_interval=0.05)
+    decoder = protocol.StreamDecoder()
+    metrics = result['metrics'] = LinkMetrics()
+    sequences = result['sequences'] = []
+    while True:
+        data = reader.read()
+        if not data and stop.is_set():
+            return
+        decoder.feed(data)
+        for packet in decoder:
+            packets = split_container(packet) if packet['type'] == protocol.TYPE_CONTAINER else [packet]
+            for message in packets:
+                sequences.append(message['seq'])
+                metrics.record_rx(message['type'], message['seq'], len(message['payload']))
+
+
+@pytest.mark.parametrize('coalesce_window, pace', [(None, False), (0.005, False), (None, True), (0.005, True)])
+def test_sequence_numbers_in_order_with_pings_and_senders(coalesce_window, pace):
+    emulator = LinkEmulator(seed=1)
+    emulator.start()
+    stop = threading.Event()
+    result = {}
+    collector = threading.Thread(target=collect, args=(emulator, stop, result), daemon=True)
+    collector.start()
+    try:
+        sender = ProtocolSender(emulator.laptop, coalesce_window=coalesce_window, pace=pace,
+                                ping_interval=0.01, log_level=packet_log.ERROR)
+        run_senders(sender)
+        sender.close()
+        time.sleep(0.5)          # Let the link drain
+    finally:
+        stop.set()
+        collector.join()
+        emulator.stop()
+
+    sequences = result['sequences']
+    assert len(sequences) == sender.sequence_number
+    assert sequences == list(range(len(sequences)))
+    assert result['metrics'].lost == 0
+
+
+def run_senders(sender):
+    """Motor commands and text from two threads, with the ping thread running too."""
+
+    def send_motor():
+        for i in range(40):
+            sender.send_values(protocol.TYPE_MOTOR, i / 40, -i / 40)
+            time.sleep(0.003)
+
+    def send_text():
+        for i in range(40):
+            sender.send_text_message(f"message {i}")
+            time.sleep(0.003)
+
+    threads = [threading.Thread(target=send_motor), threading.Thread(target=send_text)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_replies_from_the_rover_are_not_counted_as_lost():
+    # ACK seqs are the receiver's next expected message and pongs have a
+    # counter of their own; neither may show up as gaps on the laptop.
+    emulator = LinkEmulator(seed=1)
+    emulator.start()
+    try:
+        sender = ProtocolSender(emulator.laptop, log_level=packet_log.ERROR)
+        for packet_type, sequence in ((protocol.TYPE_ACK, 7), (protocol.TYPE_PONG, 0),
+                                      (protocol.TYPE_ACK, 30), (protocol.TYPE_PONG, 1)):
+            emulator.rover.write(protocol.pack(packet_type, sequence, bytes(6)))
+        deadline = time.monotonic() + 2.0
+        while sum(sender.metrics.rx.packets.values()) < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        sender.close()
+    finally:
+        emulator.stop()
+
+    assert sum(sender.metrics.rx.packets.values()) == 4
+    assert sender.metrics.lost == 0
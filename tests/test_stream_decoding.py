@@ -0,0 +1,38 @@
+"""Decoding a byte stream: a false Start of Frame in noise must not cost real frames."""
+
+import protocol
+
+FRAMES = [protocol.pack(protocol.TYPE_TEXT, sequence, b'frame %d' % sequence) for sequence in range(3)]
+
+# A false SOF whose header claims a 200-byte payload: the would-be frame
+# covers every real frame behind it, and the padding completes it.
+FALSE_SOF = protocol.START_OF_FRAME + protocol.HEADER_STRUCT.pack(protocol.TYPE_TEXT, 99, 200)
+STREAM = b'noise' + FALSE_SOF + b''.join(FRAMES) + bytes(200)
+
+
+def expected():
+    return [(sequence, b'frame %d' % sequence) for sequence in range(3)]
+
+
+def test_stream_decoder_recovers_frames_behind_a_false_sof():
+    decoder = protocol.StreamDecoder()
+    decoder.feed(STREAM)
+
+    assert [(packet['seq'], bytes(packet['payload'])) for packet in decoder.drain()] == expected()
+    assert decoder.error_count == 1
+    # The noise, the false SOF's bytes and the padding; none of the real frames
+    assert decoder.bytes_skipped == len(b'noise') + len(FALSE_SOF) + 200
+
+
+def test_iter_packets_recovers_frames_behind_a_false_sof():
+    packets = protocol.iter_packets(STREAM)
+
+    assert [(packet['seq'], bytes(packet['payload'])) for packet in packets] == expected()
+
+
+def test_unpack_all_recovers_frames_behind_a_false_sof():
+    packets, consumed, errors = protocol.unpack_all(STREAM)
+
+    assert [(packet['seq'], bytes(packet['payload'])) for packet in packets] == expected()
+    assert [(error['offset'], error['length']) for error in errors] == [(5, protocol.MIN_PACKET_SIZE + 200)]
+    assert consumed == len(STREAM)
@@ -0,0 +1,239 @@
+"""
+Priority-scheduled transmit queue.
+
+At 57600 baud a 255-byte text message occupies the radio for ~45 ms, and a
+burst of telemetry for much longer, so a plain FIFO can hold a stop command
+back by hundreds of milliseconds. The TxScheduler keeps one queue per
+priority class and always transmits from the most urgent class first:
+
+    CONTROL     motor / controller commands and keyframe requests
+    TELEMETRY   sensor data and pings
+    BULK        text messages and everything else
+
+Per-class rate limits (messages per second) keep e.g. telemetry from
+starving bulk traffic entirely, and absolute control frames are superseded:
+a newer motor command or controller keyframe replaces the queued older one
+instead of queuing behind it. Controller deltas are never superseded, since
+replacing one would lose the fields only it carried; they queue in order,
+and a newer keyframe (which holds the full state) drops the ones before it.
+
+Sequence numbers are assigned by the transmit callback when a frame actually
+goes out, so superseded or dropped frames never show up as gaps.
+
+Usage:
+    scheduler = TxScheduler(transmit)        # transmit(packet_type, payload)
+    scheduler.start()
+    scheduler.submit(protocol.TYPE_MOTOR, payload)
+"""
+
+import collections
+import itertools
+import threading
+import time
+
+import protocol
+
+# Priority classes, lower is more urgent.
+CONTROL = 0
+TELEMETRY = 1
+BULK = 2
+PRIORITY_NAMES = {CONTROL: 'control', TELEMETRY: 'telemetry', BULK: 'bulk'}
+
+# Default class for each packet type; unlisted types are BULK.
+DEFAULT_PRIORITIES = {
+    protocol.TYPE_MOTOR: CONTROL,
+    protocol.TYPE_CONTROLLER: CONTROL,
+    protocol.TYPE_CONTROLLER_DELTA: CONTROL,
+    protocol.TYPE_KEYFRAME_REQUEST: CONTROL,
+    protocol.TYPE_PING: TELEMETRY,
+    protocol.TYPE_SENSOR: TELEMETRY,
+    protocol.TYPE_TEXT: BULK,
+}
+
+# Delta type -> the absolute type it is relative to. Deltas are queued in
+# order, and a newer absolute message drops the deltas queued before it.
+DEFAULT_DELTA_TYPES = {
+    protocol.TYPE_CONTROLLER_DELTA: protocol.TYPE_CONTROLLER,
+}
+
+
+class TxScheduler:
+    def __init__(self, transmit, rate_limits=None, max_queued=None, priorities=None,
+                 delta_types=None):
+        """
+        Args:
+            transmit: Called as transmit(packet_type, payload) from the
+                scheduler thread to send one message.
+            rate_limits: Optional {priority: messages per second}.
+            max_queued: Optional {priority: queue length}; the oldest message
+                is dropped when a full class receives a new one.
+                Defaults to 64 for TELEMETRY.
+            priorities: Overrides for the packet type -> class mapping.
+            delta_types: Overrides for the delta type -> absolute type
+                mapping (see DEFAULT_DELTA_TYPES).
+        """
+        self.transmit = transmit
+        self.rate_limits = dict(rate_limits or {})
+        self.max_queued = {TELEMETRY: 64}
+        self.max_queued.update(max_queued or {})
+        self.priorities = dict(DEFAULT_PRIORITIES)
+        self.priorities.update(priorities or {})
+        self.delta_types = dict(DEFAULT_DELTA_TYPES)
+        self.delta_types.update(delta_types or {})
+        self._delta_keys = itertools.count()
+
+        # CONTROL is keyed by supersede key so a newer frame replaces an older
+        # one in place (deltas get unique keys); the other classes are plain FIFOs.
+        self.queues = {
+            CONTROL: collections.OrderedDict(),
+            TELEMETRY: collections.deque(),
+            BULK: collections.deque(),
+        }
+        self.next_allowed = {priority: 0.0 for priority in self.queues}
+
+        self._condition = threading.Condition()
+        self._thread = None
+        self.running = False
+
+        # Statistics, per class
+        self.sent = {priority: 0 for priority in self.queues}
+        self.superseded = {priority: 0 for priority in self.queues}
+        self.dropped = {priority: 0 for priority in self.queues}
+
+    def submit(self, packet_type: int, payload, priority: int = None, supersede_key=None) -> None:
+        """
+        Queues a message for transmission.
+
+        Args:
+            priority: Class to queue in; defaults to the packet type's class.
+            supersede_key: For CONTROL messages, a queued message with the same
+                key is replaced. Defaults to the packet type. Ignored for
+                delta types, which are never replaced.
+        """
+        if priority is None:
+            priority = self.priorities.get(packet_type, BULK)
+        message = (packet_type, bytes(payload))
+
+        with self._condition:
+            queue = self.queues[priority]
+            if priority == CONTROL:
+                if packet_type in self.delta_types:
+                    queue[('delta', next(self._delta_keys))] = message
+                    self._condition.notify()
+                    return
+                # Deltas queued before this absolute message are included in it
+                stale = [key for key, (queued_type, _) in queue.items()
+                         if self.delta_types.get(queued_type) == packet_type]
+                for key in stale:
+                    del queue[key]
+                self.superseded[priority] += len(stale)
+
+                key = packet_type if supersede_key is None else supersede_key
+                if key in queue:
+                    self.superseded[priority] += 1
+                queue[key] = message
+            else:
+                limit = self.max_queued.get(priority)
+                if limit is not None and len(queue) >= limit:
+                    queue.popleft()
+                    self.dropped[priority] += 1
+                queue.append(message)
+            self._condition.notify()
+
+    def pending(self) -> int:
+        """Number of messages waiting in all classes."""
+        with self._condition:
+            return sum(len(queue) for queue in self.queues.values())
+
+    def wait_for_room(self, priority: int, limit: int, timeout: float = None) -> bool:
+        """
+        Blocks until fewer than limit messages are queued in a class, so a
+        producer (e.g. a fragmented upload) doesn't queue more than it must.
+        Returns False on timeout.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self.queues[priority]) < limit, timeout)
+
+    def _next_message(self, now: float):
+        """
+        Picks the most urgent message allowed by the rate limits.
+
+        Returns:
+            (message, wait): message is None if nothing may be sent yet, and
+            wait is then how long until something might be (None = idle).
+        """
+        wait = None
+        for priority in (CONTROL, TELEMETRY, BULK):
+            queue = self.queues[priority]
+            if not queue:
+                continue
+            allowed_at = self.next_allowed[priority]
+            if allowed_at > now:
+                remaining = allowed_at - now
+                wait = remaining if wait is None else min(wait, remaining)
+                continue
+
+            if priority == CONTROL:
+                _, message = queue.popitem(last=False)
+            else:
+                message = queue.popleft()
+
+            rate = self.rate_limits.get(priority)
+            if rate:
+                self.next_allowed[priority] = now + 1.0 / rate
+            self.sent[priority] += 1
+            return message, None
+        return None, wait
+
+    def run_once(self, timeout: float = None) -> bool:
+        """
+        Sends at most one message, waiting up to timeout for one to become
+        available. Returns True if a message was sent.
+        """
+        with self._condition:
+            message, wait = self._next_message(time.monotonic())
+            if message is None:
+                if timeout is not None:
+                    wait = timeout if wait is None else min(wait, timeout)
+                self._condition.wait(wait)
+                message, _ = self._next_message(time.monotonic())
+            if message is not None:
+                # Wake producers blocked in wait_for_room()
+                self._condition.notify_all()
+        if message is None:
+            return False
+        self.transmit(*message)
+        return True
+
+    def flush(self) -> None:
+        """Sends everything queued right now, ignoring rate limits."""
+        with self._condition:
+            messages = list(self.queues[CONTROL].values())
+            self.queues[CONTROL].clear()
+            self.sent[CONTROL] += len(messages)
+            for priority in (TELEMETRY, BULK):
+                messages.extend(self.queues[priority])
+                self.sent[priority] += len(self.queues[priority])
+                self.queues[priority].clear()
+        for message in messages:
+            self.transmit(*message)
+
+    def start(self) -> None:
+        """Starts the background transmit thread."""
+        self.running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the transmit thread, then sends whatever is still queued."""
+        with self._condition:
+            self.running = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self) -> None:
+        while self.running:
+            self.run_once(timeout=0.5)